@@ -0,0 +1,71 @@
+# Imports a Roam export into an Anki collection without the Anki GUI, e.g.
+# python -m anki_roam_import collection.anki2 roam.zip other.zip --config config.json
+import argparse
+import json
+import os.path
+import sys
+from typing import List, Optional
+
+from .anki import (
+    AnkiCollection, FileAddonData, is_anki_package_installed, open_collection,
+)
+from .importer import AnkiNoteImporter
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m anki_roam_import',
+        description='Import cloze notes from Roam exports into an Anki '
+                    'collection, and print a JSON report.',
+    )
+    parser.add_argument('collection', help='Anki collection (.anki2) file')
+    parser.add_argument(
+        'roam_exports', nargs='+', help='Roam JSON exports (.zip or .json)')
+    parser.add_argument(
+        '--config',
+        help='JSON configuration file, with the fields described in '
+             'config.md, overriding the default configuration')
+    parser.add_argument(
+        '--user-files',
+        help='directory in which to record imported notes, defaults to an '
+             'anki_roam_import directory next to the collection')
+    parser.add_argument('--report', help='also write the JSON report here')
+    args = parser.parse_args(args)
+
+    if not is_anki_package_installed():
+        parser.error('the anki package is needed to open the collection')
+
+    user_files_directory = args.user_files
+    if user_files_directory is None:
+        user_files_directory = default_user_files_directory(args.collection)
+
+    addon_data = FileAddonData(args.config, user_files_directory)
+    collection = open_collection(args.collection)
+
+    try:
+        importer = AnkiNoteImporter(addon_data, AnkiCollection(collection))
+        report = importer.import_from_paths(args.roam_exports)
+    finally:
+        collection.close()
+
+    report_json = report.to_json()
+    report_json['info'] = str(report)
+    report_text = json.dumps(report_json, indent=2)
+
+    print(report_text)
+
+    if args.report:
+        with open(args.report, mode='w', encoding='utf-8') as file:
+            file.write(report_text)
+
+    return 0
+
+
+def default_user_files_directory(collection_path: str) -> str:
+    # added notes are recorded for each collection
+    collection_directory = os.path.dirname(os.path.abspath(collection_path))
+    return os.path.join(collection_directory, 'anki_roam_import')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
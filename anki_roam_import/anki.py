@@ -1,7 +1,9 @@
+import json
 import os
-from copy import deepcopy
-from dataclasses import dataclass
-from typing import Iterable, Optional
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from .model import JsonData, AnkiNote
 
@@ -20,22 +22,47 @@ if is_anki_package_installed():
     from anki.models import NoteType
     from anki.notes import Note
     from anki.utils import splitFields
-    from aqt.main import AnkiQt
+
+    try:
+        from aqt.main import AnkiQt
+    except ImportError:
+        # running without the GUI, e.g. from the command line
+        AnkiQt = Any
+
+    try:
+        from anki.collection import AddNoteRequest
+    except ImportError:
+        # older Anki versions can only add notes one at a time
+        AddNoteRequest = None
 else:
     # allow running tests without anki package installed
-    from typing import Any, Dict
-
     _Collection = Any
     NoteType = Dict[str, Any]
     AnkiQt = Any
 
+    AddNoteRequest = None
+
     class Note:
         def __init__(self, collection, model):
-            self.fields = []
+            self.id = 0
+            self.fields = [''] * len(model.get('flds', []))
+            self.tags = []
 
     # noinspection PyPep8Naming
     def splitFields(fields):
-        return []
+        return fields.split('\x1f')
+
+
+NOTES_PER_BATCH = 500
+NOTES_PER_QUERY = 1000
+NOTE_IDS_PER_QUERY = 500
+MIN_NOTE_ID = -2 ** 63
+
+# fields are separated by the 0x1f character
+FIRST_FIELD_COLUMN = (
+    "case when instr(flds, char(31)) > 0 "
+    "then substr(flds, 1, instr(flds, char(31)) - 1) "
+    "else flds end")
 
 
 @dataclass
@@ -44,23 +71,193 @@ class AnkiModelNotes:
     model: NoteType
     content_field_index: int
     source_field_index: Optional[int]
+    deck_ids: Dict[Optional[str], int] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # the deck of notes which aren't routed to a deck of their own
+        self.default_deck_id = self.model.get('did')
+
+    def add_notes(
+        self, anki_notes: Iterable[AnkiNote], batch_size: int = NOTES_PER_BATCH,
+    ) -> 'AddedNotes':
+        added_notes = AddedNotes()
+        anki_notes = iter(anki_notes)
+
+        while batch := list(islice(anki_notes, batch_size)):
+            start_time = time.perf_counter()
+            notes = [self._note(anki_note) for anki_note in batch]
+            self._add_note_batch(
+                notes, [anki_note.deck_name for anki_note in batch])
+            seconds = time.perf_counter() - start_time
+            added_notes.note_ids.extend(note.id for note in notes)
+            added_notes.batch_timings.append(BatchTiming(len(batch), seconds))
+
+        return added_notes
+
+    def _add_note_batch(
+        self, notes: List[Note], deck_names: List[Optional[str]],
+    ) -> None:
+        if AddNoteRequest is None:
+            # notes are committed together when the collection is next saved
+            for note, deck_name in zip(notes, deck_names):
+                if deck_name is not None or self.deck_ids:
+                    # older Anki versions put new cards in the model's deck
+                    self.model['did'] = self._deck_id(deck_name)
+                self.collection.addNote(note)
+        else:
+            self.collection.add_notes([
+                AddNoteRequest(note, self._deck_id(deck_name))
+                for note, deck_name in zip(notes, deck_names)
+            ])
 
-    def add_note(self, anki_note: AnkiNote) -> None:
-        note = self._note(anki_note)
-        self.collection.addNote(note)
+    def _deck_id(self, deck_name: Optional[str]) -> int:
+        # each deck is looked up once, rather than once per note
+        try:
+            return self.deck_ids[deck_name]
+        except KeyError:
+            if deck_name is None:
+                deck_id = (
+                    self.default_deck_id or self.collection.decks.selected())
+            else:
+                deck_id = self.collection.decks.id(deck_name, create=True)
+            self.deck_ids[deck_name] = deck_id
+            return deck_id
 
     def _note(self, anki_note: AnkiNote) -> Note:
         note = Note(self.collection, self.model)
+        self._set_fields(note, anki_note)
+        return note
+
+    def _set_fields(self, note: Note, anki_note: AnkiNote) -> None:
         note.fields[self.content_field_index] = anki_note.content
         if self.source_field_index is not None:
-            note.fields[self.source_field_index] = anki_note.source
-        return note
+            note.fields[self.source_field_index] = str(anki_note.source)
+        # tags added in Anki are kept when a note is updated
+        for tag in anki_note.tags:
+            if tag not in note.tags:
+                note.tags.append(tag)
+
+    def update_notes(self, updates: List[Tuple[int, AnkiNote]]) -> List[int]:
+        # Returns the ids of the notes which were updated. Notes which have
+        # been deleted, or changed to another model, are not updated.
+        existing_note_ids = set(self.existing_note_ids(
+            [note_id for note_id, _ in updates]))
+        updated_note_ids = []
+
+        for note_id, anki_note in updates:
+            if note_id not in existing_note_ids:
+                continue
+
+            if AddNoteRequest is None:
+                note = self.collection.getNote(note_id)
+                self._set_fields(note, anki_note)
+                note.flush()
+            else:
+                note = self.collection.get_note(note_id)
+                self._set_fields(note, anki_note)
+                self.collection.update_note(note)
+
+            updated_note_ids.append(note_id)
+
+        return updated_note_ids
+
+    def tag_notes(self, note_ids: List[int], tag: str) -> None:
+        if AddNoteRequest is None:
+            self.collection.tags.bulkAdd(note_ids, tag)
+        else:
+            self.collection.tags.bulk_add(note_ids, tag)
+
+    def suspend_notes(self, note_ids: List[int]) -> None:
+        if AddNoteRequest is None:
+            card_ids = []
+            for start in range(0, len(note_ids), NOTE_IDS_PER_QUERY):
+                chunk = note_ids[start:start + NOTE_IDS_PER_QUERY]
+                placeholders = ', '.join('?' * len(chunk))
+                card_ids.extend(self.collection.db.list(
+                    f'select id from cards where nid in ({placeholders})',
+                    *chunk))
+            self.collection.sched.suspendCards(card_ids)
+        else:
+            self.collection.sched.suspend_notes(note_ids)
+
+    def existing_note_ids(self, note_ids: List[int]) -> Iterable[int]:
+        # the given notes which still exist and have this model
+        for start in range(0, len(note_ids), NOTE_IDS_PER_QUERY):
+            chunk = note_ids[start:start + NOTE_IDS_PER_QUERY]
+            placeholders = ', '.join('?' * len(chunk))
+            yield from self.collection.db.list(
+                f'select id from notes where mid = ? and id in ({placeholders})',
+                self.model['id'], *chunk)
+
+    def count_notes(self) -> int:
+        return self.collection.db.scalar(
+            'select count() from notes where mid = ?', self.model['id'])
 
-    def get_notes(self) -> Iterable[str]:
-        note_fields = self.collection.db.list(
-            'select flds from notes where mid = ?', self.model['id'])
-        for fields in note_fields:
-            yield splitFields(fields)[self.content_field_index]
+    def get_notes(self, chunk_size: int = NOTES_PER_QUERY) -> Iterable[str]:
+        rows = self._select_note_rows(self._content_column(), chunk_size)
+        for _, content_column in rows:
+            yield self._content(content_column)
+
+    def content_key(self) -> str:
+        return f"{self.model['id']}:{self.content_field_index}"
+
+    def get_note_versions(
+        self, chunk_size: int = NOTES_PER_QUERY,
+    ) -> Iterable[Tuple[int, int]]:
+        return self._select_note_rows('mod', chunk_size)
+
+    def get_notes_by_id(self, note_ids: List[int]) -> Iterable[Tuple[int, str]]:
+        content_column = self._content_column()
+        for start in range(0, len(note_ids), NOTE_IDS_PER_QUERY):
+            chunk = note_ids[start:start + NOTE_IDS_PER_QUERY]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.collection.db.all(
+                f'select id, {content_column} from notes '
+                f'where id in ({placeholders})',
+                *chunk)
+            for note_id, content_column_value in rows:
+                yield note_id, self._content(content_column_value)
+
+    def _select_note_rows(self, column: str, chunk_size: int) -> Iterable[Any]:
+        # Reads the notes in id order a chunk at a time, so that only one
+        # chunk of rows is held in memory.
+        last_note_id = MIN_NOTE_ID
+        while True:
+            rows = self.collection.db.all(
+                f'select id, {column} from notes '
+                'where mid = ? and id > ? order by id limit ?',
+                self.model['id'], last_note_id, chunk_size)
+
+            yield from rows
+
+            if len(rows) < chunk_size:
+                return
+
+            last_note_id = rows[-1][0]
+
+    def _content_column(self) -> str:
+        if self.content_field_index == 0:
+            return FIRST_FIELD_COLUMN
+        return 'flds'
+
+    def _content(self, content_column_value: str) -> str:
+        if self.content_field_index == 0:
+            return content_column_value
+        return splitFields(content_column_value)[self.content_field_index]
+
+
+@dataclass
+class BatchTiming:
+    num_notes: int
+    seconds: float
+
+
+@dataclass
+class AddedNotes:
+    # the ids of the added notes, in the order they were given
+    note_ids: List[int] = field(default_factory=list)
+    batch_timings: List[BatchTiming] = field(default_factory=list)
 
 
 @dataclass
@@ -78,6 +275,43 @@ class AnkiAddonData:
         return user_files_path
 
 
+@dataclass
+class FileAddonData:
+    # Stands in for AnkiAddonData when running without the Anki GUI.
+    config_path: Optional[str]
+    user_files_directory: str
+
+    def read_config(self) -> JsonData:
+        config = read_json_file(DEFAULT_CONFIG_PATH)
+        if self.config_path is not None:
+            config.update(read_json_file(self.config_path))
+        return config
+
+    def user_files_path(self) -> str:
+        os.makedirs(self.user_files_directory, exist_ok=True)
+        return self.user_files_directory
+
+
+DEFAULT_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'config.json')
+
+
+def read_json_file(path: str) -> JsonData:
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def open_collection(path: str) -> _Collection:
+    try:
+        from anki.collection import Collection
+    except ImportError:
+        # older Anki versions
+        from anki.storage import Collection
+
+    return Collection(path)
+
+
 @dataclass
 class AnkiCollection:
     collection: _Collection
@@ -103,7 +337,10 @@ class AnkiCollection:
             self.collection, model, content_field_index, source_field_index)
 
     def _get_model(self, model_name: str, deck_name: Optional[str]) -> NoteType:
-        model = deepcopy(self.collection.models.byName(model_name))
+        # A shallow copy is enough to change the deck for new cards without
+        # changing the collection's model, and is much cheaper than copying
+        # the model's fields and templates too.
+        model = dict(self.collection.models.byName(model_name))
         self._set_deck_for_new_cards(model, deck_name)
         return model
 
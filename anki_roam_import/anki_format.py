@@ -1,11 +1,14 @@
 import html
 import re
-from dataclasses import dataclass, replace
-from typing import Any, Callable, Iterable, List, Match, Optional, TypeVar
+import sys
+from dataclasses import dataclass, field, replace
+from typing import (
+    Any, Callable, Dict, Iterable, List, Match, Optional, TypeVar,
+)
 
 from .model import (
     AnkiNote, Cloze, ClozePart, CodeBlock, CodeInline, Math, RoamBlock,
-    RoamColonCommand, RoamCurlyCommand, RoamPart,
+    RoamColonCommand, RoamCurlyCommand, RoamPart, SharedSource, SourceText,
 )
 
 
@@ -19,12 +22,32 @@ class AnkiNoteMaker:
     cloze_enumerator: 'ClozeEnumerator'
     roam_parts_formatter: Formatter[Iterable[RoamPart]]
     html_formatter: Formatter[str]
+    shared_sources_html: Dict[str, str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
 
     def __call__(self, roam_block: RoamBlock) -> AnkiNote:
         numbered_parts = self.cloze_enumerator(roam_block.parts)
         anki_content = self.roam_parts_formatter(numbered_parts)
-        source_html = self.html_formatter(roam_block.source)
-        return AnkiNote(anki_content, source_html)
+        source_html = self.format_source(roam_block.source)
+        return AnkiNote(
+            anki_content,
+            source_html,
+            roam_block.uid,
+            roam_block.edit_time,
+            roam_block.tags,
+            roam_block.deck_name,
+        )
+
+    def format_source(self, source: SourceText) -> SourceText:
+        if not isinstance(source, SharedSource):
+            return self.html_formatter(source)
+
+        shared_html = self.shared_sources_html.get(source.shared)
+        if shared_html is None:
+            shared_html = sys.intern(self.html_formatter(source.shared))
+            self.shared_sources_html[source.shared] = shared_html
+
+        return SharedSource(shared_html, self.html_formatter(source.suffix))
 
 
 class ClozeEnumerator:
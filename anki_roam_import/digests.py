@@ -0,0 +1,193 @@
+import hashlib
+import math
+import os
+import struct
+from array import array
+from typing import Iterable, Optional, Tuple
+
+DIGEST_SIZE = 16
+
+
+def content_digest(content: str) -> bytes:
+    return hashlib.blake2b(
+        content.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+class DigestTable:
+    # Open addressing hash table of 128-bit digests, stored as pairs of 64-bit
+    # words in a flat array. An all-zero pair marks an empty slot.
+
+    def __init__(self, capacity: int = 1024):
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        num_slots = 8
+        while num_slots < capacity * 2:
+            num_slots *= 2
+
+        self.words = array('Q', bytes(num_slots * 16))
+        self.mask = num_slots - 1
+        self.num_digests = 0
+
+    def __len__(self) -> int:
+        return self.num_digests
+
+    def __contains__(self, content: str) -> bool:
+        return self.contains_digest(content_digest(content))
+
+    def add(self, content: str) -> None:
+        self.add_digest(content_digest(content))
+
+    def update(self, contents: Iterable[str]) -> None:
+        for content in contents:
+            self.add(content)
+
+    def contains_digest(self, digest: bytes) -> bool:
+        low, high = digest_words(digest)
+        return self._find_slot(low, high) >= 0
+
+    def add_digest(self, digest: bytes) -> bool:
+        low, high = digest_words(digest)
+        slot = self._find_slot(low, high)
+
+        if slot >= 0:
+            return False
+
+        slot = -slot - 1
+        self.words[2 * slot] = low
+        self.words[2 * slot + 1] = high
+        self.num_digests += 1
+
+        if self.num_digests * 2 > self.mask + 1:
+            self._resize()
+
+        return True
+
+    def _find_slot(self, low: int, high: int) -> int:
+        # Returns the slot containing the digest, or -(empty slot + 1).
+        words = self.words
+        mask = self.mask
+        slot = low & mask
+
+        while True:
+            slot_low = words[2 * slot]
+            slot_high = words[2 * slot + 1]
+
+            if slot_low == low and slot_high == high:
+                return slot
+
+            if not slot_low and not slot_high:
+                return -slot - 1
+
+            slot = (slot + 1) & mask
+
+    def _resize(self) -> None:
+        old_words = self.words
+        self._allocate(capacity=self.num_digests * 2)
+
+        for index in range(0, len(old_words), 2):
+            low = old_words[index]
+            high = old_words[index + 1]
+            if low or high:
+                slot = -self._find_slot(low, high) - 1
+                self.words[2 * slot] = low
+                self.words[2 * slot + 1] = high
+                self.num_digests += 1
+
+
+def digest_words(digest: bytes) -> Tuple[int, int]:
+    low = int.from_bytes(digest[:8], 'little')
+    high = int.from_bytes(digest[8:16], 'little')
+
+    if not low and not high:
+        # the all-zero digest would look like an empty slot
+        high = 1
+
+    return low, high
+
+
+class BloomFilter:
+    # Bit positions come from double hashing of the two 64-bit digest words.
+    # store_position records how much of the added notes store the filter
+    # has seen, so that a saved filter can be brought up to date.
+
+    def __init__(
+        self,
+        capacity: int,
+        false_positive_rate: float,
+        bits: Optional[bytearray] = None,
+        store_position: int = 0,
+    ):
+        self.capacity = max(capacity, 1)
+        self.false_positive_rate = false_positive_rate
+        self.store_position = store_position
+
+        num_bits = -self.capacity * math.log(false_positive_rate) / LN2_SQUARED
+        self.num_bits = max(int(math.ceil(num_bits)), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * LN2)), 1)
+
+        if bits is None:
+            bits = bytearray((self.num_bits + 7) // 8)
+        elif len(bits) != (self.num_bits + 7) // 8:
+            raise ValueError
+        self.bits = bits
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self.bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, digest: bytes) -> None:
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        low, high = digest_words(digest)
+        high |= 1
+        num_bits = self.num_bits
+        for index in range(self.num_hashes):
+            yield (low + index * high) % num_bits
+
+    def save(self, path: str) -> None:
+        header = BLOOM_FILTER_HEADER.pack(
+            BLOOM_FILTER_MAGIC,
+            self.capacity,
+            self.false_positive_rate,
+            self.store_position,
+        )
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, mode='wb') as file:
+            file.write(header)
+            file.write(self.bits)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['BloomFilter']:
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, mode='rb') as file:
+            header = file.read(BLOOM_FILTER_HEADER.size)
+            bits = bytearray(file.read())
+
+        if len(header) != BLOOM_FILTER_HEADER.size:
+            return None
+
+        magic, capacity, false_positive_rate, store_position = (
+            BLOOM_FILTER_HEADER.unpack(header))
+        if magic != BLOOM_FILTER_MAGIC:
+            return None
+
+        try:
+            return cls(capacity, false_positive_rate, bits, store_position)
+        except ValueError:
+            return None
+
+
+LN2 = math.log(2)
+LN2_SQUARED = LN2 * LN2
+BLOOM_FILTER_MAGIC = b'RIBF'
+BLOOM_FILTER_HEADER = struct.Struct('<4sQdQ')
@@ -0,0 +1,578 @@
+# Writes the notes in Roam exports to a file which Anki can import, without
+# needing the anki package, e.g.
+# python -m anki_roam_import.export roam.zip notes.apkg --config config.json
+import argparse
+import base64
+import csv
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, TextIO
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from .anki import DEFAULT_CONFIG_PATH, read_json_file
+from .anki_format import make_anki_note_maker
+from .digests import DigestTable
+from .importer import normalized_digest
+from .model import AnkiNote, JsonData
+from .roam import (
+    load_roam_pages, make_block_extractor, make_block_filter, make_deck_router,
+)
+
+
+def roam_notes(paths: Iterable[str], config: JsonData) -> Iterable[AnkiNote]:
+    extract_roam_blocks = make_block_extractor(
+        compact_sources=config.get('compact_sources', False),
+        resolve_block_references=config.get('resolve_block_references', False),
+        block_filter=make_block_filter(config),
+        import_tags=config.get('import_tags', False),
+        deck_router=make_deck_router(config),
+    )
+    make_anki_note = make_anki_note_maker()
+
+    roam_pages = (
+        roam_page for path in paths for roam_page in load_roam_pages(path))
+    return map(make_anki_note, extract_roam_blocks(roam_pages))
+
+
+@dataclass
+class ExportReport:
+    num_notes: int = 0
+    num_duplicate_notes: int = 0
+
+    def __str__(self) -> str:
+        info = f'{self.num_notes} notes exported'
+        if self.num_duplicate_notes:
+            info += (f', {self.num_duplicate_notes} duplicate notes were '
+                     f'not exported')
+        return info + '.'
+
+
+def export_notes(
+    paths: Iterable[str], output_path: str, config: JsonData,
+) -> ExportReport:
+    # Notes are written as they are read, so memory use does not grow with
+    # the size of the exports, apart from a 16 byte digest per note to skip
+    # duplicate notes.
+    report = ExportReport()
+    digests = DigestTable()
+
+    with open_note_writer(output_path, NoteType.from_config(config)) as writer:
+        for anki_note in roam_notes(paths, config):
+            if not digests.add_digest(normalized_digest(anki_note.content)):
+                report.num_duplicate_notes += 1
+                continue
+
+            writer.write(anki_note)
+            report.num_notes += 1
+
+    return report
+
+
+@dataclass
+class NoteType:
+    model_name: str
+    content_field: str
+    source_field: Optional[str]
+    deck_name: Optional[str]
+    tags: bool = False
+    decks: bool = False
+
+    @classmethod
+    def from_config(cls, config: JsonData) -> 'NoteType':
+        return cls(
+            config['model_name'],
+            config['content_field'],
+            config['source_field'],
+            config['deck_name'],
+            config.get('import_tags', False),
+            make_deck_router(config) is not None,
+        )
+
+    @property
+    def field_names(self) -> List[str]:
+        if self.source_field is None:
+            return [self.content_field]
+        return [self.content_field, self.source_field]
+
+    def fields(self, anki_note: AnkiNote) -> List[str]:
+        if self.source_field is None:
+            return [anki_note.content]
+        return [anki_note.content, str(anki_note.source)]
+
+    def note_deck_name(self, anki_note: AnkiNote) -> Optional[str]:
+        return anki_note.deck_name or self.deck_name
+
+
+def open_note_writer(path: str, note_type: NoteType) -> 'NoteWriter':
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.apkg':
+        return ApkgNoteWriter(path, note_type)
+    if extension in ('.tsv', '.txt'):
+        return TextNoteWriter(path, note_type, delimiter='\t')
+    if extension == '.csv':
+        return TextNoteWriter(path, note_type, delimiter=',')
+
+    raise RuntimeError(f'Unknown output file type: {path!r}')
+
+
+class NoteWriter(ABC):
+    def __enter__(self) -> 'NoteWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close(completed=exc_type is None)
+
+    @abstractmethod
+    def write(self, anki_note: AnkiNote) -> None:
+        pass
+
+    @abstractmethod
+    def close(self, completed: bool = True) -> None:
+        pass
+
+
+class TextNoteWriter(NoteWriter):
+    # Anki's text importer reads the header lines to choose the note type and
+    # deck. Older versions of Anki skip them as comments.
+
+    def __init__(self, path: str, note_type: NoteType, delimiter: str):
+        self.note_type = note_type
+        self.file: TextIO = open(path, mode='w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file, delimiter=delimiter)
+        self._write_header(delimiter)
+
+    def _write_header(self, delimiter: str) -> None:
+        separator = 'tab' if delimiter == '\t' else 'comma'
+        header = [
+            f'#separator:{separator}',
+            '#html:true',
+            f'#notetype:{self.note_type.model_name}',
+        ]
+        if self.note_type.deck_name and not self.note_type.decks:
+            header.append(f'#deck:{self.note_type.deck_name}')
+
+        columns = self.note_type.field_names
+        if self.note_type.tags:
+            columns = columns + ['Tags']
+            header.append(f'#tags column:{len(columns)}')
+        if self.note_type.decks:
+            columns = columns + ['Deck']
+            header.append(f'#deck column:{len(columns)}')
+        header.append(f'#columns:{delimiter.join(columns)}')
+
+        self.file.write(''.join(f'{line}\n' for line in header))
+
+    def write(self, anki_note: AnkiNote) -> None:
+        row = self.note_type.fields(anki_note)
+        if self.note_type.tags:
+            row.append(' '.join(anki_note.tags))
+        if self.note_type.decks:
+            row.append(self.note_type.note_deck_name(anki_note) or 'Default')
+        self.writer.writerow(row)
+
+    def close(self, completed: bool = True) -> None:
+        self.file.close()
+
+
+class ApkgNoteWriter(NoteWriter):
+    # Writes a collection with the schema of Anki 2.1 (version 11), which
+    # every version of Anki since 2.1 can import, and packages it as an
+    # .apkg file when it is closed.
+
+    def __init__(self, path: str, note_type: NoteType):
+        self.path = path
+        self.note_type = note_type
+        self.directory = tempfile.TemporaryDirectory()
+        self.collection_path = os.path.join(
+            self.directory.name, 'collection.anki2')
+        self.connection = sqlite3.connect(self.collection_path)
+        self.connection.executescript(COLLECTION_SCHEMA)
+
+        self.now = int(time.time())
+        self.model_id = stable_id(f'model:{note_type.model_name}')
+        # the ids of the decks which cards were put in, by name
+        self.deck_ids: Dict[str, int] = {}
+        self.deck_id = self._deck_id(note_type.deck_name)
+        # ids of notes and cards are creation times in milliseconds
+        self.next_id = self.now * 1000
+        self.num_notes = 0
+
+    def write(self, anki_note: AnkiNote) -> None:
+        fields = self.note_type.fields(anki_note)
+        note_id = self._new_id()
+        digest = normalized_digest(anki_note.content)
+        sort_field = strip_html(fields[0])
+        deck_id = self._deck_id(self.note_type.note_deck_name(anki_note))
+
+        self.connection.execute(
+            'insert into notes values (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, \'\')',
+            (
+                note_id,
+                base64.b64encode(digest[:9]).decode('ascii'),
+                self.model_id,
+                self.now,
+                # tags are stored with a space before and after each one
+                f' {" ".join(anki_note.tags)} ' if anki_note.tags else '',
+                '\x1f'.join(fields),
+                sort_field,
+                field_checksum(sort_field),
+            ),
+        )
+
+        for cloze_number in cloze_numbers(anki_note.content):
+            self.connection.execute(
+                'insert into cards values '
+                '(?, ?, ?, ?, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, \'\')',
+                (
+                    self._new_id(),
+                    note_id,
+                    deck_id,
+                    cloze_number - 1,
+                    self.now,
+                    self.num_notes + 1,
+                ),
+            )
+
+        self.num_notes += 1
+
+    def _deck_id(self, deck_name: Optional[str]) -> int:
+        if not deck_name:
+            return DEFAULT_DECK_ID
+        try:
+            return self.deck_ids[deck_name]
+        except KeyError:
+            deck_id = self.deck_ids[deck_name] = stable_id(f'deck:{deck_name}')
+            return deck_id
+
+    def _new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    def close(self, completed: bool = True) -> None:
+        try:
+            if completed:
+                self._write_collection()
+                self.connection.commit()
+                self.connection.execute('vacuum')
+            self.connection.close()
+
+            if completed:
+                self._write_package()
+        finally:
+            self.directory.cleanup()
+
+    def _write_collection(self) -> None:
+        self.connection.executescript(COLLECTION_INDEXES)
+        self.connection.execute(
+            'insert into col values '
+            '(1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, \'{}\')',
+            (
+                self.now,
+                self.now * 1000,
+                self.now * 1000,
+                json.dumps(self._collection_config()),
+                json.dumps(self._models()),
+                json.dumps(self._decks()),
+                json.dumps(DECK_CONFIGS),
+            ),
+        )
+
+    def _write_package(self) -> None:
+        temporary_path = f'{self.path}.tmp'
+        with ZipFile(temporary_path, mode='w', compression=ZIP_DEFLATED) as zip_file:
+            zip_file.write(self.collection_path, 'collection.anki2')
+            zip_file.writestr('media', '{}')
+        os.replace(temporary_path, self.path)
+
+    def _collection_config(self) -> JsonData:
+        return {
+            'nextPos': self.num_notes + 1,
+            'estTimes': True,
+            'activeDecks': [DEFAULT_DECK_ID],
+            'sortType': 'noteFld',
+            'timeLim': 0,
+            'sortBackwards': False,
+            'addToCur': True,
+            'curDeck': DEFAULT_DECK_ID,
+            'newSpread': 0,
+            'dueCounts': True,
+            'curModel': self.model_id,
+            'collapseTime': 1200,
+        }
+
+    def _models(self) -> JsonData:
+        field_names = self.note_type.field_names
+        answer_format = f'{{{{cloze:{field_names[0]}}}}}'
+        if len(field_names) > 1:
+            answer_format += f'<br>\n{{{{{field_names[1]}}}}}'
+
+        return {str(self.model_id): {
+            'id': self.model_id,
+            'name': self.note_type.model_name,
+            'type': CLOZE_MODEL_TYPE,
+            'mod': self.now,
+            'usn': -1,
+            'sortf': 0,
+            'did': self.deck_id,
+            'tmpls': [{
+                'name': 'Cloze',
+                'ord': 0,
+                'qfmt': f'{{{{cloze:{field_names[0]}}}}}',
+                'afmt': answer_format,
+                'did': None,
+                'bqfmt': '',
+                'bafmt': '',
+            }],
+            'flds': [
+                {
+                    'name': field_name,
+                    'ord': index,
+                    'sticky': False,
+                    'rtl': False,
+                    'font': 'Arial',
+                    'size': 20,
+                    'media': [],
+                }
+                for index, field_name in enumerate(field_names)
+            ],
+            'css': CLOZE_CSS,
+            'latexPre': LATEX_PREAMBLE,
+            'latexPost': '\\end{document}',
+            'latexsvg': False,
+            'req': [[0, 'any', [0]]],
+            'tags': [],
+            'vers': [],
+        }}
+
+    def _decks(self) -> JsonData:
+        decks = {str(DEFAULT_DECK_ID): deck_json(DEFAULT_DECK_ID, 'Default', 0)}
+        for deck_name, deck_id in self.deck_ids.items():
+            decks[str(deck_id)] = deck_json(deck_id, deck_name, self.now)
+        return decks
+
+
+DEFAULT_DECK_ID = 1
+CLOZE_MODEL_TYPE = 1
+
+
+def stable_id(name: str) -> int:
+    # The same note type and deck get the same ids in every export, so that
+    # importing a later export into the same collection reuses them.
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=5).digest()
+    return 10 ** 12 + int.from_bytes(digest, 'big')
+
+
+def deck_json(deck_id: int, name: str, mod: int) -> JsonData:
+    return {
+        'id': deck_id,
+        'name': name,
+        'mod': mod,
+        'usn': -1,
+        'lrnToday': [0, 0],
+        'revToday': [0, 0],
+        'newToday': [0, 0],
+        'timeToday': [0, 0],
+        'collapsed': False,
+        'browserCollapsed': False,
+        'desc': '',
+        'dyn': 0,
+        'conf': 1,
+        'extendNew': 0,
+        'extendRev': 0,
+    }
+
+
+def strip_html(text: str) -> str:
+    return html.unescape(HTML_TAG.sub('', text))
+
+
+HTML_TAG = re.compile(r'<[^>]*>')
+
+
+def field_checksum(text: str) -> int:
+    # as Anki computes it, for finding duplicate notes
+    return int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def cloze_numbers(content: str) -> List[int]:
+    numbers = {int(number) for number in CLOZE_NUMBER.findall(content)}
+    return sorted(numbers) or [1]
+
+
+CLOZE_NUMBER = re.compile(r'{{c(\d+)::')
+
+CLOZE_CSS = '''.card {
+ font-family: arial;
+ font-size: 20px;
+ text-align: center;
+ color: black;
+ background-color: white;
+}
+
+.cloze {
+ font-weight: bold;
+ color: blue;
+}
+'''
+
+LATEX_PREAMBLE = '''\\documentclass[12pt]{article}
+\\special{papersize=3in,5in}
+\\usepackage[utf8]{inputenc}
+\\usepackage{amssymb,amsmath}
+\\pagestyle{empty}
+\\setlength{\\parindent}{0in}
+\\begin{document}
+'''
+
+DECK_CONFIGS = {'1': {
+    'id': 1,
+    'name': 'Default',
+    'mod': 0,
+    'usn': 0,
+    'maxTaken': 60,
+    'autoplay': True,
+    'timer': 0,
+    'replayq': True,
+    'dyn': False,
+    'new': {
+        'bury': False,
+        'delays': [1, 10],
+        'initialFactor': 2500,
+        'ints': [1, 4, 0],
+        'order': 1,
+        'perDay': 20,
+    },
+    'lapse': {
+        'delays': [10],
+        'leechAction': 1,
+        'leechFails': 8,
+        'minInt': 1,
+        'mult': 0,
+    },
+    'rev': {
+        'bury': False,
+        'ease4': 1.3,
+        'ivlFct': 1,
+        'maxIvl': 36500,
+        'perDay': 200,
+        'hardFactor': 1.2,
+    },
+}}
+
+COLLECTION_SCHEMA = '''
+    create table col (
+        id integer primary key,
+        crt integer not null,
+        mod integer not null,
+        scm integer not null,
+        ver integer not null,
+        dty integer not null,
+        usn integer not null,
+        ls integer not null,
+        conf text not null,
+        models text not null,
+        decks text not null,
+        dconf text not null,
+        tags text not null
+    );
+    create table notes (
+        id integer primary key,
+        guid text not null,
+        mid integer not null,
+        mod integer not null,
+        usn integer not null,
+        tags text not null,
+        flds text not null,
+        sfld integer not null,
+        csum integer not null,
+        flags integer not null,
+        data text not null
+    );
+    create table cards (
+        id integer primary key,
+        nid integer not null,
+        did integer not null,
+        ord integer not null,
+        mod integer not null,
+        usn integer not null,
+        type integer not null,
+        queue integer not null,
+        due integer not null,
+        ivl integer not null,
+        factor integer not null,
+        reps integer not null,
+        lapses integer not null,
+        left integer not null,
+        odue integer not null,
+        odid integer not null,
+        flags integer not null,
+        data text not null
+    );
+    create table revlog (
+        id integer primary key,
+        cid integer not null,
+        usn integer not null,
+        ease integer not null,
+        ivl integer not null,
+        lastIvl integer not null,
+        factor integer not null,
+        time integer not null,
+        type integer not null
+    );
+    create table graves (
+        usn integer not null,
+        oid integer not null,
+        type integer not null
+    );
+'''
+
+# created after the notes are inserted, which is faster than keeping them
+# up to date during the inserts
+COLLECTION_INDEXES = '''
+    create index ix_notes_usn on notes (usn);
+    create index ix_cards_usn on cards (usn);
+    create index ix_revlog_usn on revlog (usn);
+    create index ix_cards_nid on cards (nid);
+    create index ix_cards_sched on cards (did, queue, due);
+    create index ix_revlog_cid on revlog (cid);
+    create index ix_notes_csum on notes (csum);
+'''
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m anki_roam_import.export',
+        description='Write the cloze notes in Roam exports to a file which '
+                    'Anki can import.',
+    )
+    parser.add_argument(
+        'roam_exports', nargs='+', help='Roam JSON exports (.zip or .json)')
+    parser.add_argument(
+        'output', help='file to write, ending in .apkg, .tsv, .txt or .csv')
+    parser.add_argument(
+        '--config',
+        help='JSON configuration file, with the fields described in '
+             'config.md, overriding the default configuration')
+    args = parser.parse_args(args)
+
+    config = read_json_file(DEFAULT_CONFIG_PATH)
+    if args.config is not None:
+        config.update(read_json_file(args.config))
+
+    report = export_notes(args.roam_exports, args.output, config)
+    print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
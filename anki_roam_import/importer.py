@@ -1,15 +1,31 @@
 import json
 import os.path
 import re
-from dataclasses import dataclass
-from typing import Iterable, List
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import (
+    ContextManager, Dict, Iterable, List, Optional, Set, Tuple, Union,
+)
 
 from .anki import (
-    AnkiAddonData, AnkiCollection, AnkiModelNotes, is_anki_package_installed,
+    NOTES_PER_BATCH, NOTES_PER_QUERY, AnkiAddonData, AnkiCollection,
+    AnkiModelNotes, BatchTiming, is_anki_package_installed,
+)
+from .anki_format import make_anki_note_maker
+from .digests import BloomFilter, DigestTable, content_digest
+from .model import AnkiNote, JsonData
+from .pipeline import Pipeline, Stage, StageCounter
+from .profiling import ImportProfiler, make_import_profiler, profiling
+from .report import (
+    ORPHANED_NOTE_TAG, ORPHANED_NOTES_ACTIONS, ImportReport, StageTime,
 )
-from .anki_format import make_anki_note
-from .model import AnkiNote
-from .roam import extract_roam_blocks, load_roam_pages
+from .roam import (
+    BlockFilter, load_roam_pages, make_block_extractor, make_block_filter,
+    make_deck_router, roam_export_size, roam_graph_name,
+)
+from .run_log import RunLog, process_peak_rss_bytes
+from .storage import AddedNotesStore, BlockNoteIndex, NoteDigestCache
 
 if is_anki_package_installed():
     from anki.utils import stripHTMLMedia
@@ -24,63 +40,529 @@ class AnkiNoteImporter:
     addon_data: AnkiAddonData
     collection: AnkiCollection
 
-    def import_from_path(self, path: str) -> str:
-        roam_pages = load_roam_pages(path)
-        roam_notes = extract_roam_blocks(roam_pages)
-        notes_to_add = map(make_anki_note, roam_notes)
+    def import_from_path(
+        self, path: str, progress: Optional['ImportProgress'] = None,
+    ) -> ImportReport:
+        return self.import_from_paths([path], progress)
+
+    def import_from_paths(
+        self, paths: List[str], progress: Optional['ImportProgress'] = None,
+    ) -> ImportReport:
+        # The notes already imported are read once, and the notes of all of
+        # the exports are deduplicated against them and each other.
+        note_import = self.start_import()
+
+        try:
+            with note_import.profiling():
+                for anki_notes in note_import.note_batches(paths, progress):
+                    note_import.add_notes(anki_notes)
+        finally:
+            report = note_import.finish()
+
+        return report
+
+    def start_import(self, read_existing_notes: bool = True) -> 'NoteImport':
+        # Without read_existing_notes, the caller reads the notes already in
+        # the collection with NoteImport.read_existing_notes, e.g. in chunks
+        # between updates of a progress dialog.
+        config = self.addon_data.read_config()
+        orphaned_notes_action(config)
+        block_filter = make_block_filter(config)
+
+        profiler = make_import_profiler(
+            config, self.addon_data.user_files_path())
+        if profiler is not None:
+            profiler.start()
+
+        try:
+            with profiling(profiler):
+                note_import = self._start_import(
+                    config, profiler, block_filter)
+
+                if read_existing_notes:
+                    try:
+                        for _ in note_import.read_existing_notes():
+                            pass
+                    except BaseException:
+                        note_import.close()
+                        raise
+        except BaseException:
+            if profiler is not None:
+                profiler.abort()
+            raise
+
+        return note_import
+
+    def _start_import(
+        self,
+        config: JsonData,
+        profiler: Optional[ImportProfiler],
+        block_filter: Optional[BlockFilter],
+    ) -> 'NoteImport':
+        added_notes_store = open_added_notes_store(self.addon_data)
+        block_notes = None
+
+        try:
+            model_notes = self.collection.get_model_notes(
+                config['model_name'],
+                config['content_field'],
+                config['source_field'],
+                config['deck_name'],
+            )
+
+            cache_note_digests = config.get('cache_note_digests', False)
+
+            if config.get('hashed_note_index', False) or cache_note_digests:
+                normalized_contents = DigestTable()
+            else:
+                normalized_contents = None
+
+            bloom_filter_false_positive_rate = config.get(
+                'bloom_filter_false_positive_rate')
+            if bloom_filter_false_positive_rate is not None:
+                bloom_filter = load_or_make_bloom_filter(
+                    bloom_filter_path(self.addon_data),
+                    len(added_notes_store) + model_notes.count_notes(),
+                    bloom_filter_false_positive_rate,
+                )
+                update_bloom_filter(bloom_filter, added_notes_store)
+            else:
+                bloom_filter = None
 
-        num_notes_added = 0
-        num_notes_ignored = 0
+            normalized_notes = NormalizedNotes(
+                normalized_contents, bloom_filter, added_notes_store)
 
-        added_notes_file = AddedNotesFile(added_notes_path(self.addon_data))
-        added_notes = added_notes_file.read()
+            if config.get('update_edited_notes', False):
+                block_notes = BlockNotes(
+                    BlockNoteIndex(block_note_index_path(self.addon_data)))
+            else:
+                block_notes = None
+
+            if cache_note_digests:
+                note_digest_cache = NoteDigestCache(
+                    note_digest_cache_path(self.addon_data),
+                    model_notes.content_key(),
+                )
+            else:
+                note_digest_cache = None
+
+            note_adder = AnkiNoteAdder(
+                model_notes, normalized_notes, block_notes=block_notes,
+                read_existing_notes=False)
+
+        except BaseException:
+            added_notes_store.close()
+            if block_notes is not None:
+                block_notes.close()
+            raise
+
+        return NoteImport(
+            self.addon_data,
+            config,
+            added_notes_store,
+            note_adder,
+            bloom_filter,
+            profiler,
+            block_filter,
+            note_digest_cache,
+        )
 
-        normalized_notes = NormalizedNotes()
-        normalized_notes.update(added_notes_file.read())
 
-        config = self.addon_data.read_config()
-        model_notes = self.collection.get_model_notes(
-            config['model_name'],
-            config['content_field'],
-            config['source_field'],
-            config['deck_name'],
+@dataclass
+class ImportProgress:
+    num_pages: int = 0
+    num_blocks: int = 0
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+
+    def cancel(self) -> None:
+        self.cancel_requested.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_requested.is_set()
+
+
+class NoteImport:
+    # Methods other than those of the note pipeline use the collection and
+    # the user files, and must run on the thread which called
+    # AnkiNoteImporter.start_import.
+
+    def __init__(
+        self,
+        addon_data: AnkiAddonData,
+        config: JsonData,
+        added_notes_store: AddedNotesStore,
+        note_adder: 'AnkiNoteAdder',
+        bloom_filter: Optional[BloomFilter],
+        profiler: Optional[ImportProfiler] = None,
+        block_filter: Optional[BlockFilter] = None,
+        note_digest_cache: Optional[NoteDigestCache] = None,
+    ):
+        self.addon_data = addon_data
+        self.config = config
+        self.added_notes_store = added_notes_store
+        self.note_adder = note_adder
+        self.bloom_filter = bloom_filter
+        self.profiler = profiler
+        self.block_filter = block_filter
+        self.note_digest_cache = note_digest_cache
+        self.insert_counter = StageCounter('dedupe and insert')
+        self.report = ImportReport(stage_counters=[self.insert_counter])
+        self.report.stage_times.update(
+            normalize=note_adder.normalize_time,
+            dedupe=note_adder.dedupe_time,
+            insert=note_adder.insert_time,
+        )
+        self.traversal_time = StageTime()
+        # the graphs whose exports were read by this import
+        self.graphs_read: Set[str] = set()
+        self.all_blocks_read = False
+        self.report.started_at = time.time()
+        self.start_time = time.perf_counter()
+
+    def read_existing_notes(self) -> Iterable[int]:
+        # Yields the number of notes read so far after each chunk of notes.
+        # The notes must all be read before any are added.
+        try:
+            yield from self.note_adder.read_existing_notes(
+                self.note_digest_cache)
+        finally:
+            self._close_note_digest_cache()
+
+    def _close_note_digest_cache(self) -> None:
+        if self.note_digest_cache is not None:
+            self.note_digest_cache.close()
+            self.note_digest_cache = None
+
+    def note_pipeline(
+        self,
+        paths: List[str],
+        progress: Optional[ImportProgress] = None,
+        batch_size: int = NOTES_PER_BATCH,
+    ) -> Pipeline:
+        # Pages are loaded, and notes made from them, on separate threads.
+        # The batches of notes the pipeline produces are added on the thread
+        # which reads them.
+        if progress is None:
+            progress = ImportProgress()
+
+        report = self.report
+        stage_times = report.stage_times
+        block_notes = self.note_adder.block_notes
+        extract_roam_blocks = make_block_extractor(
+            compact_sources=self.config.get('compact_sources', False),
+            parse_time=stage_times['parse'],
+            imported_edit_times=(
+                None if block_notes is None else block_notes.edit_times),
+            cloze_block_graphs=(
+                None if block_notes is None
+                else block_notes.cloze_block_graphs),
+            resolve_block_references=self.config.get(
+                'resolve_block_references', False),
+            block_filter=self.block_filter,
+            import_tags=self.config.get('import_tags', False),
+            deck_router=make_deck_router(self.config),
         )
-        note_adder = AnkiNoteAdder(model_notes, added_notes, normalized_notes)
+        roam_block_builder = extract_roam_blocks.roam_block_builder
+        make_anki_note = make_anki_note_maker()
+
+        def load_pages(
+            paths: Iterable[str],
+        ) -> Iterable[Tuple[str, JsonData]]:
+            # each page is paired with the name of its graph
+            load_time = stage_times['load']
+
+            for path_to_load in paths:
+                report.num_bytes_read += roam_export_size(path_to_load)
+                graph = roam_graph_name(path_to_load)
+                roam_pages = iter(load_roam_pages(path_to_load))
+
+                while True:
+                    with load_time:
+                        roam_page = next(roam_pages, None)
+                    if roam_page is None:
+                        break
+                    yield graph, roam_page
+
+        def make_note_batches(
+            roam_pages: Iterable[Tuple[str, JsonData]],
+        ) -> Iterable[List[AnkiNote]]:
+            format_time = stage_times['format']
+            anki_notes = []
+
+            for graph, roam_page in roam_pages:
+                roam_block_builder.graph = graph
+                self.graphs_read.add(graph)
+                num_blocks = extract_roam_blocks.num_blocks
+                num_unchanged_blocks = roam_block_builder.num_unchanged_blocks
+
+                with self.traversal_time:
+                    roam_blocks = list(
+                        extract_roam_blocks.extract_blocks([roam_page]))
+
+                with format_time:
+                    anki_notes.extend(map(make_anki_note, roam_blocks))
+
+                report.num_pages = extract_roam_blocks.num_pages
+                report.num_blocks = extract_roam_blocks.num_blocks
+                report.num_parse_cache_hits = (
+                    roam_block_builder.num_unchanged_blocks)
+                report.num_skipped_blocks += (
+                    extract_roam_blocks.num_blocks - num_blocks -
+                    len(roam_blocks) -
+                    (report.num_parse_cache_hits - num_unchanged_blocks))
+                progress.num_pages = report.num_pages
+                progress.num_blocks = report.num_blocks
+
+                while len(anki_notes) >= batch_size:
+                    yield anki_notes[:batch_size]
+                    anki_notes = anki_notes[batch_size:]
+
+            # notes which refer to blocks on later pages
+            with self.traversal_time:
+                roam_blocks = list(extract_roam_blocks.deferred_blocks())
+
+            with format_time:
+                anki_notes.extend(map(make_anki_note, roam_blocks))
+
+            report.num_skipped_blocks -= len(roam_blocks)
+            self.all_blocks_read = True
+
+            while len(anki_notes) >= batch_size:
+                yield anki_notes[:batch_size]
+                anki_notes = anki_notes[batch_size:]
+
+            if anki_notes:
+                yield anki_notes
+
+        pipeline = Pipeline(
+            paths,
+            [
+                Stage('load', load_pages),
+                Stage('parse and format', make_note_batches),
+            ],
+            threaded=self.profiler is None or not self.profiler.profile_cpu,
+        )
+        report.stage_counters = pipeline.counters + [self.insert_counter]
+        return pipeline
 
-        for note in notes_to_add:
-            if note_adder.try_add(note):
-                num_notes_added += 1
+    def note_batches(
+        self,
+        paths: List[str],
+        progress: Optional[ImportProgress] = None,
+        batch_size: int = NOTES_PER_BATCH,
+    ) -> Iterable[List[AnkiNote]]:
+        if progress is None:
+            progress = ImportProgress()
+
+        with self.note_pipeline(paths, progress, batch_size) as pipeline:
+            for anki_notes in pipeline:
+                if progress.cancelled:
+                    self.report.cancelled = True
+                    return
+
+                yield anki_notes
+
+    def profiling(self) -> ContextManager[None]:
+        return profiling(self.profiler)
+
+    def add_notes(self, anki_notes: Iterable[AnkiNote]) -> None:
+        start_time = time.perf_counter()
+
+        for anki_note in anki_notes:
+            if self.note_adder.try_update(anki_note):
+                continue
+            if self.note_adder.try_add(anki_note):
+                self.report.num_notes_added += 1
             else:
-                num_notes_ignored += 1
+                self.report.num_notes_ignored += 1
+
+        # added notes are recorded after each batch, so that an import which
+        # stops part way does not import the same notes again
+        self.note_adder.write(self.added_notes_store)
+        self.report.num_notes_updated = self.note_adder.num_notes_updated
+
+        self.insert_counter.num_items += 1
+        self.insert_counter.seconds += time.perf_counter() - start_time
+
+    def finish(self) -> ImportReport:
+        try:
+            if self.all_blocks_read and not self.report.cancelled:
+                self.handle_orphaned_notes()
+
+            if self.bloom_filter is not None:
+                self.bloom_filter.store_position = (
+                    self.added_notes_store.position())
+                self.bloom_filter.save(bloom_filter_path(self.addon_data))
+        finally:
+            self.close()
 
-        note_adder.write(added_notes_file)
+        report = self.report
 
-        def info():
-            if not num_notes_added and not num_notes_ignored:
-                yield 'No notes found'
-                return
+        # parsing happens during the traversal, and is timed separately
+        stage_times = report.stage_times
+        stage_times['traverse'] = self.traversal_time - stage_times['parse']
 
-            if num_notes_added:
-                yield f'{num_notes_added} new notes imported'
+        report.wall_seconds = time.perf_counter() - self.start_time
+        report.insert_batch_seconds = [
+            batch_timing.seconds
+            for batch_timing in self.note_adder.batch_timings
+        ]
+        report.process_peak_rss_bytes = process_peak_rss_bytes()
+        RunLog(run_log_path(self.addon_data)).append(report.to_json())
 
-            if num_notes_ignored:
-                yield f'{num_notes_ignored} notes were imported before and were not imported again'
+        if self.profiler is not None:
+            report.profile_summary = self.profiler.stop()
 
-        return ', '.join(info()) + '.'
+        return report
+
+    def close(self) -> None:
+        self._close_note_digest_cache()
+        self.added_notes_store.close()
+        if self.note_adder.block_notes is not None:
+            self.note_adder.block_notes.close()
+
+    def handle_orphaned_notes(self) -> None:
+        block_notes = self.note_adder.block_notes
+        if block_notes is None:
+            return
+
+        block_notes.record_graphs()
+
+        try:
+            if self.block_filter is None:
+                # blocks which are filtered out are not read, so their notes
+                # can't be told apart from orphaned notes
+                self._handle_orphaned_notes(block_notes)
+        finally:
+            block_notes.write()
+
+    def _handle_orphaned_notes(self, block_notes: 'BlockNotes') -> None:
+        # Notes imported from blocks which are no longer in the graphs which
+        # were read, or no longer contain clozes, are found by comparing the
+        # uids of the blocks with clozes which were read with the block note
+        # index. Notes of blocks in other graphs are left alone, so that
+        # graphs can be imported separately.
+        orphaned_uids = block_notes.orphaned_uids(self.graphs_read)
+        model_notes = self.note_adder.model_notes
+        existing_note_ids = set(model_notes.existing_note_ids(
+            sorted(block_notes.note_ids[uid] for uid in orphaned_uids)))
+
+        # notes which were deleted in Anki are forgotten
+        for uid in orphaned_uids:
+            if block_notes.note_ids[uid] not in existing_note_ids:
+                block_notes.forget(uid)
+
+        orphaned_note_ids = sorted(existing_note_ids)
+        self.report.num_orphaned_notes = len(orphaned_note_ids)
+
+        if not orphaned_note_ids:
+            return
+
+        action = orphaned_notes_action(self.config)
+
+        if action == 'tag':
+            model_notes.tag_notes(orphaned_note_ids, ORPHANED_NOTE_TAG)
+        elif action == 'suspend':
+            model_notes.suspend_notes(orphaned_note_ids)
+
+        if action is not None:
+            # so that the notes are not tagged or suspended again, e.g. after
+            # they were unsuspended
+            for uid in orphaned_uids:
+                block_notes.forget(uid)
+
+        self.report.orphaned_notes_action = action
+
+
+def orphaned_notes_action(config: JsonData) -> Optional[str]:
+    action = config.get('orphaned_notes')
+
+    if action is not None and action not in ORPHANED_NOTES_ACTIONS:
+        raise ValueError(
+            f'Unknown orphaned_notes option {action!r}, expected one of: '
+            f'{", ".join(ORPHANED_NOTES_ACTIONS)}')
+
+    return action
 
 
 class NormalizedNotes:
-    def __init__(self):
-        self.normalized_contents = set()
+    def __init__(
+        self,
+        normalized_contents: 'NormalizedContents' = None,
+        bloom_filter: Optional[BloomFilter] = None,
+        added_notes_store: Optional[AddedNotesStore] = None,
+    ):
+        if normalized_contents is None:
+            normalized_contents = set()
+        self.normalized_contents = normalized_contents
+        self.bloom_filter = bloom_filter
+        self.added_notes_store = added_notes_store
 
     def __contains__(self, content):
-        return normalized_content(content) in self.normalized_contents
+        return self.contains_normalized(normalized_content(content))
+
+    @property
+    def hashed(self) -> bool:
+        return isinstance(self.normalized_contents, DigestTable)
+
+    def contains_normalized(
+        self, normalized: str, digest: Optional[bytes] = None,
+    ) -> bool:
+        # the content is hashed at most once, if it wasn't already
+        if digest is None and (self.hashed or self.bloom_filter is not None):
+            digest = content_digest(normalized)
+
+        if self.bloom_filter is not None:
+            if digest not in self.bloom_filter:
+                return False
+
+        if self.hashed:
+            if self.normalized_contents.contains_digest(digest):
+                return True
+        elif normalized in self.normalized_contents:
+            return True
+
+        if self.added_notes_store is not None:
+            if digest is None:
+                digest = content_digest(normalized)
+            return self.added_notes_store.contains_digest(digest)
+
+        return False
 
     def add(self, content):
-        self.normalized_contents.add(normalized_content(content))
+        self.add_normalized(normalized_content(content))
+
+    def add_normalized(
+        self, normalized: str, digest: Optional[bytes] = None,
+    ) -> None:
+        if digest is None and (self.hashed or self.bloom_filter is not None):
+            digest = content_digest(normalized)
+
+        if self.hashed:
+            self.normalized_contents.add_digest(digest)
+        else:
+            self.normalized_contents.add(normalized)
+
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(digest)
+
+    def add_digest(self, digest: bytes) -> None:
+        self.normalized_contents.add_digest(digest)
+
+        if self.bloom_filter is not None:
+            self.bloom_filter.add(digest)
 
     def update(self, contents):
-        self.normalized_contents.update(map(normalized_content, contents))
+        if self.bloom_filter is None:
+            self.normalized_contents.update(map(normalized_content, contents))
+            return
+
+        for content in contents:
+            self.add(content)
+
+
+NormalizedContents = Union[Set[str], DigestTable]
 
 
 def normalized_content(content: str) -> str:
@@ -92,6 +574,10 @@ def normalized_content(content: str) -> str:
 CHARACTERS_TO_STRIP = re.compile(r'[!"\'\(\),\-\.:;\?\[\]_`\{\}]')
 
 
+def normalized_digest(content: str) -> bytes:
+    return content_digest(normalized_content(content))
+
+
 class AddedNotesFile:
     def __init__(self, path):
         self.path = path
@@ -103,9 +589,9 @@ class AddedNotesFile:
         with open(self.path, encoding='utf-8') as file:
             return json.load(file)
 
-    def write(self, notes: List[str]):
-        with open(self.path, encoding='utf-8', mode='w') as file:
-            json.dump(notes, file)
+    def mark_migrated(self) -> None:
+        if os.path.isfile(self.path):
+            os.replace(self.path, f'{self.path}.migrated')
 
 
 def added_notes_path(addon_data: AnkiAddonData) -> str:
@@ -113,29 +599,325 @@ def added_notes_path(addon_data: AnkiAddonData) -> str:
     return os.path.join(user_files_path, 'added_notes.json')
 
 
+def open_added_notes_store(addon_data: AnkiAddonData) -> AddedNotesStore:
+    added_notes_store = AddedNotesStore(added_notes_store_path(addon_data))
+
+    # notes recorded by earlier versions of the add-on
+    added_notes_file = AddedNotesFile(added_notes_path(addon_data))
+    added_notes = added_notes_file.read()
+    if added_notes:
+        added_notes_store.add(
+            (content, normalized_digest(content)) for content in added_notes)
+    added_notes_file.mark_migrated()
+
+    return added_notes_store
+
+
+def added_notes_store_path(addon_data: AnkiAddonData) -> str:
+    user_files_path = addon_data.user_files_path()
+    return os.path.join(user_files_path, 'added_notes.sqlite3')
+
+
+def load_or_make_bloom_filter(
+    path: str, num_notes: int, false_positive_rate: float,
+) -> BloomFilter:
+    # The saved filter is reused while it has room for the notes, and is
+    # made with room to spare so that it lasts for several imports.
+    bloom_filter = BloomFilter.load(path)
+
+    reusable = (
+        bloom_filter is not None and
+        bloom_filter.false_positive_rate == false_positive_rate and
+        bloom_filter.capacity >= num_notes)
+
+    if reusable:
+        return bloom_filter
+
+    return BloomFilter(
+        max(num_notes * 2, MIN_BLOOM_FILTER_CAPACITY), false_positive_rate)
+
+
+MIN_BLOOM_FILTER_CAPACITY = 1024
+
+
+def update_bloom_filter(
+    bloom_filter: BloomFilter, added_notes_store: AddedNotesStore,
+) -> None:
+    for digest in added_notes_store.digests_after(bloom_filter.store_position):
+        bloom_filter.add(digest)
+    bloom_filter.store_position = added_notes_store.position()
+
+
+def bloom_filter_path(addon_data: AnkiAddonData) -> str:
+    user_files_path = addon_data.user_files_path()
+    return os.path.join(user_files_path, 'normalized_notes.bloom')
+
+
+def run_log_path(addon_data: AnkiAddonData) -> str:
+    user_files_path = addon_data.user_files_path()
+    return os.path.join(user_files_path, 'run_log.jsonl')
+
+
+def block_note_index_path(addon_data: AnkiAddonData) -> str:
+    user_files_path = addon_data.user_files_path()
+    return os.path.join(user_files_path, 'block_notes.sqlite3')
+
+
+def note_digest_cache_path(addon_data: AnkiAddonData) -> str:
+    user_files_path = addon_data.user_files_path()
+    return os.path.join(user_files_path, 'note_digests.sqlite3')
+
+
+def cached_note_digests(
+    model_notes: AnkiModelNotes, note_digest_cache: NoteDigestCache,
+) -> Iterable[bytes]:
+    # Merges the notes and cache entries, which are both in note id order,
+    # and only normalizes notes which are new or modified.
+    cache_entries = iter(note_digest_cache.entries())
+    cache_entry = next(cache_entries, None)
+    modified_notes = {}
+    deleted_note_ids = []
+
+    for note_id, mod in model_notes.get_note_versions():
+        while cache_entry is not None and cache_entry[0] < note_id:
+            deleted_note_ids.append(cache_entry[0])
+            cache_entry = next(cache_entries, None)
+
+        if cache_entry is not None and cache_entry[0] == note_id:
+            cached_mod, digest = cache_entry[1:]
+            cache_entry = next(cache_entries, None)
+            if cached_mod == mod:
+                yield digest
+                continue
+
+        modified_notes[note_id] = mod
+
+    while cache_entry is not None:
+        deleted_note_ids.append(cache_entry[0])
+        cache_entry = next(cache_entries, None)
+
+    new_entries = []
+    for note_id, content in model_notes.get_notes_by_id(list(modified_notes)):
+        digest = normalized_digest(content)
+        new_entries.append((note_id, modified_notes[note_id], digest))
+        yield digest
+
+    note_digest_cache.update(new_entries, deleted_note_ids)
+
+
+class BlockNotes:
+    # Copy of the block note index, read once at the start of an import so
+    # that blocks are looked up without queries. Changes are kept until they
+    # are written to the index.
+
+    def __init__(self, index: BlockNoteIndex):
+        self.index = index
+        self.note_ids: Dict[str, int] = {}
+        self.edit_times: Dict[str, Optional[int]] = {}
+        self.graphs: Dict[str, str] = {}
+        # the graphs of the blocks with clozes which this import read
+        self.cloze_block_graphs: Dict[str, str] = {}
+        self.changed_uids: Set[str] = set()
+        self.deleted_uids: Set[str] = set()
+
+        for uid, note_id, edit_time, graph in index.entries():
+            self.note_ids[uid] = note_id
+            self.edit_times[uid] = edit_time
+            self.graphs[uid] = graph
+
+    def note_id(self, uid: Optional[str]) -> Optional[int]:
+        return self.note_ids.get(uid)
+
+    def record(self, uid: str, note_id: int, edit_time: Optional[int]) -> None:
+        self.note_ids[uid] = note_id
+        self.edit_times[uid] = edit_time
+        self.graphs[uid] = self.cloze_block_graphs[uid]
+        self.changed_uids.add(uid)
+        self.deleted_uids.discard(uid)
+
+    def forget(self, uid: str) -> None:
+        self.note_ids.pop(uid, None)
+        self.edit_times.pop(uid, None)
+        self.graphs.pop(uid, None)
+        self.deleted_uids.add(uid)
+        self.changed_uids.discard(uid)
+
+    def record_graphs(self) -> None:
+        # Blocks which were not edited are not recorded again, so the graphs
+        # they were read from are recorded here. Must only be called once
+        # all of the blocks have been read.
+        for uid, graph in self.cloze_block_graphs.items():
+            if uid in self.note_ids and self.graphs[uid] != graph:
+                self.graphs[uid] = graph
+                self.changed_uids.add(uid)
+
+    def orphaned_uids(self, graphs: Set[str]) -> List[str]:
+        # the blocks of the given graphs which were not read with clozes
+        return [
+            uid
+            for uid, graph in self.graphs.items()
+            if graph in graphs and uid not in self.cloze_block_graphs
+        ]
+
+    def write(self) -> None:
+        self.index.update(
+            [(uid, self.note_ids[uid], self.edit_times[uid], self.graphs[uid])
+             for uid in self.changed_uids],
+            self.deleted_uids,
+        )
+        self.changed_uids.clear()
+        self.deleted_uids.clear()
+
+    def close(self) -> None:
+        self.index.close()
+
+
 class AnkiNoteAdder:
     def __init__(
         self,
         model_notes: AnkiModelNotes,
-        added_notes: Iterable[str],
         normalized_notes: NormalizedNotes,
+        note_digest_cache: Optional[NoteDigestCache] = None,
+        batch_size: int = NOTES_PER_BATCH,
+        block_notes: Optional[BlockNotes] = None,
+        read_existing_notes: bool = True,
     ):
         self.model_notes = model_notes
-        self.added_contents = list(added_notes)
+        # contents of the added and updated notes, with the digests of their
+        # normalized contents, which are recorded when they are written
+        self.added_contents: List[Tuple[str, bytes]] = []
         self.normalized_notes = normalized_notes
-
-        for note in self.model_notes.get_notes():
-            self.normalized_notes.add(note)
+        self.batch_size = batch_size
+        self.block_notes = block_notes
+        self.pending_notes: List[Tuple[AnkiNote, bytes]] = []
+        self.pending_updates: List[Tuple[int, AnkiNote, bytes]] = []
+        self.num_notes_updated = 0
+        self.batch_timings: List[BatchTiming] = []
+        self.normalize_time = StageTime()
+        self.dedupe_time = StageTime()
+        self.insert_time = StageTime()
+
+        if read_existing_notes:
+            for _ in self.read_existing_notes(note_digest_cache):
+                pass
+
+    def read_existing_notes(
+        self, note_digest_cache: Optional[NoteDigestCache] = None,
+    ) -> Iterable[int]:
+        # yields the number of notes read so far after each chunk of notes
+        num_notes = 0
+
+        if note_digest_cache is None:
+            for note in self.model_notes.get_notes():
+                self.normalized_notes.add(note)
+                num_notes += 1
+                if not num_notes % NOTES_PER_QUERY:
+                    yield num_notes
+        else:
+            digests = cached_note_digests(self.model_notes, note_digest_cache)
+            for digest in digests:
+                self.normalized_notes.add_digest(digest)
+                num_notes += 1
+                if not num_notes % NOTES_PER_QUERY:
+                    yield num_notes
+
+        yield num_notes
 
     def try_add(self, anki_note: AnkiNote) -> bool:
-        if anki_note.content in self.normalized_notes:
+        with self.normalize_time:
+            normalized = normalized_content(anki_note.content)
+
+        with self.dedupe_time:
+            digest = content_digest(normalized)
+            if self.normalized_notes.contains_normalized(normalized, digest):
+                return False
+
+            self.normalized_notes.add_normalized(normalized, digest)
+
+        self.pending_notes.append((anki_note, digest))
+
+        if len(self.pending_notes) >= self.batch_size:
+            self.flush()
+
+        return True
+
+    def try_update(self, anki_note: AnkiNote) -> bool:
+        # The note of a block which was imported before, and edited since,
+        # is updated in place instead of adding another note.
+        if self.block_notes is None:
             return False
 
-        self.model_notes.add_note(anki_note)
-        self.normalized_notes.add(anki_note.content)
-        self.added_contents.append(anki_note.content)
+        note_id = self.block_notes.note_id(anki_note.uid)
+        if note_id is None:
+            return False
+
+        with self.normalize_time:
+            normalized = normalized_content(anki_note.content)
+
+        with self.dedupe_time:
+            digest = content_digest(normalized)
+            self.normalized_notes.add_normalized(normalized, digest)
+
+        self.pending_updates.append((note_id, anki_note, digest))
+
+        if len(self.pending_updates) >= self.batch_size:
+            self.flush()
 
         return True
 
-    def write(self, added_notes_file: AddedNotesFile):
-        added_notes_file.write(self.added_contents)
+    def flush(self) -> None:
+        self._flush_updates()
+
+        if not self.pending_notes:
+            return
+
+        pending_notes, self.pending_notes = self.pending_notes, []
+        notes = [anki_note for anki_note, _ in pending_notes]
+        with self.insert_time:
+            added_notes = self.model_notes.add_notes(notes, self.batch_size)
+        self.batch_timings.extend(added_notes.batch_timings)
+        self.added_contents.extend(
+            (anki_note.content, digest) for anki_note, digest in pending_notes)
+
+        if self.block_notes is not None:
+            if len(added_notes.note_ids) != len(notes):
+                raise RuntimeError(
+                    f'{len(notes)} notes were added, but '
+                    f'{len(added_notes.note_ids)} note ids were returned')
+
+            for anki_note, note_id in zip(notes, added_notes.note_ids):
+                if anki_note.uid is not None:
+                    self.block_notes.record(
+                        anki_note.uid, note_id, anki_note.edit_time)
+
+    def _flush_updates(self) -> None:
+        if not self.pending_updates:
+            return
+
+        pending_updates, self.pending_updates = self.pending_updates, []
+        updates = [
+            (note_id, anki_note) for note_id, anki_note, _ in pending_updates]
+        with self.insert_time:
+            updated_note_ids = set(self.model_notes.update_notes(updates))
+
+        for note_id, anki_note in updates:
+            if note_id in updated_note_ids:
+                self.block_notes.record(
+                    anki_note.uid, note_id, anki_note.edit_time)
+                self.num_notes_updated += 1
+            else:
+                # the note was deleted, and its edited content is recorded
+                # below so that it is not imported again
+                self.block_notes.forget(anki_note.uid)
+
+        self.added_contents.extend(
+            (anki_note.content, digest)
+            for _, anki_note, digest in pending_updates)
+
+    def write(self, added_notes_store: AddedNotesStore):
+        self.flush()
+        with self.insert_time:
+            added_notes_store.add(self.added_contents)
+            if self.block_notes is not None:
+                self.block_notes.write()
+        self.added_contents.clear()
@@ -1,15 +1,45 @@
-from dataclasses import dataclass
-from typing import Any, List, Optional, Union
+from dataclasses import dataclass, fields
+from typing import Any, List, Optional, Tuple, Union
 
 # PyCharm doesn't infer well with:
 # JsonData = Union[None, bool, str, float, int, List['JsonData'], Dict[str, 'JsonData']]
 JsonData = Any
 
 
+def slotted(cls: type) -> type:
+    # Equivalent to dataclass(slots=True), which needs Python 3.10.
+    field_names = tuple(field.name for field in fields(cls))
+    namespace = dict(cls.__dict__)
+    namespace['__slots__'] = field_names
+
+    for name in field_names + ('__dict__', '__weakref__'):
+        namespace.pop(name, None)
+
+    if cls.__dataclass_params__.frozen:
+        namespace['__getstate__'] = _get_frozen_state
+        namespace['__setstate__'] = _set_frozen_state
+
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+def _get_frozen_state(self) -> List[Any]:
+    return [getattr(self, field.name) for field in fields(self)]
+
+
+def _set_frozen_state(self, state: List[Any]) -> None:
+    for field, value in zip(fields(self), state):
+        object.__setattr__(self, field.name, value)
+
+
+@slotted
 @dataclass
 class RoamBlock:
     parts: List['RoamPart']
-    source: str
+    source: 'SourceText'
+    uid: Optional[str] = None
+    edit_time: Optional[int] = None
+    tags: Tuple[str, ...] = ()
+    deck_name: Optional[str] = None
 
 
 RoamPart = Union[
@@ -23,6 +53,7 @@ RoamPart = Union[
 ]
 
 
+@slotted
 @dataclass
 class Cloze:
     parts: List['ClozePart']
@@ -33,33 +64,56 @@ class Cloze:
 ClozePart = Union[str, 'Math', 'CodeBlock', 'CodeInline']
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class Math:
     content: str
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class CodeBlock:
     content: str
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class CodeInline:
     content: str
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class RoamColonCommand:
     command: str
     content: str
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class RoamCurlyCommand:
     content: str
 
 
-@dataclass
+@slotted
+@dataclass(frozen=True)
 class AnkiNote:
     content: str
-    source: str
+    source: 'SourceText'
+    uid: Optional[str] = None
+    edit_time: Optional[int] = None
+    tags: Tuple[str, ...] = ()
+    deck_name: Optional[str] = None
+
+
+@slotted
+@dataclass(frozen=True)
+class SharedSource:
+    shared: str
+    suffix: str
+
+    def __str__(self) -> str:
+        return self.shared + self.suffix
+
+
+SourceText = Union[str, SharedSource]
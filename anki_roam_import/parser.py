@@ -202,39 +202,89 @@ def peek(parser: Parser[T]) -> Parser[bool]:
     return parse
 
 
+def text_without(characters: str) -> Parser[str]:
+    # Parses a run of characters at once, where parsing them one at a time
+    # with any_character would give the same result.
+    pattern = re.compile(f'[^{re.escape(characters)}]+')
+
+    def parser(string: str, start_offset: int) -> ParsedValue[str]:
+        check_start_offset(string, start_offset)
+        if match := pattern.match(string, start_offset):
+            return ParsedValue(match[0], match.end() - start_offset)
+        raise ParseError
+
+    return parser
+
+
+def followed_by(substring: str) -> Parser[None]:
+    # Fails straight away when substring does not occur at or after the
+    # offset, instead of after parsing the rest of the string.
+    last_occurrence = LastOccurrence(substring)
+
+    def parser(string: str, start_offset: int) -> ParsedValue[None]:
+        check_start_offset(string, start_offset)
+        if last_occurrence(string) >= start_offset:
+            return ParsedValue(None, 0)
+        raise ParseError
+
+    return parser
+
+
+class LastOccurrence:
+    # Parsers are tried at many offsets of the same string, so the offset of
+    # the last occurrence of the substring in the latest string is cached.
+
+    def __init__(self, substring: str):
+        self.substring = substring
+        self.cached = (None, -1)
+
+    def __call__(self, string: str) -> int:
+        cached_string, offset = self.cached
+        if cached_string is not string:
+            offset = string.rfind(self.substring)
+            self.cached = (string, offset)
+        return offset
+
+
 def delimited_text(open_delimiter: str, close_delimiter: str) -> Parser[str]:
-    @parser_generator
-    def parser() -> ParserGenerator[str]:
-        yield exact_string(open_delimiter)
+    last_close_delimiter = LastOccurrence(close_delimiter)
 
-        characters = []
+    def parser(string: str, start_offset: int) -> ParsedValue[str]:
+        check_start_offset(string, start_offset)
 
-        while True:
-            try:
-                yield exact_string(close_delimiter)
-            except ParseError:
-                pass
-            else:
-                return ''.join(characters)
+        if not string.startswith(open_delimiter, start_offset):
+            raise ParseError
+
+        text_offset = start_offset + len(open_delimiter)
+        if last_close_delimiter(string) < text_offset:
+            raise ParseError
 
-            character = yield any_character
-            characters.append(character)
+        close_offset = string.find(close_delimiter, text_offset)
+        end_offset = close_offset + len(close_delimiter)
+        return ParsedValue(
+            string[text_offset:close_offset], end_offset - start_offset)
 
     return parser
 
 
 def join_strings(value: Iterable[T]) -> List[T]:
+    # Runs of strings are joined once, since repeatedly appending to a string
+    # takes time proportional to the square of its length.
     values = []
+    strings = []
 
     for sub_value in value:
-        can_join = (
-            values and
-            isinstance(values[-1], str) and
-            isinstance(sub_value, str))
+        if isinstance(sub_value, str):
+            strings.append(sub_value)
+            continue
 
-        if can_join:
-            values[-1] += sub_value
-        else:
-            values.append(sub_value)
+        if strings:
+            values.append(''.join(strings))
+            strings = []
+
+        values.append(sub_value)
+
+    if strings:
+        values.append(''.join(strings))
 
     return values
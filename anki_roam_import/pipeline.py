@@ -0,0 +1,270 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+
+PIPELINE_QUEUE_SIZE = 4
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[Iterable[Any]], Iterable[Any]]
+
+
+@dataclass
+class StageCounter:
+    name: str
+    num_items: int = 0
+    seconds: float = 0.0
+    input_wait_seconds: float = 0.0
+    output_wait_seconds: float = 0.0
+
+    @property
+    def busy_seconds(self) -> float:
+        return max(self.seconds - self.input_wait_seconds, 0.0)
+
+    @property
+    def items_per_second(self) -> float:
+        if not self.busy_seconds:
+            return 0.0
+        return self.num_items / self.busy_seconds
+
+
+class Pipeline:
+    # Each stage runs on its own thread, reading the items produced by the
+    # previous stage from a bounded queue, so that a slow stage holds back
+    # the stages before it instead of letting items pile up in memory. Only
+    # the items in the queues are bounded: a stage may hold much more, e.g.
+    # load_roam_pages reads each JSON file of an export whole. The output of
+    # the last stage is read on the thread which owns the pipeline, either by
+    # iterating over it or by polling. A pipeline which is not threaded runs
+    # every stage on that thread instead.
+
+    def __init__(
+        self,
+        items: Iterable[Any],
+        stages: List[Stage],
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        threaded: bool = True,
+    ):
+        self.items = items
+        self.stages = stages
+        self.queue_size = queue_size
+        self.threaded = threaded
+        self.counters = [StageCounter(stage.name) for stage in stages]
+        self.stopped = threading.Event()
+        self.threads: List[threading.Thread] = []
+        self.output: Optional[queue.Queue] = None
+        self.serial_output: Optional[Iterator[Any]] = None
+        self.done = False
+
+    def __enter__(self) -> 'Pipeline':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def start(self) -> None:
+        if self.output is not None or self.serial_output is not None:
+            return
+
+        if not self.threaded:
+            self.serial_output = self._serial_output()
+            return
+
+        outputs = [
+            queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        inputs = [self.items] + [
+            QueuedItems(output, self.stopped, counter)
+            for output, counter in zip(outputs, self.counters[1:])
+        ]
+
+        for stage, counter, items, output in zip(
+                self.stages, self.counters, inputs, outputs):
+            self.threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(stage, counter, items, output),
+                name=f'pipeline {stage.name}',
+                daemon=True,
+            ))
+
+        self.output = outputs[-1]
+
+        for thread in self.threads:
+            thread.start()
+
+    def close(self) -> None:
+        # Stages notice within one queue timeout that they should stop. A
+        # stage busy with a single long item finishes it first, so the
+        # threads are not joined here.
+        self.stopped.set()
+
+    def __iter__(self) -> Iterable[Any]:
+        self.start()
+
+        if not self.threaded:
+            yield from self.serial_output
+            self.done = True
+            return
+
+        try:
+            yield from QueuedItems(self.output, self.stopped, counter=None)
+        except UpstreamFailure as failure:
+            raise failure.error from None
+        finally:
+            self.done = True
+
+    def poll(self) -> List[Any]:
+        # Returns the output items which are ready, without waiting.
+        self.start()
+        items = []
+
+        if not self.threaded:
+            # one item at a time, so that the reader is not held up for long
+            item = next(self.serial_output, END_OF_ITEMS)
+            if item is END_OF_ITEMS:
+                self.done = True
+            else:
+                items.append(item)
+            return items
+
+        while not self.done:
+            try:
+                item = self.output.get_nowait()
+            except queue.Empty:
+                break
+
+            if item is END_OF_ITEMS:
+                self.done = True
+            elif isinstance(item, StageFailure):
+                self.done = True
+                raise item.error
+            else:
+                items.append(item)
+
+        return items
+
+    def _serial_output(self) -> Iterator[Any]:
+        items = self.items
+        for stage, counter in zip(self.stages, self.counters):
+            items = counted_items(stage.run(items), counter)
+        return iter(items)
+
+    def _run_stage(
+        self,
+        stage: Stage,
+        counter: StageCounter,
+        items: Iterable[Any],
+        output: queue.Queue,
+    ) -> None:
+        try:
+            outputs = iter(stage.run(items))
+
+            while not self.stopped.is_set():
+                start_time = time.perf_counter()
+                try:
+                    item = next(outputs)
+                except StopIteration:
+                    counter.seconds += time.perf_counter() - start_time
+                    break
+                counter.seconds += time.perf_counter() - start_time
+                counter.num_items += 1
+
+                if not self._put(output, item, counter):
+                    return
+
+            self._put(output, END_OF_ITEMS, counter)
+
+        except UpstreamFailure as failure:
+            self._put(output, failure.stage_failure, counter)
+
+        except BaseException as error:
+            self._put(output, StageFailure(stage.name, error), counter)
+
+    def _put(
+        self, output: queue.Queue, item: Any, counter: StageCounter,
+    ) -> bool:
+        start_time = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    output.put(item, timeout=QUEUE_TIMEOUT_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            counter.output_wait_seconds += time.perf_counter() - start_time
+
+
+def counted_items(
+    items: Iterable[Any], counter: StageCounter,
+) -> Iterable[Any]:
+    for item in items:
+        counter.num_items += 1
+        yield item
+
+
+class QueuedItems:
+    # Iterates over the items put in a queue by the previous stage, and
+    # records how long the reading stage waited for them.
+
+    def __init__(
+        self,
+        items: queue.Queue,
+        stopped: threading.Event,
+        counter: Optional[StageCounter],
+    ):
+        self.items = items
+        self.stopped = stopped
+        self.counter = counter
+
+    def __iter__(self) -> Iterable[Any]:
+        while True:
+            item = self._get()
+
+            if item is END_OF_ITEMS:
+                return
+
+            if isinstance(item, StageFailure):
+                raise UpstreamFailure(item)
+
+            yield item
+
+    def _get(self) -> Any:
+        start_time = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return self.items.get(timeout=QUEUE_TIMEOUT_SECONDS)
+                except queue.Empty:
+                    if self.stopped.is_set():
+                        return END_OF_ITEMS
+        finally:
+            if self.counter is not None:
+                self.counter.input_wait_seconds += (
+                    time.perf_counter() - start_time)
+
+
+@dataclass
+class StageFailure:
+    stage_name: str
+    error: BaseException
+
+
+class UpstreamFailure(Exception):
+    def __init__(self, stage_failure: StageFailure):
+        super().__init__(stage_failure.stage_name)
+        self.stage_failure = stage_failure
+
+    @property
+    def error(self) -> BaseException:
+        return self.stage_failure.error
+
+
+END_OF_ITEMS = object()
+QUEUE_TIMEOUT_SECONDS = 0.1
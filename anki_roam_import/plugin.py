@@ -1,9 +1,12 @@
+import time
+from typing import List, Optional
+
 from aqt import mw
-from aqt.qt import QAction
+from aqt.qt import QAction, QProgressDialog, Qt, QTimer
 from aqt.utils import getFile, showInfo
 
 from .anki import AnkiAddonData, AnkiCollection
-from .importer import AnkiNoteImporter
+from .importer import AnkiNoteImporter, ImportProgress, NoteImport
 
 
 def main():
@@ -13,17 +16,144 @@ def main():
 
 
 def import_roam_notes_into_anki():
-    path = getFile(
+    if running_import is not None:
+        showInfo('A Roam import is already running.')
+        return
+
+    # several exports, e.g. of different graphs, can be imported together
+    paths = getFile(
         mw,
-        'Open Roam export',
+        'Open Roam exports',
         cb=None,
         filter='Roam JSON export (*.zip *.json)',
         key='RoamExport',
+        multi=True,
     )
 
-    if not path:
+    if not paths:
         return
 
     importer = AnkiNoteImporter(AnkiAddonData(mw), AnkiCollection(mw.col))
-    info = importer.import_from_path(path)
-    showInfo(info)
+    note_import = importer.start_import(read_existing_notes=False)
+    BackgroundImport(note_import, paths).start()
+
+
+# Qt only keeps weak references to the objects whose methods are connected to
+# signals, so the running import is kept here until it finishes.
+running_import: Optional['BackgroundImport'] = None
+
+
+class BackgroundImport:
+    # The notes already in the collection are read on the main thread, a chunk
+    # at a time between timer events, with the progress dialog showing. Then
+    # the Roam exports are loaded, parsed and formatted by the note pipeline
+    # on worker threads. The main thread polls the pipeline with the timer,
+    # and adds the batches of notes which are ready to the collection.
+
+    def __init__(self, note_import: NoteImport, paths: List[str]):
+        self.note_import = note_import
+        self.progress = ImportProgress()
+        self.existing_notes = iter(note_import.read_existing_notes())
+        self.pipeline = note_import.note_pipeline(paths, self.progress)
+        self.timer = QTimer(mw)
+        self.timer.timeout.connect(self.poll)
+        self.dialog = QProgressDialog(
+            'Importing Roam notes...', 'Cancel', 0, 0, mw)
+        self.dialog.setWindowTitle('Import Roam notes')
+        self.dialog.setWindowModality(Qt.WindowModal)
+        self.dialog.setMinimumDuration(0)
+        self.dialog.canceled.connect(self.progress.cancel)
+
+    def start(self) -> None:
+        global running_import
+        running_import = self
+
+        self.dialog.setLabelText('Reading existing notes...')
+        self.dialog.show()
+        self.timer.start(POLL_INTERVAL_MILLIS)
+
+    def poll(self) -> None:
+        if self.existing_notes is not None:
+            self.read_existing_notes()
+        else:
+            self.add_notes()
+
+    def read_existing_notes(self) -> None:
+        # reads for up to one poll interval, so that Anki stays responsive
+        deadline = time.perf_counter() + POLL_INTERVAL_MILLIS / 1000
+        num_notes = 0
+
+        try:
+            with self.note_import.profiling():
+                for num_notes in self.existing_notes:
+                    if (self.progress.cancelled or
+                            time.perf_counter() >= deadline):
+                        break
+                else:
+                    self.existing_notes = None
+        except BaseException as error:
+            self.finish(error)
+            return
+
+        if self.progress.cancelled:
+            self.note_import.report.cancelled = True
+            self.finish()
+            return
+
+        if self.existing_notes is None:
+            self.pipeline.start()
+            return
+
+        self.dialog.setLabelText(
+            f'Reading existing notes...\n{num_notes} notes read')
+
+    def add_notes(self) -> None:
+        try:
+            with self.note_import.profiling():
+                for anki_notes in self.pipeline.poll():
+                    if self.progress.cancelled:
+                        break
+                    self.note_import.add_notes(anki_notes)
+        except BaseException as error:
+            self.finish(error)
+            return
+
+        if self.progress.cancelled:
+            self.note_import.report.cancelled = True
+            self.finish()
+            return
+
+        if self.pipeline.done:
+            self.finish()
+            return
+
+        self.dialog.setLabelText(
+            f'Importing Roam notes...\n'
+            f'{self.progress.num_pages} pages and '
+            f'{self.progress.num_blocks} blocks read, '
+            f'{self.note_import.report.num_notes_added} new notes imported')
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        global running_import
+        running_import = None
+
+        self.timer.stop()
+        self.pipeline.close()
+        self.dialog.canceled.disconnect(self.progress.cancel)
+        self.dialog.close()
+
+        try:
+            report = self.note_import.finish()
+        finally:
+            mw.reset()
+
+        if error is not None:
+            raise error
+
+        info = str(report)
+        if report.profile_summary:
+            info = f'{info}\n\n{report.profile_summary}'
+        showInfo(info)
+
+
+POLL_INTERVAL_MILLIS = 100
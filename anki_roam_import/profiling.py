@@ -0,0 +1,154 @@
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterator, List, Optional
+
+from .model import JsonData
+
+PROFILE_ENVIRONMENT_VARIABLE = 'ANKI_ROAM_IMPORT_PROFILE'
+
+# profile mode: (profile CPU time, trace memory allocations)
+PROFILE_MODES = {
+    'cpu': (True, False),
+    'memory': (False, True),
+    'all': (True, True),
+}
+
+
+def make_import_profiler(
+    config: JsonData, directory: str,
+) -> Optional['ImportProfiler']:
+    # The environment variable takes precedence, so that an import can be
+    # profiled without changing the add-on's configuration.
+    mode = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or config.get(
+        'profile_import')
+
+    if not mode:
+        return None
+
+    if mode not in PROFILE_MODES:
+        raise ValueError(
+            f'Unknown import profile mode {mode!r}, expected one of '
+            f'{", ".join(PROFILE_MODES)}')
+
+    profile_cpu, trace_memory = PROFILE_MODES[mode]
+    return ImportProfiler(directory, profile_cpu, trace_memory)
+
+
+class ImportProfiler:
+    # Only one thread can be profiled at a time, so imports which profile
+    # CPU time run all their stages on the importing thread.
+
+    def __init__(self, directory: str, profile_cpu: bool, trace_memory: bool):
+        self.directory = directory
+        self.profile = cProfile.Profile() if profile_cpu else None
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        self.depth = 0
+        self.name = time.strftime('import-%Y%m%d-%H%M%S')
+
+    @property
+    def profile_cpu(self) -> bool:
+        return self.profile is not None
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    @contextmanager
+    def profiling(self) -> Iterator[None]:
+        # may be nested, the outermost block enables the profile
+        if self.profile is None:
+            yield
+            return
+
+        if not self.depth:
+            self.profile.enable()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.profile.disable()
+
+    def stop(self) -> str:
+        summary = []
+
+        if self.profile is not None:
+            stats_path = os.path.join(self.directory, f'{self.name}.pstats')
+            stats = pstats.Stats(self.profile)
+            stats.dump_stats(stats_path)
+            summary.append(f'CPU profile saved to {stats_path}')
+            summary.append('Functions with the most time spent in them:')
+            summary.extend(hottest_functions(stats, NUM_HOTTEST_FUNCTIONS))
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            allocations_path = os.path.join(
+                self.directory, f'{self.name}-allocations.txt')
+            write_allocation_report(allocations_path)
+            summary.append(f'Allocation report saved to {allocations_path}')
+
+            if self.started_tracing:
+                tracemalloc.stop()
+
+        return '\n'.join(summary)
+
+    def abort(self) -> None:
+        # Stops profiling without saving anything, when an import fails
+        # before it starts, so that memory is not traced for the rest of the
+        # Anki session.
+        if self.profile is not None:
+            self.profile.disable()
+            self.depth = 0
+
+        if self.started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def profiling(profiler: Optional[ImportProfiler]) -> ContextManager[None]:
+    if profiler is None:
+        return nullcontext()
+    return profiler.profiling()
+
+
+NUM_HOTTEST_FUNCTIONS = 10
+NUM_TOP_ALLOCATIONS = 25
+
+
+def hottest_functions(stats: pstats.Stats, limit: int) -> List[str]:
+    entries = sorted(
+        stats.stats.items(),
+        key=lambda entry: entry[1][2],
+        reverse=True,
+    )
+
+    return [
+        f'{total_time:.3f} s in {function_label(function)} '
+        f'({num_calls} calls)'
+        for function, (_, num_calls, total_time, _, _) in entries[:limit]
+    ]
+
+
+def function_label(function) -> str:
+    file_name, line_number, function_name = function
+    if file_name == '~':
+        # built in functions have no file
+        return function_name
+    return f'{function_name} ({os.path.basename(file_name)}:{line_number})'
+
+
+def write_allocation_report(path: str) -> None:
+    snapshot = tracemalloc.take_snapshot()
+    current_size, peak_size = tracemalloc.get_traced_memory()
+    statistics = snapshot.statistics('lineno')
+
+    with open(path, mode='w', encoding='utf-8') as file:
+        file.write(f'Traced memory: {current_size} bytes, '
+                   f'peak {peak_size} bytes\n\n')
+        for statistic in statistics[:NUM_TOP_ALLOCATIONS]:
+            file.write(f'{statistic}\n')
@@ -0,0 +1,163 @@
+import datetime as dt
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .model import JsonData
+from .pipeline import StageCounter
+
+
+@dataclass
+class StageTime:
+    # Accumulates the time spent inside `with stage_time:` blocks. CPU time
+    # is measured for the current thread, since stages run on different
+    # threads.
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    wall_start: float = field(default=0.0, repr=False, compare=False)
+    cpu_start: float = field(default=0.0, repr=False, compare=False)
+
+    def __enter__(self) -> 'StageTime':
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.wall_seconds += time.perf_counter() - self.wall_start
+        self.cpu_seconds += time.thread_time() - self.cpu_start
+
+    def __sub__(self, other: 'StageTime') -> 'StageTime':
+        return StageTime(
+            max(self.wall_seconds - other.wall_seconds, 0.0),
+            max(self.cpu_seconds - other.cpu_seconds, 0.0),
+        )
+
+    def to_json(self) -> JsonData:
+        return {
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+
+@dataclass
+class Timed:
+    function: Callable[..., Any]
+    stage_time: StageTime
+
+    def __call__(self, *args: Any) -> Any:
+        with self.stage_time:
+            return self.function(*args)
+
+
+STAGE_NAMES = (
+    'load', 'traverse', 'parse', 'format', 'normalize', 'dedupe', 'insert')
+
+
+def make_stage_times() -> Dict[str, StageTime]:
+    return {stage_name: StageTime() for stage_name in STAGE_NAMES}
+
+
+@dataclass
+class ImportReport:
+    num_notes_added: int = 0
+    num_notes_ignored: int = 0
+    num_notes_updated: int = 0
+    num_orphaned_notes: int = 0
+    orphaned_notes_action: Optional[str] = None
+    cancelled: bool = False
+    num_pages: int = 0
+    num_blocks: int = 0
+    num_skipped_blocks: int = 0
+    num_parse_cache_hits: int = 0
+    num_bytes_read: int = 0
+    started_at: float = 0.0
+    wall_seconds: float = 0.0
+    process_peak_rss_bytes: Optional[int] = None
+    insert_batch_seconds: List[float] = field(default_factory=list)
+    profile_summary: Optional[str] = None
+    stage_times: Dict[str, StageTime] = field(default_factory=make_stage_times)
+    stage_counters: List[StageCounter] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        def info():
+            if self.cancelled:
+                yield 'Import cancelled'
+
+            num_notes_found = (
+                self.num_notes_added + self.num_notes_ignored +
+                self.num_notes_updated + self.num_parse_cache_hits +
+                self.num_orphaned_notes)
+            if not num_notes_found:
+                if not self.cancelled:
+                    yield 'No notes found'
+                return
+
+            if self.num_notes_added:
+                yield f'{self.num_notes_added} new notes imported'
+
+            if self.num_notes_updated:
+                yield f'{self.num_notes_updated} notes were updated from edited blocks'
+
+            if self.num_notes_ignored:
+                yield f'{self.num_notes_ignored} notes were imported before and were not imported again'
+
+            if self.num_parse_cache_hits:
+                yield f'{self.num_parse_cache_hits} blocks were not edited since their notes were imported'
+
+            if self.num_orphaned_notes:
+                yield (f'{self.num_orphaned_notes} notes were imported from blocks which were deleted or no longer contain clozes'
+                       f'{ORPHANED_NOTES_ACTIONS.get(self.orphaned_notes_action, "")}')
+
+        return ', '.join(info()) + '.'
+
+    def to_json(self) -> JsonData:
+        return {
+            'started_at': dt.datetime.fromtimestamp(
+                self.started_at, dt.timezone.utc).isoformat(),
+            'wall_seconds': self.wall_seconds,
+            'process_peak_rss_bytes': self.process_peak_rss_bytes,
+            'notes_added': self.num_notes_added,
+            'notes_ignored': self.num_notes_ignored,
+            'notes_updated': self.num_notes_updated,
+            'orphaned_notes': self.num_orphaned_notes,
+            'cancelled': self.cancelled,
+            'pages': self.num_pages,
+            'blocks': self.num_blocks,
+            'skipped_blocks': self.num_skipped_blocks,
+            'parse_cache_hits': self.num_parse_cache_hits,
+            'bytes_read': self.num_bytes_read,
+            'insert_batches': self._insert_batches_json(),
+            'stages': {
+                stage_name: stage_time.to_json()
+                for stage_name, stage_time in self.stage_times.items()
+            },
+            'pipeline': [
+                {
+                    'name': counter.name,
+                    'items': counter.num_items,
+                    'busy_seconds': counter.busy_seconds,
+                    'input_wait_seconds': counter.input_wait_seconds,
+                    'output_wait_seconds': counter.output_wait_seconds,
+                }
+                for counter in self.stage_counters
+            ],
+        }
+
+    def _insert_batches_json(self) -> JsonData:
+        # a summary, since a large import adds thousands of batches
+        batch_seconds = self.insert_batch_seconds
+        return {
+            'count': len(batch_seconds),
+            'max_seconds': max(batch_seconds, default=0.0),
+            'mean_seconds': (
+                sum(batch_seconds) / len(batch_seconds)
+                if batch_seconds else 0.0),
+        }
+
+
+ORPHANED_NOTE_TAG = 'roam_orphan'
+
+ORPHANED_NOTES_ACTIONS = {
+    'tag': f' and were tagged {ORPHANED_NOTE_TAG}',
+    'suspend': ' and were suspended',
+}
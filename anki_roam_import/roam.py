@@ -1,23 +1,31 @@
 import datetime as dt
 import json
+import os.path
 import re
-from dataclasses import dataclass
-from typing import Callable, Iterable, List, Optional, TextIO
+import sys
+from dataclasses import dataclass, field, replace
+from typing import (
+    Callable, Dict, Iterable, List, Mapping, Match, Optional, Pattern,
+    TextIO, Tuple, TypeVar,
+)
 from zipfile import ZipFile, is_zipfile
 
 from .model import (
     Cloze, ClozePart, CodeBlock, CodeInline, JsonData, Math, RoamBlock,
-    RoamColonCommand, RoamCurlyCommand, RoamPart,
+    RoamColonCommand, RoamCurlyCommand, RoamPart, SharedSource, SourceText,
 )
 from .parser import (
     ParserGenerator, any_character, choose, delimited_text,
-    exact_character_once_only, exact_string, full_parser, join_strings,
-    nonnegative_integer, optional, parser_generator, peek, rest_of_string,
-    start_of_string, zero_or_more,
+    exact_character_once_only, exact_string, followed_by, full_parser,
+    join_strings, nonnegative_integer, optional, parser_generator, peek,
+    rest_of_string, start_of_string, text_without, zero_or_more,
 )
+from .report import StageTime, Timed
 
 
 def load_roam_pages(path: str) -> Iterable[JsonData]:
+    # Each JSON file is parsed whole, so the pages of the largest file are
+    # all in memory at once, however small the pipeline queues are.
     for file in generate_json_files(path):
         yield from json.load(file)
 
@@ -36,6 +44,34 @@ def generate_json_files(path: str) -> Iterable[TextIO]:
         raise RuntimeError(f'Unknown file type: {path!r}')
 
 
+def roam_export_size(path: str) -> int:
+    if is_json_path(path):
+        return os.path.getsize(path)
+    elif is_zipfile(path):
+        with ZipFile(path) as zip_file:
+            return sum(
+                info.file_size
+                for info in zip_file.infolist()
+                if is_json_path(info.filename))
+    else:
+        raise RuntimeError(f'Unknown file type: {path!r}')
+
+
+def roam_graph_name(path: str) -> str:
+    # Roam names the JSON file in an export after the graph, while the name
+    # of the ZIP file changes with each export.
+    if is_json_path(path):
+        names = [path]
+    elif is_zipfile(path):
+        with ZipFile(path) as zip_file:
+            names = [name for name in zip_file.namelist() if is_json_path(name)]
+    else:
+        raise RuntimeError(f'Unknown file type: {path!r}')
+
+    return ', '.join(
+        os.path.splitext(os.path.basename(name))[0] for name in names)
+
+
 def is_json_path(path: str) -> bool:
     return path.lower().endswith('.json')
 
@@ -43,52 +79,218 @@ def is_json_path(path: str) -> bool:
 @dataclass
 class BlockExtractor:
     roam_block_builder: 'RoamBlockBuilder'
+    block_filter: Optional['BlockFilter'] = None
+    num_pages: int = field(default=0, init=False, compare=False)
+    num_blocks: int = field(default=0, init=False, compare=False)
 
     def __call__(self, roam_pages: Iterable[JsonData]) -> Iterable[RoamBlock]:
+        yield from self.extract_blocks(roam_pages)
+        yield from self.deferred_blocks()
+
+    def extract_blocks(
+        self, roam_pages: Iterable[JsonData],
+    ) -> Iterable[RoamBlock]:
+        # Blocks which refer to blocks on later pages are deferred until
+        # deferred_blocks is called, after the last page.
+        block_filter = self.block_filter
+
         for page in roam_pages:
-            yield from self.extract_blocks_from_children(page, [])
+            self.num_pages += 1
+
+            if block_filter is None or block_filter.includes_page(page):
+                yield from self.extract_blocks_from_children(page, [])
+
+    def deferred_blocks(self) -> Iterable[RoamBlock]:
+        block_reference_resolver = (
+            self.roam_block_builder.block_reference_resolver)
+        if block_reference_resolver is None:
+            return []
+        return block_reference_resolver.resolve_deferred_blocks()
 
     def extract_blocks_from_children(
         self,
         page_or_block: JsonData,
         parents: List[JsonData],
     ) -> Iterable[RoamBlock]:
-
+        # Blocks are visited depth first with a stack of iterators instead of
+        # recursion, so that deeply nested blocks don't pass each note up
+        # through a generator for every level.
         if 'children' not in page_or_block:
             return
 
+        block_filter = self.block_filter
+
         parents.append(page_or_block)
+        stack = [iter(page_or_block['children'])]
+        # whether the blocks at each depth are in an included subtree
+        included = [
+            block_filter is None or block_filter.includes_tree(page_or_block)]
+
+        while stack:
+            block = next(stack[-1], None)
+
+            if block is None:
+                stack.pop()
+                parents.pop()
+                included.pop()
+                continue
+
+            if block_filter is not None and block_filter.excludes_block(block):
+                # the block's children are not visited either
+                continue
+
+            self.num_blocks += 1
+
+            block_included = (
+                included[-1] or block_filter.includes_block(block))
+
+            if block_included:
+                roam_block = self.roam_block_builder(block, parents)
+                if roam_block:
+                    yield roam_block
+
+            if 'children' in block:
+                parents.append(block)
+                stack.append(iter(block['children']))
+                included.append(block_included)
+
+
+@dataclass
+class BlockFilter:
+    # Pages are included or excluded by matching their titles, and subtrees
+    # of blocks by the tags and page references in the strings of their
+    # roots, each with a single regular expression.
+    include_pages: Optional[Pattern[str]] = None
+    exclude_pages: Optional[Pattern[str]] = None
+    include_tags: Optional[Pattern[str]] = None
+    exclude_tags: Optional[Pattern[str]] = None
+
+    def includes_page(self, page: JsonData) -> bool:
+        title = page['title']
+
+        if self.include_pages is not None:
+            if not self.include_pages.fullmatch(title):
+                return False
+
+        if self.exclude_pages is not None:
+            if self.exclude_pages.fullmatch(title):
+                return False
+
+        return True
+
+    def includes_tree(self, page: JsonData) -> bool:
+        # With included tags, a page's blocks are only all included when the
+        # page is one of the tags.
+        if self.include_tags is None:
+            return True
+        return self.include_tags.fullmatch(f'[[{page["title"]}]]') is not None
+
+    def includes_block(self, block: JsonData) -> bool:
+        if self.include_tags is None:
+            return True
+        return self.include_tags.search(block['string']) is not None
+
+    def excludes_block(self, block: JsonData) -> bool:
+        if self.exclude_tags is None:
+            return False
+        return self.exclude_tags.search(block['string']) is not None
+
+
+def make_block_filter(config: JsonData) -> Optional[BlockFilter]:
+    block_filter = BlockFilter(
+        include_pages=title_pattern(config.get('include_pages')),
+        exclude_pages=title_pattern(config.get('exclude_pages')),
+        include_tags=tag_pattern(config.get('include_tags')),
+        exclude_tags=tag_pattern(config.get('exclude_tags')),
+    )
+
+    if block_filter == BlockFilter():
+        return None
+
+    return block_filter
+
+
+def title_pattern(patterns: Optional[List[str]]) -> Optional[Pattern[str]]:
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
 
-        for block in page_or_block['children']:
-            roam_block = self.roam_block_builder(block, parents)
-            if roam_block:
-                yield roam_block
 
-            yield from self.extract_blocks_from_children(block, parents)
+def tag_pattern(tags: Optional[List[str]]) -> Optional[Pattern[str]]:
+    # Matches #tag, #[[tag]] and [[tag]] for any of the tags. Longer tags
+    # are tried first, so that a tag which starts with another tag matches.
+    # A #tag must start a word, so that e.g. the fragment of a URL is not a
+    # tag.
+    if not tags:
+        return None
 
-        parents.pop()
+    names = '|'.join(map(re.escape, sorted(tags, key=len, reverse=True)))
+    return re.compile(
+        rf'#?\[\[(?:{names})\]\]|(?<![^\s(])#(?:{names})(?![\w/-])')
 
 
 @dataclass
 class RoamBlockBuilder:
     roam_parser: 'Callable[[str], List[RoamPart]]'
     source_builder: 'SourceBuilder'
+    # edit times of blocks when their notes were imported, keyed by block uid
+    imported_edit_times: Optional[Mapping[str, Optional[int]]] = None
+    # the graph of each block which contains clozes is added to this dict,
+    # keyed by block uid
+    cloze_block_graphs: Optional[Dict[str, str]] = None
+    block_reference_resolver: Optional['BlockReferenceResolver'] = None
+    tag_finder: Optional['TagFinder'] = None
+    deck_router: Optional['DeckRouter'] = None
+    # the name of the graph whose pages are being read
+    graph: str = ''
+    num_unchanged_blocks: int = field(default=0, init=False, compare=False)
 
     def __call__(
         self, block: JsonData, parents: List[JsonData],
     ) -> Optional[RoamBlock]:
         string = block['string']
 
+        if self.block_reference_resolver is not None:
+            self.block_reference_resolver.add_block(block)
+
         if not might_contain_cloze(string):
             return None
 
+        uid = block.get('uid')
+        edit_time = block.get('edit-time')
+
+        if self.is_unchanged(uid, edit_time):
+            # the block's note was imported since it was last edited
+            self.num_unchanged_blocks += 1
+            self.add_cloze_block_uid(uid)
+            return None
+
         parts = self.roam_parser(string)
 
         if not contains_cloze(parts):
             return None
 
+        self.add_cloze_block_uid(uid)
         source = self.source_builder(block, parents)
-        return RoamBlock(parts, source)
+        tags = () if self.tag_finder is None else self.tag_finder(block, parents)
+        deck_name = (
+            None if self.deck_router is None
+            else self.deck_router(parents[0]['title']))
+        roam_block = RoamBlock(parts, source, uid, edit_time, tags, deck_name)
+
+        if self.block_reference_resolver is not None:
+            return self.block_reference_resolver(roam_block)
+
+        return roam_block
+
+    def is_unchanged(self, uid: Optional[str], edit_time: Optional[int]) -> bool:
+        if self.imported_edit_times is None or edit_time is None:
+            return False
+        return self.imported_edit_times.get(uid) == edit_time
+
+    def add_cloze_block_uid(self, uid: Optional[str]) -> None:
+        if self.cloze_block_graphs is not None and uid is not None:
+            self.cloze_block_graphs[uid] = self.graph
 
 
 def might_contain_cloze(string: str) -> bool:
@@ -99,11 +301,145 @@ def contains_cloze(parts: List[RoamPart]) -> bool:
     return any(isinstance(part, Cloze) for part in parts)
 
 
+MAX_BLOCK_REFERENCE_DEPTH = 5
+T = TypeVar('T')
+
+
+@dataclass
+class BlockReferenceResolver:
+    # Replaces ((uid)) block references in the text of cloze notes with the
+    # text of the referenced blocks. The strings of blocks are indexed by uid
+    # as the blocks are extracted, so notes which refer to blocks which have
+    # not been extracted yet are deferred until the last page.
+    max_depth: int = MAX_BLOCK_REFERENCE_DEPTH
+    block_strings: Dict[str, str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    deferred_blocks: List[RoamBlock] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+
+    def add_block(self, block: JsonData) -> None:
+        uid = block.get('uid')
+        if uid is not None:
+            self.block_strings[uid] = block['string']
+
+    def __call__(self, roam_block: RoamBlock) -> Optional[RoamBlock]:
+        missing_uids = []
+        resolved_block = self.resolve(roam_block, missing_uids)
+
+        if missing_uids:
+            self.deferred_blocks.append(roam_block)
+            return None
+
+        return resolved_block
+
+    def resolve_deferred_blocks(self) -> Iterable[RoamBlock]:
+        # references to blocks which are not in the export are left as they are
+        deferred_blocks, self.deferred_blocks = self.deferred_blocks, []
+        for roam_block in deferred_blocks:
+            yield self.resolve(roam_block, [])
+
+    def resolve(
+        self, roam_block: RoamBlock, missing_uids: List[str],
+    ) -> RoamBlock:
+        visiting = () if roam_block.uid is None else (roam_block.uid,)
+
+        def resolve_parts(parts: List[T]) -> List[T]:
+            return [
+                self.expand(part, visiting, 0, missing_uids)
+                if isinstance(part, str) else part
+                for part in parts
+            ]
+
+        parts = [
+            replace(part, parts=resolve_parts(part.parts))
+            if isinstance(part, Cloze) else part
+            for part in resolve_parts(roam_block.parts)
+        ]
+
+        return replace(roam_block, parts=parts)
+
+    def expand(
+        self,
+        string: str,
+        visiting: Tuple[str, ...],
+        depth: int,
+        missing_uids: List[str],
+    ) -> str:
+        # References which would form a cycle, or are nested more than
+        # max_depth deep, are left as they are.
+        if '((' not in string:
+            return string
+
+        def expand_reference(match: Match[str]) -> str:
+            uid = match['uid']
+            referenced_string = self.block_strings.get(uid)
+
+            if referenced_string is None:
+                missing_uids.append(uid)
+                return match[0]
+
+            if uid in visiting or depth >= self.max_depth:
+                return match[0]
+
+            return self.expand(
+                referenced_string, visiting + (uid,), depth + 1, missing_uids)
+
+        return BLOCK_REFERENCE.sub(expand_reference, string)
+
+
+BLOCK_REFERENCE = re.compile(r'\(\((?P<uid>[\w-]+)\)\)')
+
+
+@dataclass
+class DeckRouter:
+    # Chooses the deck for the notes from a page by the first rule whose
+    # pattern matches the whole page title, or else from the namespace of
+    # the title, e.g. Biology/Cells -> Biology::Cells. The deck of each title
+    # is only chosen once.
+    rules: List[Tuple[Pattern[str], str]] = field(default_factory=list)
+    namespaces: bool = False
+    page_decks: Dict[str, Optional[str]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def __call__(self, title: str) -> Optional[str]:
+        try:
+            return self.page_decks[title]
+        except KeyError:
+            deck_name = self.page_decks[title] = self.deck_name(title)
+            return deck_name
+
+    def deck_name(self, title: str) -> Optional[str]:
+        for pattern, deck_name in self.rules:
+            match = pattern.fullmatch(title)
+            if match:
+                return sys.intern(match.expand(deck_name))
+
+        if self.namespaces and '/' in title:
+            return sys.intern('::'.join(
+                part.strip() for part in title.split('/') if part.strip()))
+
+        return None
+
+
+def make_deck_router(config: JsonData) -> Optional[DeckRouter]:
+    rules = [
+        (re.compile(pattern), deck_name)
+        for pattern, deck_name in config.get('page_decks') or []
+    ]
+    namespaces = config.get('namespace_decks', False)
+
+    if not rules and not namespaces:
+        return None
+
+    return DeckRouter(rules, namespaces)
+
+
 @full_parser
 @parser_generator
 def parse_roam_block() -> ParserGenerator[List[RoamPart]]:
     roam_part = choose(
         roam_colon_command,
+        PLAIN_TEXT,
         roam_curly_command,
         cloze,
         math,
@@ -115,6 +451,10 @@ def parse_roam_block() -> ParserGenerator[List[RoamPart]]:
     return join_strings(roam_parts)
 
 
+# text which cannot start any other part of a block
+PLAIN_TEXT = text_without('{$`')
+
+
 @parser_generator
 def roam_colon_command() -> ParserGenerator[RoamCurlyCommand]:
     yield start_of_string
@@ -132,13 +472,17 @@ def roam_curly_command() -> ParserGenerator[RoamCurlyCommand]:
     # Roam currently parses differently, e.g.
     # {{{}} -> RoamCurlyCommand('{')
     # {{}}} -> RoamCurlyCommand('}')
-    text = yield delimited_text('{{', '}}')
+    text = yield CURLY_COMMAND_TEXT
     return RoamCurlyCommand(text)
 
 
+CURLY_COMMAND_TEXT = delimited_text('{{', '}}')
+
+
 @parser_generator
 def cloze() -> ParserGenerator[Cloze]:
     yield exact_character_once_only('{')
+    yield CLOZE_IS_CLOSED
     number = yield optional(cloze_number)
     content = yield cloze_content
     hint = yield optional(cloze_hint)
@@ -147,6 +491,9 @@ def cloze() -> ParserGenerator[Cloze]:
     return Cloze(content, hint, number)
 
 
+CLOZE_IS_CLOSED = followed_by('}')
+
+
 @parser_generator
 def end_of_cloze() -> ParserGenerator[str]:
     return (yield exact_character_once_only('}'))
@@ -165,6 +512,7 @@ def cloze_content() -> ParserGenerator[List[ClozePart]]:
             return join_strings(parts)
 
         part = yield choose(
+            PLAIN_CLOZE_TEXT,
             math,
             code_block,
             code_inline,
@@ -173,6 +521,9 @@ def cloze_content() -> ParserGenerator[List[ClozePart]]:
         parts.append(part)
 
 
+PLAIN_CLOZE_TEXT = text_without('|}$`')
+
+
 @parser_generator
 def cloze_hint() -> ParserGenerator[str]:
     yield exact_string('|')
@@ -182,8 +533,11 @@ def cloze_hint() -> ParserGenerator[str]:
         if (yield peek(end_of_cloze)):
             return ''.join(characters)
 
-        character = yield any_character
-        characters.append(character)
+        text = yield choose(PLAIN_HINT_TEXT, any_character)
+        characters.append(text)
+
+
+PLAIN_HINT_TEXT = text_without('}')
 
 
 @parser_generator
@@ -196,31 +550,39 @@ def cloze_number() -> ParserGenerator[int]:
 
 @parser_generator
 def math() -> ParserGenerator[Math]:
-    delimiter = '$$'
-    text = yield delimited_text(delimiter, delimiter)
+    text = yield MATH_TEXT
     return Math(text)
 
 
+MATH_TEXT = delimited_text('$$', '$$')
+
+
 @parser_generator
 def code_block() -> ParserGenerator[CodeBlock]:
-    delimiter = '```'
-    text = yield delimited_text(delimiter, delimiter)
+    text = yield CODE_BLOCK_TEXT
     return CodeBlock(text)
 
 
+CODE_BLOCK_TEXT = delimited_text('```', '```')
+
+
 @parser_generator
 def code_inline() -> ParserGenerator[CodeInline]:
-    delimiter = '`'
-    text = yield delimited_text(delimiter, delimiter)
+    text = yield CODE_INLINE_TEXT
     return CodeInline(text)
 
 
+CODE_INLINE_TEXT = delimited_text('`', '`')
+
+
 @dataclass
 class SourceBuilder:
     source_finder: 'SourceFinder'
     source_formatter: 'SourceFormatter'
 
-    def __call__(self, block: JsonData, parents: List[JsonData]) -> str:
+    def __call__(
+        self, block: JsonData, parents: List[JsonData],
+    ) -> SourceText:
         source = self.source_finder(block, parents)
         page = parents[0]
         return self.source_formatter(block, source, page)
@@ -229,6 +591,11 @@ class SourceBuilder:
 @dataclass
 class SourceFinder:
     source_extractor: 'SourceExtractor'
+    # the parents of the previous block, and the nearest source at each depth
+    ancestors: List[JsonData] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+    ancestor_sources: List[Optional[str]] = field(
+        default_factory=list, init=False, repr=False, compare=False)
 
     def __call__(
         self, block: JsonData, parents: List[JsonData],
@@ -253,13 +620,27 @@ class SourceFinder:
         return None
 
     def find_source_in_parents(self, parents: List[JsonData]) -> Optional[str]:
-        for parent in reversed(parents):
-            source = self.source_extractor(parent)
+        ancestors = self.ancestors
+        sources = self.ancestor_sources
 
-            if source is not None:
-                return source
+        # Consecutive blocks usually share most of their parents. Blocks form
+        # a tree, so where the same block is at the same depth, the parents
+        # above it are the same too.
+        depth = min(len(ancestors), len(parents))
+        while depth and ancestors[depth - 1] is not parents[depth - 1]:
+            depth -= 1
 
-        return None
+        del ancestors[depth:]
+        del sources[depth:]
+
+        for parent in parents[depth:]:
+            source = self.source_extractor(parent)
+            if source is None and sources:
+                source = sources[-1]
+            ancestors.append(parent)
+            sources.append(source)
+
+        return sources[-1] if sources else None
 
 
 class SourceExtractor:
@@ -271,7 +652,7 @@ class SourceExtractor:
         match = SOURCE_PATTERN.search(string)
 
         if match:
-            return match['source']
+            return sys.intern(match['source'])
 
         return None
 
@@ -291,48 +672,279 @@ SOURCE_PATTERN = re.compile(
 )
 
 
+@dataclass
+class TagFinder:
+    # Tags of a block are the pages it refers to, and the values of tags::
+    # attributes in its children, together with the tags of its parents.
+    # The tags of the parents of the previous block are kept, like the
+    # sources in SourceFinder, so each parent's tags are found once.
+    ancestors: List[JsonData] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+    ancestor_tags: List[Tuple[str, ...]] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+
+    def __call__(
+        self, block: JsonData, parents: List[JsonData],
+    ) -> Tuple[str, ...]:
+        return with_tags(self.tags_of_parents(parents), block_tags(block))
+
+    def tags_of_parents(self, parents: List[JsonData]) -> Tuple[str, ...]:
+        ancestors = self.ancestors
+        ancestor_tags = self.ancestor_tags
+
+        depth = min(len(ancestors), len(parents))
+        while depth and ancestors[depth - 1] is not parents[depth - 1]:
+            depth -= 1
+
+        del ancestors[depth:]
+        del ancestor_tags[depth:]
+
+        for parent in parents[depth:]:
+            inherited_tags = ancestor_tags[-1] if ancestor_tags else ()
+            ancestors.append(parent)
+            ancestor_tags.append(with_tags(inherited_tags, block_tags(parent)))
+
+        return ancestor_tags[-1] if ancestor_tags else ()
+
+
+def with_tags(
+    tags: Tuple[str, ...], new_tags: Iterable[str],
+) -> Tuple[str, ...]:
+    # the same tuple is returned when there are no new tags, so that blocks
+    # with the same tags share them
+    added_tags = tuple(tag for tag in dict.fromkeys(new_tags) if tag not in tags)
+    if not added_tags:
+        return tags
+    return tags + added_tags
+
+
+def block_tags(page_or_block: JsonData) -> Iterable[str]:
+    if 'string' in page_or_block:
+        yield from referenced_tags(page_or_block['string'])
+
+    for child in page_or_block.get('children', ()):
+        match = TAGS_ATTRIBUTE.match(child['string'])
+        if match:
+            yield from attribute_tags(match['tags'])
+
+
+TAGS_ATTRIBUTE = re.compile(
+    r'\s*tags\s*::(?P<tags>.*)', flags=re.IGNORECASE | re.DOTALL)
+
+
+def referenced_tags(string: str) -> Iterable[str]:
+    if '#' not in string and '[[' not in string:
+        return
+
+    for match in TAG_REFERENCE.finditer(string):
+        yield anki_tag(match['page'] or match['tag'])
+
+
+# a #tag must start a word, so that e.g. the fragment of a URL is not a tag
+TAG_REFERENCE = re.compile(
+    r'#?\[\[(?P<page>[^\[\]]+)\]\]|(?<![^\s(])#(?P<tag>[\w/-]+)')
+
+
+def attribute_tags(value: str) -> Iterable[str]:
+    # e.g. tags:: [[page]], #tag, plain text
+    yield from referenced_tags(value)
+
+    for name in TAG_REFERENCE.sub(',', value).split(','):
+        name = name.strip()
+        if name:
+            yield anki_tag(name)
+
+
+def anki_tag(name: str) -> str:
+    # Anki tags are separated by spaces
+    return sys.intern('_'.join(name.split()))
+
+
 @dataclass
 class SourceFormatter:
     time_formatter: 'TimeFormatter'
+    compact: bool = False
+    shared_sources: Dict[Tuple[Optional[str], str], str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
 
     def __call__(
         self, block: JsonData, source: Optional[str], page: JsonData,
-    ) -> str:
-        title = page['title']
-        formatted_source = f"Note from Roam page '{title}'"
+    ) -> SourceText:
+        shared_source = self.shared_source(source, sys.intern(page['title']))
+        suffix = ''
 
         if 'create-time' in block:
             create_time = self.time_formatter(block['create-time'])
-            formatted_source += f', created at {create_time}'
+            suffix += f', created at {create_time}'
 
         if 'edit-time' in block:
             edit_time = self.time_formatter(block['edit-time'])
-            formatted_source += f', edited at {edit_time}'
+            suffix += f', edited at {edit_time}'
 
-        formatted_source += '.'
+        suffix += '.'
 
-        if source is not None:
-            formatted_source = f'{source}\n{formatted_source}'
+        if self.compact:
+            return SharedSource(shared_source, suffix)
 
-        return formatted_source
+        return shared_source + suffix
+
+    def shared_source(self, source: Optional[str], title: str) -> str:
+        key = source, title
+        shared_source = self.shared_sources.get(key)
+
+        if shared_source is None:
+            shared_source = f"Note from Roam page '{title}'"
+            if source is not None:
+                shared_source = f'{source}\n{shared_source}'
+            shared_source = sys.intern(shared_source)
+            self.shared_sources[key] = shared_source
+
+        return shared_source
 
 
 @dataclass
 class TimeFormatter:
     time_zone: Optional[dt.tzinfo]
+    cache_size: int = 4096
+    formatted_times: Dict[int, str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    zone_offsets: Dict[int, Optional['ZoneOffset']] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    dates: Dict[int, str] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
 
     def __call__(self, timestamp_millis: int) -> str:
+        formatted_time = self.formatted_times.get(timestamp_millis)
+
+        if formatted_time is None:
+            formatted_time = self.format_uncached(timestamp_millis)
+            if len(self.formatted_times) >= self.cache_size:
+                self.formatted_times.clear()
+            self.formatted_times[timestamp_millis] = formatted_time
+
+        return formatted_time
+
+    def format_timestamps(self, timestamps_millis: Iterable[int]) -> List[str]:
+        return list(map(self, timestamps_millis))
+
+    def format_uncached(self, timestamp_millis: int) -> str:
+        if not isinstance(timestamp_millis, int):
+            return self.format_with_datetime(timestamp_millis)
+
+        zone_offset = self.zone_offset(timestamp_millis)
+        if zone_offset is None:
+            return self.format_with_datetime(timestamp_millis)
+
+        local_millis = timestamp_millis + zone_offset.offset_millis
+        days, millis_of_day = divmod(local_millis, MILLIS_PER_DAY)
+        hours, millis_of_hour = divmod(millis_of_day, MILLIS_PER_HOUR)
+        minutes, millis_of_minute = divmod(millis_of_hour, MILLIS_PER_MINUTE)
+        seconds, millis = divmod(millis_of_minute, MILLIS_PER_SECOND)
+
+        return '%sT%02d:%02d:%02d.%03d%s' % (
+            self.date(days), hours, minutes, seconds, millis,
+            zone_offset.formatted_offset)
+
+    def zone_offset(self, timestamp_millis: int) -> Optional['ZoneOffset']:
+        # Zone offsets only change at transitions, which are months apart, so
+        # they are cached for intervals which have the same offset at both
+        # ends. Intervals containing a transition are formatted exactly.
+        interval = timestamp_millis // ZONE_OFFSET_INTERVAL_MILLIS
+
+        try:
+            return self.zone_offsets[interval]
+        except KeyError:
+            pass
+
+        interval_start = interval * ZONE_OFFSET_INTERVAL_MILLIS
+        interval_end = interval_start + ZONE_OFFSET_INTERVAL_MILLIS - 1
+        start_offset = self.exact_zone_offset(interval_start)
+
+        if start_offset != self.exact_zone_offset(interval_end):
+            start_offset = None
+
+        if len(self.zone_offsets) >= self.cache_size:
+            self.zone_offsets.clear()
+        self.zone_offsets[interval] = start_offset
+
+        return start_offset
+
+    def exact_zone_offset(self, timestamp_millis: int) -> Optional['ZoneOffset']:
+        local_zone_datetime = self.local_zone_datetime(timestamp_millis)
+        offset_millis, remainder = divmod(
+            local_zone_datetime.utcoffset(), dt.timedelta(milliseconds=1))
+
+        if remainder:
+            return None
+
+        formatted_datetime = local_zone_datetime.isoformat(
+            timespec='milliseconds')
+        formatted_offset = formatted_datetime[len('YYYY-MM-DDThh:mm:ss.sss'):]
+        return ZoneOffset(offset_millis, formatted_offset)
+
+    def date(self, days_since_epoch: int) -> str:
+        date = self.dates.get(days_since_epoch)
+
+        if date is None:
+            date = (EPOCH_DATE + dt.timedelta(days=days_since_epoch)).isoformat()
+            if len(self.dates) >= self.cache_size:
+                self.dates.clear()
+            self.dates[days_since_epoch] = date
+
+        return date
+
+    def format_with_datetime(self, timestamp_millis: int) -> str:
+        local_zone_datetime = self.local_zone_datetime(timestamp_millis)
+        return local_zone_datetime.isoformat(timespec='milliseconds')
+
+    def local_zone_datetime(self, timestamp_millis: int) -> dt.datetime:
         timestamp_seconds = timestamp_millis / 1e3
         utc_datetime = dt.datetime.fromtimestamp(
             timestamp_seconds, dt.timezone.utc)
-        local_zone_datetime = utc_datetime.astimezone(self.time_zone)
-        return local_zone_datetime.isoformat(timespec='milliseconds')
-
-
-extract_roam_blocks = BlockExtractor(RoamBlockBuilder(
-    parse_roam_block,
-    SourceBuilder(
-        SourceFinder(SourceExtractor()),
-        SourceFormatter(TimeFormatter(time_zone=None)),
-    ),
-))
+        return utc_datetime.astimezone(self.time_zone)
+
+
+@dataclass(frozen=True)
+class ZoneOffset:
+    offset_millis: int
+    formatted_offset: str
+
+
+MILLIS_PER_SECOND = 1000
+MILLIS_PER_MINUTE = 60 * MILLIS_PER_SECOND
+MILLIS_PER_HOUR = 60 * MILLIS_PER_MINUTE
+MILLIS_PER_DAY = 24 * MILLIS_PER_HOUR
+ZONE_OFFSET_INTERVAL_MILLIS = MILLIS_PER_DAY
+EPOCH_DATE = dt.date(1970, 1, 1)
+
+
+def make_block_extractor(
+    compact_sources: bool = False,
+    parse_time: Optional[StageTime] = None,
+    imported_edit_times: Optional[Mapping[str, Optional[int]]] = None,
+    cloze_block_graphs: Optional[Dict[str, str]] = None,
+    resolve_block_references: bool = False,
+    block_filter: Optional[BlockFilter] = None,
+    import_tags: bool = False,
+    deck_router: Optional[DeckRouter] = None,
+) -> BlockExtractor:
+    roam_parser = parse_roam_block
+    if parse_time is not None:
+        roam_parser = Timed(roam_parser, parse_time)
+
+    return BlockExtractor(RoamBlockBuilder(
+        roam_parser,
+        SourceBuilder(
+            SourceFinder(SourceExtractor()),
+            SourceFormatter(
+                TimeFormatter(time_zone=None), compact=compact_sources),
+        ),
+        imported_edit_times,
+        cloze_block_graphs,
+        BlockReferenceResolver() if resolve_block_references else None,
+        TagFinder() if import_tags else None,
+        deck_router,
+    ), block_filter)
+
+
+extract_roam_blocks = make_block_extractor()
@@ -0,0 +1,166 @@
+import json
+import os
+import statistics
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from .model import JsonData
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+RUN_LOG_MAX_BYTES = 1024 * 1024
+RUN_LOG_BACKUPS = 3
+
+
+class RunLog:
+    # One JSON line per import. When the log grows past max_bytes it is
+    # rotated like logging.handlers.RotatingFileHandler does, keeping the
+    # most recent backups as run_log.jsonl.1, run_log.jsonl.2, ...
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = RUN_LOG_MAX_BYTES,
+        num_backups: int = RUN_LOG_BACKUPS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.num_backups = num_backups
+
+    def append(self, entry: JsonData) -> None:
+        line = json.dumps(entry, sort_keys=True) + '\n'
+
+        if self._size() + len(line.encode('utf-8')) > self.max_bytes:
+            self._rotate()
+
+        with open(self.path, mode='a', encoding='utf-8') as file:
+            file.write(line)
+
+    def _size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _rotate(self) -> None:
+        if not self._size():
+            return
+
+        for index in range(self.num_backups - 1, 0, -1):
+            backup_path = self._backup_path(index)
+            if os.path.isfile(backup_path):
+                os.replace(backup_path, self._backup_path(index + 1))
+
+        if self.num_backups:
+            os.replace(self.path, self._backup_path(1))
+        else:
+            os.remove(self.path)
+
+    def _backup_path(self, index: int) -> str:
+        return f'{self.path}.{index}'
+
+    def entries(self) -> Iterable[JsonData]:
+        # Oldest entries first. Lines which cannot be read, for example
+        # because Anki was closed while one was being written, are skipped.
+        paths = [
+            self._backup_path(index)
+            for index in range(self.num_backups, 0, -1)
+        ] + [self.path]
+
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict):
+                        yield entry
+
+
+def process_peak_rss_bytes() -> Optional[int]:
+    # The peak since the process started, which inside Anki includes the
+    # memory used before the import, so it can't be compared between runs.
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+@dataclass
+class RunSummary:
+    num_runs: int
+    median_seconds: float
+    latest_seconds: float
+    median_blocks_per_second: float
+    latest_blocks_per_second: float
+    median_stage_seconds: Dict[str, float]
+    latest_stage_seconds: Dict[str, float]
+    max_process_peak_rss_bytes: Optional[int]
+
+    @property
+    def latest_slowdown(self) -> float:
+        # how many times slower the latest run was than the median run
+        if not self.median_seconds:
+            return 0.0
+        return self.latest_seconds / self.median_seconds
+
+
+def summarize_runs(entries: Iterable[JsonData]) -> Optional[RunSummary]:
+    entries = [entry for entry in entries if 'wall_seconds' in entry]
+    if not entries:
+        return None
+
+    latest = entries[-1]
+    stage_names = list(latest.get('stages', {}))
+    peak_rss = [
+        entry['process_peak_rss_bytes']
+        for entry in entries
+        if entry.get('process_peak_rss_bytes') is not None
+    ]
+
+    return RunSummary(
+        num_runs=len(entries),
+        median_seconds=statistics.median(
+            entry['wall_seconds'] for entry in entries),
+        latest_seconds=latest['wall_seconds'],
+        median_blocks_per_second=statistics.median(
+            map(blocks_per_second, entries)),
+        latest_blocks_per_second=blocks_per_second(latest),
+        median_stage_seconds={
+            stage_name: statistics.median(stage_seconds(entries, stage_name))
+            for stage_name in stage_names
+        },
+        latest_stage_seconds={
+            stage_name: stage_seconds([latest], stage_name)[0]
+            for stage_name in stage_names
+        },
+        max_process_peak_rss_bytes=max(peak_rss) if peak_rss else None,
+    )
+
+
+def blocks_per_second(entry: JsonData) -> float:
+    if not entry['wall_seconds']:
+        return 0.0
+    return entry.get('blocks', 0) / entry['wall_seconds']
+
+
+def stage_seconds(entries: List[JsonData], stage_name: str) -> List[float]:
+    return [
+        entry.get('stages', {}).get(stage_name, {}).get('wall_seconds', 0.0)
+        for entry in entries
+    ]
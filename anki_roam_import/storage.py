@@ -0,0 +1,164 @@
+import sqlite3
+from typing import Iterable, Optional, Tuple
+
+
+class AddedNotesStore:
+    # Append-only record of the notes which have been imported, indexed by the
+    # digest of their normalized content. Each append is one transaction, so
+    # the store is never left partly written.
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(ADDED_NOTES_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            'select count(*) from added_notes').fetchone()[0]
+
+    def contains_digest(self, digest: bytes) -> bool:
+        row = self.connection.execute(
+            'select 1 from added_notes where digest = ?', (digest,),
+        ).fetchone()
+        return row is not None
+
+    def add(self, notes: Iterable[Tuple[str, bytes]]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                'insert or ignore into added_notes (content, digest) '
+                'values (?, ?)',
+                notes,
+            )
+
+    def position(self) -> int:
+        return self.connection.execute(
+            'select coalesce(max(id), 0) from added_notes').fetchone()[0]
+
+    def digests_after(self, position: int) -> Iterable[bytes]:
+        cursor = self.connection.execute(
+            'select digest from added_notes where id > ? order by id',
+            (position,),
+        )
+        for digest, in cursor:
+            yield digest
+
+
+ADDED_NOTES_SCHEMA = '''
+    create table if not exists added_notes (
+        id integer primary key,
+        content text not null,
+        digest blob not null
+    );
+    create unique index if not exists added_notes_digest
+        on added_notes (digest);
+'''
+
+
+class NoteDigestCache:
+    # Digests of the normalized content of collection notes, keyed by note id
+    # and modification time. The cache is cleared when the content key, which
+    # identifies the model and content field, changes.
+
+    def __init__(self, path: str, content_key: str):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(NOTE_DIGESTS_SCHEMA)
+            self._check_content_key(content_key)
+
+    def _check_content_key(self, content_key: str) -> None:
+        row = self.connection.execute(
+            'select content_key from note_digest_settings').fetchone()
+
+        if row != (content_key,):
+            self.connection.execute('delete from note_digests')
+            self.connection.execute('delete from note_digest_settings')
+            self.connection.execute(
+                'insert into note_digest_settings (content_key) values (?)',
+                (content_key,),
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def entries(self) -> Iterable[Tuple[int, int, bytes]]:
+        return self.connection.execute(
+            'select note_id, mod, digest from note_digests order by note_id')
+
+    def update(
+        self,
+        entries: Iterable[Tuple[int, int, bytes]],
+        deleted_note_ids: Iterable[int],
+    ) -> None:
+        with self.connection:
+            self.connection.executemany(
+                'insert or replace into note_digests (note_id, mod, digest) '
+                'values (?, ?, ?)',
+                entries,
+            )
+            self.connection.executemany(
+                'delete from note_digests where note_id = ?',
+                ((note_id,) for note_id in deleted_note_ids),
+            )
+
+
+NOTE_DIGESTS_SCHEMA = '''
+    create table if not exists note_digests (
+        note_id integer primary key,
+        mod integer not null,
+        digest blob not null
+    );
+    create table if not exists note_digest_settings (
+        content_key text not null
+    );
+'''
+
+
+# uid, note id, edit time and graph
+BlockNoteEntry = Tuple[str, int, Optional[int], str]
+
+
+class BlockNoteIndex:
+    # Ids of the Anki notes imported from Roam blocks, keyed by block uid,
+    # with the edit time of each block when its note was imported or updated,
+    # and the name of the Roam graph the block is in.
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(BLOCK_NOTES_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def entries(self) -> Iterable[BlockNoteEntry]:
+        return self.connection.execute(
+            'select uid, note_id, edit_time, graph from block_notes')
+
+    def update(
+        self,
+        entries: Iterable[BlockNoteEntry],
+        deleted_uids: Iterable[str],
+    ) -> None:
+        with self.connection:
+            self.connection.executemany(
+                'insert or replace into block_notes '
+                '(uid, note_id, edit_time, graph) values (?, ?, ?, ?)',
+                entries,
+            )
+            self.connection.executemany(
+                'delete from block_notes where uid = ?',
+                ((uid,) for uid in deleted_uids),
+            )
+
+
+BLOCK_NOTES_SCHEMA = '''
+    create table if not exists block_notes (
+        uid text primary key,
+        note_id integer not null,
+        edit_time integer,
+        graph text not null
+    );
+'''
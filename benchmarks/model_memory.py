@@ -0,0 +1,74 @@
+# Run from the repository root with: python -m benchmarks.model_memory
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from typing import Callable, Dict, List
+
+from anki_roam_import import model
+from anki_roam_import.model import (
+    AnkiNote, Cloze, CodeInline, Math, RoamBlock, RoamCurlyCommand,
+)
+
+NUM_BLOCKS = 100_000
+
+
+def main():
+    slotted_classes = {
+        cls.__name__: cls
+        for cls in (AnkiNote, Cloze, CodeInline, Math, RoamBlock,
+                    RoamCurlyCommand)
+    }
+    plain_classes = {
+        name: plain_dataclass(cls) for name, cls in slotted_classes.items()
+    }
+
+    plain_bytes = bytes_per_block(plain_classes)
+    slotted_bytes = bytes_per_block(slotted_classes)
+
+    print(f'plain dataclasses:   {plain_bytes:8.1f} bytes per block')
+    print(f'slotted dataclasses: {slotted_bytes:8.1f} bytes per block')
+    print(f'saved:               {1 - slotted_bytes / plain_bytes:8.1%}')
+
+
+def plain_dataclass(cls: type) -> type:
+    return make_dataclass(
+        cls.__name__,
+        [(field.name, field.type, field) for field in fields(cls)],
+        namespace={'__module__': model.__name__},
+    )
+
+
+def bytes_per_block(classes: Dict[str, type]) -> float:
+    tracemalloc.start()
+    try:
+        blocks = make_blocks(classes)
+        allocated_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(blocks) == NUM_BLOCKS
+    return allocated_bytes / NUM_BLOCKS
+
+
+def make_blocks(classes: Dict[str, type]) -> List[object]:
+    make_block: Callable[..., object] = classes['RoamBlock']
+    make_cloze = classes['Cloze']
+    make_math = classes['Math']
+    make_code = classes['CodeInline']
+    make_command = classes['RoamCurlyCommand']
+    make_note = classes['AnkiNote']
+
+    # strings are shared between blocks so that only object overhead differs
+    blocks = []
+    for _ in range(NUM_BLOCKS):
+        parts = [
+            make_command('[[TODO]]'),
+            'text ',
+            make_cloze(['cloze ', make_math('x^2'), make_code('code')]),
+            ' text',
+        ]
+        blocks.append((make_block(parts, 'source'), make_note('note', 'source')))
+    return blocks
+
+
+if __name__ == '__main__':
+    main()
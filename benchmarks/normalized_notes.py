@@ -0,0 +1,65 @@
+# Run from the repository root with: python -m benchmarks.normalized_notes
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+from anki_roam_import.digests import DigestTable
+from anki_roam_import.importer import NormalizedNotes
+
+NUM_NOTES = 200_000
+
+
+def main():
+    contents = make_note_contents()
+
+    for name, make_normalized_notes in (
+        ('set of strings', NormalizedNotes),
+        ('digest table', lambda: NormalizedNotes(DigestTable())),
+    ):
+        build_seconds, bytes_allocated = measure_build(
+            make_normalized_notes, contents)
+        lookup_seconds = measure_lookups(make_normalized_notes, contents)
+        print(
+            f'{name:15} build {build_seconds:6.2f} s, '
+            f'lookup {lookup_seconds:6.2f} s, '
+            f'{bytes_allocated / NUM_NOTES:6.1f} bytes per note')
+
+
+def make_note_contents() -> List[str]:
+    return [
+        f'The {{{{c1::answer number {index}}}}} is in this sentence, which is '
+        f'about as long as a typical cloze note in a Roam graph.'
+        for index in range(NUM_NOTES)
+    ]
+
+
+def measure_build(
+    make_normalized_notes: Callable[[], NormalizedNotes], contents: List[str],
+) -> Tuple[float, int]:
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        normalized_notes = make_normalized_notes()
+        normalized_notes.update(contents)
+        seconds = time.perf_counter() - start
+        bytes_allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, bytes_allocated
+
+
+def measure_lookups(
+    make_normalized_notes: Callable[[], NormalizedNotes], contents: List[str],
+) -> float:
+    normalized_notes = make_normalized_notes()
+    normalized_notes.update(contents)
+
+    start = time.perf_counter()
+    for content in contents:
+        assert content in normalized_notes
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Measures how the time taken by each stage of an import grows with the size
+# of its input, and fails if any stage grows faster than roughly linearly.
+# Run from the repository root with: python -m benchmarks.scaling
+# tests/test_scaling.py runs the same check at smaller sizes.
+import argparse
+import gc
+import math
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence
+
+from anki_roam_import.anki import AddedNotes
+from anki_roam_import.importer import AnkiNoteAdder, NormalizedNotes
+from anki_roam_import.model import AnkiNote, JsonData
+from anki_roam_import.parser import join_strings
+from anki_roam_import.roam import make_block_extractor, parse_roam_block
+
+from benchmarks.synthetic_roam import GraphShape, generate_roam_pages
+
+# time proportional to n log n fits an exponent of about 1.1 over these sizes
+MAX_EXPONENT = 1.3
+NUM_REPEATS = 3
+
+
+@dataclass
+class ScalingCase:
+    name: str
+    make_input: Callable[[int], Any]
+    run: Callable[[Any], Any]
+    sizes: Sequence[int]
+
+
+def block_string(length: int) -> str:
+    text = 'some text with a {cloze} and $$math$$ and `code` in it. '
+    return (text * (length // len(text) + 1))[:length]
+
+
+def unbalanced_block_string(length: int) -> str:
+    text = 'a {c1:b c {{ d { e '
+    return (text * (length // len(text) + 1))[:length]
+
+
+def graph_with_blocks(num_blocks: int) -> List[JsonData]:
+    return generate_roam_pages(GraphShape(
+        num_pages=max(num_blocks // 70, 1),
+        blocks_per_page=10,
+        children_per_block=2,
+        depth=3,
+    ))
+
+
+def nested_blocks(depth: int) -> List[JsonData]:
+    # every block in the chain is a cloze note, so the source is looked for
+    # in all of its parents
+    page = {'title': 'nested', 'children': []}
+    children = page['children']
+    for level in range(depth):
+        block = {'string': f'level {{{level}}}', 'children': []}
+        children.append(block)
+        children = block['children']
+    return [page]
+
+
+class ModelNotes:
+    def __init__(self, num_notes: int):
+        self.contents = [
+            f'existing {{{{c1::note}}}} number {index}'
+            for index in range(num_notes)
+        ]
+
+    def get_notes(self) -> List[str]:
+        return self.contents
+
+    def add_notes(
+        self, anki_notes: List[AnkiNote], batch_size: int,
+    ) -> AddedNotes:
+        return AddedNotes(list(range(len(anki_notes))))
+
+
+def add_note_to_existing_notes(model_notes: ModelNotes) -> None:
+    note_adder = AnkiNoteAdder(model_notes, NormalizedNotes())
+    note_adder.try_add(AnkiNote('a {{c1::new}} note', 'source'))
+
+
+SCALING_CASES = [
+    ScalingCase(
+        'block string length',
+        block_string,
+        parse_roam_block,
+        sizes=[2_000, 4_000, 8_000, 16_000],
+    ),
+    ScalingCase(
+        'unbalanced delimiters',
+        unbalanced_block_string,
+        parse_roam_block,
+        sizes=[2_000, 4_000, 8_000, 16_000],
+    ),
+    ScalingCase(
+        'joined strings',
+        lambda size: ['a'] * size,
+        join_strings,
+        sizes=[50_000, 100_000, 200_000, 400_000],
+    ),
+    ScalingCase(
+        'number of blocks',
+        graph_with_blocks,
+        lambda pages: list(make_block_extractor()(pages)),
+        sizes=[1_000, 2_000, 4_000, 8_000],
+    ),
+    ScalingCase(
+        'nesting depth',
+        nested_blocks,
+        lambda pages: list(make_block_extractor()(pages)),
+        sizes=[100, 200, 400, 800],
+    ),
+    ScalingCase(
+        'existing notes',
+        ModelNotes,
+        add_note_to_existing_notes,
+        sizes=[10_000, 20_000, 40_000, 80_000],
+    ),
+]
+
+
+def measure_seconds(
+    case: ScalingCase, size: int, num_repeats: int = NUM_REPEATS,
+) -> float:
+    case_input = case.make_input(size)
+    seconds = []
+    # CPU time of this process, unlike wall clock time, does not include the
+    # time other processes run for, and garbage collections are left out as
+    # their timing depends on what was allocated before
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(num_repeats):
+            start = time.process_time()
+            case.run(case_input)
+            seconds.append(time.process_time() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # the fastest run is the one least disturbed by cache misses and
+    # interrupts
+    return min(seconds)
+
+
+def fit_exponent(sizes: Sequence[int], seconds: Sequence[float]) -> float:
+    # slope of the least squares line through log(seconds) against log(size)
+    log_sizes = [math.log(size) for size in sizes]
+    log_seconds = [math.log(max(second, 1e-9)) for second in seconds]
+    mean_log_size = sum(log_sizes) / len(log_sizes)
+    mean_log_seconds = sum(log_seconds) / len(log_seconds)
+
+    covariance = sum(
+        (log_size - mean_log_size) * (log_second - mean_log_seconds)
+        for log_size, log_second in zip(log_sizes, log_seconds))
+    variance = sum(
+        (log_size - mean_log_size) ** 2 for log_size in log_sizes)
+
+    return covariance / variance
+
+
+def measure_exponent(
+    case: ScalingCase, scale: float = 1.0, num_repeats: int = NUM_REPEATS,
+) -> float:
+    sizes = [max(int(size * scale), 1) for size in case.sizes]
+    seconds = [measure_seconds(case, size, num_repeats) for size in sizes]
+    return fit_exponent(sizes, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that import stages scale linearly.')
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help='multiply the input sizes by this factor')
+    parser.add_argument('--max-exponent', type=float, default=MAX_EXPONENT)
+    args = parser.parse_args()
+
+    exponents: Dict[str, float] = {}
+    for case in SCALING_CASES:
+        exponents[case.name] = measure_exponent(case, args.scale)
+        print(f'{case.name:25} grows as size ** {exponents[case.name]:.2f}')
+
+    too_slow = [
+        name for name, exponent in exponents.items()
+        if exponent > args.max_exponent
+    ]
+    if too_slow:
+        print(f'grows faster than size ** {args.max_exponent}: '
+              f'{", ".join(too_slow)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# Times each stage of an import separately on a synthetic Roam export. Run
+# from the repository root with:
+# python -m benchmarks.stages --pages 1000 --output results.json
+# and compare two runs, e.g. from different commits, with:
+# python -m benchmarks.stages --compare before.json after.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from anki_roam_import.anki import AddedNotes
+from anki_roam_import.anki_format import make_anki_note_maker
+from anki_roam_import.importer import (
+    AnkiNoteAdder, NormalizedNotes, normalized_content,
+)
+from anki_roam_import.model import AnkiNote
+from anki_roam_import.roam import (
+    load_roam_pages, make_block_extractor, might_contain_cloze,
+    parse_roam_block,
+)
+
+from benchmarks.synthetic_roam import (
+    GraphShape, add_shape_arguments, generate_roam_pages,
+    shape_from_arguments, write_roam_export,
+)
+
+NUM_REPEATS = 5
+
+
+class ModelNotes:
+    # Stands in for AnkiModelNotes, so that the note adder can be timed
+    # without a collection.
+
+    def get_notes(self) -> Iterable[str]:
+        return []
+
+    def add_notes(
+        self, anki_notes: List[AnkiNote], batch_size: int,
+    ) -> AddedNotes:
+        return AddedNotes(list(range(len(anki_notes))))
+
+
+def run_benchmarks(
+    shape: GraphShape, num_repeats: int = NUM_REPEATS,
+) -> Dict[str, Any]:
+    pages = generate_roam_pages(shape)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'roam.json')
+        write_roam_export(pages, path)
+        pages = list(load_roam_pages(path))
+        load_results = time_stage(
+            lambda: list(load_roam_pages(path)), num_repeats)
+
+    extract_roam_blocks = make_block_extractor()
+    roam_blocks = list(extract_roam_blocks(pages))
+    block_strings = [
+        string for string in block_strings_in(pages)
+        if might_contain_cloze(string)
+    ]
+    make_anki_note = make_anki_note_maker()
+    anki_notes = list(map(make_anki_note, roam_blocks))
+    contents = [anki_note.content for anki_note in anki_notes]
+
+    def add_notes():
+        note_adder = AnkiNoteAdder(ModelNotes(), NormalizedNotes())
+        for anki_note in anki_notes:
+            note_adder.try_add(anki_note)
+        note_adder.flush()
+
+    stages = {
+        'load_roam_pages': (load_results, shape.num_pages),
+        'extract_roam_blocks': (time_stage(
+            lambda: list(make_block_extractor()(pages)), num_repeats),
+            shape.num_blocks),
+        'parse_roam_block': (time_stage(
+            lambda: list(map(parse_roam_block, block_strings)), num_repeats),
+            len(block_strings)),
+        'make_anki_note': (time_stage(
+            lambda: list(map(make_anki_note_maker(), roam_blocks)),
+            num_repeats), len(roam_blocks)),
+        'normalized_content': (time_stage(
+            lambda: list(map(normalized_content, contents)), num_repeats),
+            len(contents)),
+        'AnkiNoteAdder': (time_stage(add_notes, num_repeats), len(anki_notes)),
+    }
+
+    return {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'shape': asdict(shape),
+        'stages': {
+            name: stage_results(seconds, num_items)
+            for name, (seconds, num_items) in stages.items()
+        },
+    }
+
+
+def block_strings_in(page_or_block: Any) -> Iterable[str]:
+    if isinstance(page_or_block, list):
+        for child in page_or_block:
+            yield from block_strings_in(child)
+        return
+
+    if 'string' in page_or_block:
+        yield page_or_block['string']
+
+    yield from block_strings_in(page_or_block.get('children', []))
+
+
+def time_stage(function: Callable[[], Any], num_repeats: int) -> List[float]:
+    seconds = []
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def stage_results(seconds: List[float], num_items: int) -> Dict[str, Any]:
+    median_seconds = statistics.median(seconds)
+    return {
+        'items': num_items,
+        'median_seconds': median_seconds,
+        'min_seconds': min(seconds),
+        'max_seconds': max(seconds),
+        'items_per_second': (
+            num_items / median_seconds if median_seconds else None),
+    }
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, check=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"commit {results['commit']}, python {results['python']}")
+    for name, stage in results['stages'].items():
+        print(f"{name:20} {stage['median_seconds']:8.3f} s "
+              f"{stage['items']:9} items")
+
+
+def compare_results(paths: Tuple[str, str]) -> None:
+    before, after = (json.load(open(path, encoding='utf-8')) for path in paths)
+
+    if before['shape'] != after['shape']:
+        print('warning: the results are for different graph shapes')
+
+    print(f"{'':20} {before['commit'] or paths[0]:>10} "
+          f"{after['commit'] or paths[1]:>10}")
+    for name, after_stage in after['stages'].items():
+        before_stage = before['stages'].get(name)
+        if before_stage is None:
+            continue
+        ratio = after_stage['median_seconds'] / before_stage['median_seconds']
+        print(f"{name:20} {before_stage['median_seconds']:9.3f}s "
+              f"{after_stage['median_seconds']:9.3f}s {ratio:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time the stages of an import of a synthetic export.')
+    add_shape_arguments(parser)
+    parser.add_argument('--repeats', type=int, default=NUM_REPEATS)
+    parser.add_argument('--output', help='JSON file to write results to')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+        help='compare two JSON result files instead of running benchmarks')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(args.compare)
+        return
+
+    results = run_benchmarks(shape_from_arguments(args), args.repeats)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# Writes a synthetic Roam export. Run from the repository root with:
+# python -m benchmarks.synthetic_roam roam.json --pages 1000
+import argparse
+import json
+import random
+from dataclasses import dataclass, fields
+from typing import List
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from anki_roam_import.model import JsonData
+
+WORDS = (
+    'memory retrieval practice spaced repetition interval review card deck '
+    'note graph page block reference attribute query time learning recall '
+    'forgetting curve evidence experiment result method theory question'
+).split()
+
+# pieces of Roam markup which are opened and not closed, or closed and not
+# opened, and which make the parser try and abandon many alternatives
+UNBALANCED_DELIMITERS = (
+    '{', '}', '{{', '}}', '{{{', '$$', '`', '```', '[[', ']]', '{{[[', '::',
+    '{c', '{c1:', ':}', '$', '}}}',
+)
+
+FIRST_CREATE_TIME = 1_600_000_000_000
+MILLIS_PER_HOUR = 60 * 60 * 1000
+
+
+@dataclass
+class GraphShape:
+    num_pages: int = 100
+    blocks_per_page: int = 10
+    children_per_block: int = 2
+    depth: int = 3
+    block_length: int = 80
+    cloze_density: float = 0.2
+    source_density: float = 0.05
+    delimiter_density: float = 0.0
+    seed: int = 0
+
+    @property
+    def num_blocks(self) -> int:
+        blocks_per_tree = sum(
+            self.children_per_block ** level for level in range(self.depth))
+        return self.num_pages * self.blocks_per_page * blocks_per_tree
+
+
+def generate_roam_pages(shape: GraphShape) -> List[JsonData]:
+    # The same shape always generates the same pages.
+    generator = GraphGenerator(shape, random.Random(shape.seed))
+    return [generator.page(index) for index in range(shape.num_pages)]
+
+
+class GraphGenerator:
+    def __init__(self, shape: GraphShape, rng: random.Random):
+        self.shape = shape
+        self.rng = rng
+        self.num_blocks = 0
+
+    def page(self, index: int) -> JsonData:
+        return {
+            'title': f'Page {index} {self.words(3)}',
+            'children': self.blocks(self.shape.blocks_per_page, level=0),
+        }
+
+    def blocks(self, num_blocks: int, level: int) -> List[JsonData]:
+        return [self.block(level) for _ in range(num_blocks)]
+
+    def block(self, level: int) -> JsonData:
+        self.num_blocks += 1
+        create_time = FIRST_CREATE_TIME + self.num_blocks * MILLIS_PER_HOUR
+
+        block = {
+            'uid': f'{self.num_blocks:09x}',
+            'string': self.block_string(),
+            'create-time': create_time,
+            'edit-time': create_time + MILLIS_PER_HOUR,
+        }
+
+        if level + 1 < self.shape.depth:
+            block['children'] = self.blocks(
+                self.shape.children_per_block, level + 1)
+
+        return block
+
+    def block_string(self) -> str:
+        rng = self.rng
+        shape = self.shape
+
+        if rng.random() < shape.source_density:
+            return f'Source: {self.words(4)}'
+
+        pieces = []
+        length = 0
+        while length < shape.block_length:
+            if rng.random() < shape.delimiter_density:
+                piece = rng.choice(UNBALANCED_DELIMITERS)
+            else:
+                piece = rng.choice(WORDS)
+            pieces.append(piece)
+            length += len(piece) + 1
+
+        if rng.random() < shape.cloze_density:
+            index = rng.randrange(len(pieces))
+            pieces[index] = f'{{{pieces[index]}}}'
+
+        return ' '.join(pieces)
+
+    def words(self, num_words: int) -> str:
+        return ' '.join(self.rng.choice(WORDS) for _ in range(num_words))
+
+
+def write_roam_export(pages: List[JsonData], path: str) -> None:
+    # Writes a .json file, or a .zip containing one, like Roam does.
+    if path.lower().endswith('.zip'):
+        with ZipFile(path, mode='w', compression=ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('roam.json', json.dumps(pages))
+    else:
+        with open(path, mode='w', encoding='utf-8') as file:
+            json.dump(pages, file)
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    for shape_field in fields(GraphShape):
+        parser.add_argument(
+            '--' + shape_field.name.replace('num_', '').replace('_', '-'),
+            dest=shape_field.name,
+            type=type(shape_field.default),
+            default=shape_field.default,
+        )
+
+
+def shape_from_arguments(args: argparse.Namespace) -> GraphShape:
+    return GraphShape(**{
+        shape_field.name: getattr(args, shape_field.name)
+        for shape_field in fields(GraphShape)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic Roam export.')
+    parser.add_argument('path', help='.json or .zip file to write')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    shape = shape_from_arguments(args)
+    write_roam_export(generate_roam_pages(shape), args.path)
+    print(f'wrote {shape.num_pages} pages and {shape.num_blocks} blocks '
+          f'to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import sqlite3
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+from anki_roam_import.anki import AnkiCollection, AnkiModelNotes, FileAddonData
+from anki_roam_import.model import AnkiNote
+
+MODEL_ID = 1234
+
+
+class SqliteDatabase:
+    def __init__(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.execute(
+            'create table notes (id integer primary key, mid integer, '
+            'mod integer, flds text)')
+        self.num_queries = 0
+
+    def insert_note(self, note_id: int, mid: int, mod: int, flds: str) -> None:
+        self.connection.execute(
+            'insert into notes (id, mid, mod, flds) values (?, ?, ?, ?)',
+            (note_id, mid, mod, flds))
+
+    def all(self, sql: str, *args: Any) -> List[Any]:
+        self.num_queries += 1
+        return self.connection.execute(sql, args).fetchall()
+
+    def list(self, sql: str, *args: Any) -> List[Any]:
+        self.num_queries += 1
+        return [row[0] for row in self.connection.execute(sql, args)]
+
+    def scalar(self, sql: str, *args: Any) -> Any:
+        self.num_queries += 1
+        return self.connection.execute(sql, args).fetchone()[0]
+
+
+@pytest.fixture
+def database() -> SqliteDatabase:
+    database = SqliteDatabase()
+    database.insert_note(1, MODEL_ID, 10, 'first\x1ffirst extra')
+    database.insert_note(2, MODEL_ID, 20, 'second\x1f')
+    database.insert_note(3, MODEL_ID + 1, 30, 'other model\x1fextra')
+    database.insert_note(4, MODEL_ID, 40, 'fourth\x1ffourth extra')
+    return database
+
+
+def model_notes(
+    database: SqliteDatabase, content_field_index: int = 0,
+) -> AnkiModelNotes:
+    collection = SimpleNamespace(db=database)
+    return AnkiModelNotes(
+        collection, {'id': MODEL_ID}, content_field_index, None)
+
+
+def test_add_notes_in_batches():
+    added_fields = []
+    collection = SimpleNamespace(
+        addNote=lambda note: added_fields.append(note.fields))
+    model = {'id': MODEL_ID, 'flds': [{'name': 'Text'}, {'name': 'Source'}]}
+    model_notes = AnkiModelNotes(collection, model, 0, 1)
+    anki_notes = [AnkiNote(f'content {index}', 'source') for index in range(5)]
+
+    added_notes = model_notes.add_notes(anki_notes, batch_size=2)
+
+    assert added_fields == [
+        [f'content {index}', 'source'] for index in range(5)]
+    assert len(added_notes.note_ids) == 5
+    assert [
+        timing.num_notes for timing in added_notes.batch_timings] == [2, 2, 1]
+    assert all(timing.seconds >= 0 for timing in added_notes.batch_timings)
+
+
+def test_add_notes_to_routed_decks():
+    added_decks = []
+    looked_up_decks = []
+
+    def deck_id(name, create):
+        looked_up_decks.append(name)
+        return len(looked_up_decks) + 100
+
+    collection = SimpleNamespace(
+        addNote=lambda note: added_decks.append(model['did']),
+        decks=SimpleNamespace(id=deck_id))
+    model = {'id': MODEL_ID, 'did': 1, 'flds': [{'name': 'Text'}]}
+    model_notes = AnkiModelNotes(collection, model, 0, None)
+    anki_notes = [
+        AnkiNote(f'content {index}', 'source', deck_name=deck_name)
+        for index, deck_name in enumerate(['A', 'B', None, 'A', 'B'])
+    ]
+
+    model_notes.add_notes(anki_notes, batch_size=2)
+
+    assert added_decks == [101, 102, 1, 101, 102]
+    assert looked_up_decks == ['A', 'B']
+
+
+def test_model_is_copied_without_changing_collection():
+    templates = [{'name': 'Cloze'}]
+    collection_model = {'id': MODEL_ID, 'did': 1, 'tmpls': templates}
+    collection = SimpleNamespace(
+        models=SimpleNamespace(
+            byName=lambda name: collection_model,
+            fieldNames=lambda model: ['Text']),
+        decks=SimpleNamespace(id=lambda name, create: 2))
+
+    model_notes = AnkiCollection(collection).get_model_notes(
+        'Cloze', 'Text', None, 'Roam')
+
+    assert model_notes.model['did'] == 2
+    assert model_notes.model['tmpls'] is templates
+    assert collection_model['did'] == 1
+
+
+def test_update_notes_skips_deleted_notes_and_other_models(database):
+    flushed_fields = {}
+
+    def get_note(note_id):
+        note = SimpleNamespace(id=note_id, fields=['', ''])
+        note.flush = lambda: flushed_fields.update({note.id: note.fields})
+        return note
+
+    collection = SimpleNamespace(db=database, getNote=get_note)
+    model_notes = AnkiModelNotes(collection, {'id': MODEL_ID}, 0, 1)
+
+    updated_note_ids = model_notes.update_notes([
+        (1, AnkiNote('edited first', 'source')),
+        (3, AnkiNote('other model', 'source')),
+        (5, AnkiNote('deleted', 'source')),
+    ])
+
+    assert updated_note_ids == [1]
+    assert flushed_fields == {1: ['edited first', 'source']}
+
+
+def test_count_notes(database):
+    assert model_notes(database).count_notes() == 3
+
+
+def test_get_notes_reads_first_field(database):
+    notes = model_notes(database).get_notes()
+
+    assert list(notes) == ['first', 'second', 'fourth']
+
+
+def test_get_notes_reads_other_field(database):
+    database.insert_note(5, MODEL_ID, 50, 'fifth\x1ffifth extra\x1f')
+
+    notes = model_notes(database, content_field_index=1).get_notes()
+
+    assert list(notes) == ['first extra', '', 'fourth extra', 'fifth extra']
+
+
+def test_get_notes_reads_notes_in_chunks(database):
+    notes = model_notes(database).get_notes(chunk_size=2)
+
+    assert list(notes) == ['first', 'second', 'fourth']
+    assert database.num_queries == 2
+
+
+def test_get_note_versions(database):
+    versions = model_notes(database).get_note_versions(chunk_size=1)
+
+    assert list(versions) == [(1, 10), (2, 20), (4, 40)]
+
+
+def test_get_notes_by_id(database):
+    notes = model_notes(database, content_field_index=1).get_notes_by_id([4, 1])
+
+    assert sorted(notes) == [(1, 'first extra'), (4, 'fourth extra')]
+
+
+def test_file_addon_data_overrides_default_config(tmp_path):
+    config_path = tmp_path / 'config.json'
+    config_path.write_text('{"deck_name": "Roam"}')
+    user_files_path = tmp_path / 'user_files'
+    addon_data = FileAddonData(str(config_path), str(user_files_path))
+
+    config = addon_data.read_config()
+
+    assert config['deck_name'] == 'Roam'
+    assert config['model_name'] == 'Cloze'
+    assert addon_data.user_files_path() == str(user_files_path)
+    assert user_files_path.is_dir()
@@ -12,7 +12,7 @@ from anki_roam_import.anki_format import (
 )
 from anki_roam_import.model import (
     AnkiNote, Cloze, ClozePart, CodeBlock, CodeInline, Math, RoamBlock,
-    RoamColonCommand, RoamCurlyCommand, RoamPart,
+    RoamColonCommand, RoamCurlyCommand, RoamPart, SharedSource,
 )
 
 from tests.util import mock, when
@@ -41,6 +41,23 @@ def test_make_note(mock_html_formatter):
     assert note_maker(roam_block) == AnkiNote(formatted_note, 'html source')
 
 
+def test_make_note_with_shared_source():
+    note_maker = AnkiNoteMaker(
+        ClozeEnumerator(), mock(Formatter[Iterable[RoamPart]]),
+        format_text_as_html,
+    )
+    first_block = RoamBlock([], SharedSource("page 'title'", ', first.'))
+    second_block = RoamBlock([], SharedSource("page 'title'", ', second.'))
+
+    first_note = note_maker(first_block)
+    second_note = note_maker(second_block)
+
+    assert first_note.source == SharedSource(
+        'page &#x27;title&#x27;', ', first.')
+    assert str(second_note.source) == 'page &#x27;title&#x27;, second.'
+    assert first_note.source.shared is second_note.source.shared
+
+
 def test_use_first_formatter_that_returns_string():
     # noinspection PyUnusedLocal
     def first_formatter(value: Any) -> Optional[str]:
@@ -0,0 +1,109 @@
+import pytest
+
+from anki_roam_import.digests import BloomFilter, DigestTable, content_digest
+
+
+@pytest.fixture
+def digest_table() -> DigestTable:
+    return DigestTable(capacity=4)
+
+
+def test_content_digest_is_128_bits():
+    assert len(content_digest('content')) == 16
+
+
+def test_content_digest_differs_for_different_content():
+    assert content_digest('content') != content_digest('other content')
+
+
+def test_empty_table_does_not_contain_content(digest_table):
+    assert 'content' not in digest_table
+    assert len(digest_table) == 0
+
+
+def test_table_contains_added_content(digest_table):
+    digest_table.add('content')
+
+    assert 'content' in digest_table
+    assert 'other content' not in digest_table
+    assert len(digest_table) == 1
+
+
+def test_adding_content_twice_stores_it_once(digest_table):
+    assert digest_table.add_digest(content_digest('content'))
+    assert not digest_table.add_digest(content_digest('content'))
+    assert len(digest_table) == 1
+
+
+def test_table_grows_to_hold_many_contents(digest_table):
+    contents = [f'content {index}' for index in range(1000)]
+
+    digest_table.update(contents)
+
+    assert len(digest_table) == 1000
+    assert all(content in digest_table for content in contents)
+    assert 'content 1000' not in digest_table
+
+
+def test_table_holds_all_zero_digest(digest_table):
+    zero_digest = bytes(16)
+
+    assert not digest_table.contains_digest(zero_digest)
+    digest_table.add_digest(zero_digest)
+    assert digest_table.contains_digest(zero_digest)
+
+
+@pytest.fixture
+def bloom_filter() -> BloomFilter:
+    return BloomFilter(capacity=100, false_positive_rate=0.01)
+
+
+def test_bloom_filter_contains_added_digests(bloom_filter):
+    digests = [content_digest(f'content {index}') for index in range(100)]
+
+    for digest in digests:
+        bloom_filter.add(digest)
+
+    assert all(digest in bloom_filter for digest in digests)
+
+
+def test_bloom_filter_has_few_false_positives(bloom_filter):
+    for index in range(100):
+        bloom_filter.add(content_digest(f'content {index}'))
+
+    false_positives = sum(
+        content_digest(f'other content {index}') in bloom_filter
+        for index in range(10000))
+
+    assert false_positives < 300
+
+
+def test_bloom_filter_is_sized_from_capacity_and_false_positive_rate():
+    bloom_filter = BloomFilter(capacity=1000, false_positive_rate=0.01)
+
+    assert bloom_filter.num_bits == 9586
+    assert bloom_filter.num_hashes == 7
+
+
+def test_bloom_filter_saves_and_loads(bloom_filter, tmp_path):
+    path = str(tmp_path / 'filter.bloom')
+    digest = content_digest('content')
+    bloom_filter.add(digest)
+
+    bloom_filter.save(path)
+    loaded_bloom_filter = BloomFilter.load(path)
+
+    assert loaded_bloom_filter.capacity == bloom_filter.capacity
+    assert loaded_bloom_filter.false_positive_rate == 0.01
+    assert digest in loaded_bloom_filter
+
+
+def test_bloom_filter_load_returns_none_without_file(tmp_path):
+    assert BloomFilter.load(str(tmp_path / 'missing.bloom')) is None
+
+
+def test_bloom_filter_load_returns_none_for_invalid_file(tmp_path):
+    path = tmp_path / 'invalid.bloom'
+    path.write_bytes(b'invalid')
+
+    assert BloomFilter.load(str(path)) is None
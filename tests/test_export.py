@@ -0,0 +1,162 @@
+import json
+import sqlite3
+from zipfile import ZipFile
+
+from anki_roam_import.export import (
+    cloze_numbers, export_notes, field_checksum, main,
+)
+
+from tests.test_roam import block, page
+
+CONFIG = {
+    'model_name': 'Cloze',
+    'content_field': 'Text',
+    'source_field': 'Extra',
+    'deck_name': 'Roam',
+}
+
+
+def write_roam_export(tmp_path, *blocks):
+    roam_path = tmp_path / 'roam.json'
+    roam_path.write_text(json.dumps([page(*blocks)]))
+    return str(roam_path)
+
+
+def test_export_tsv(tmp_path):
+    roam_path = write_roam_export(tmp_path, block('a {cloze}\tnote'))
+    output_path = tmp_path / 'notes.tsv'
+
+    report = export_notes([roam_path], str(output_path), CONFIG)
+
+    lines = output_path.read_text(encoding='utf-8').splitlines()
+    assert lines[:5] == [
+        '#separator:tab',
+        '#html:true',
+        '#notetype:Cloze',
+        '#deck:Roam',
+        '#columns:Text\tExtra',
+    ]
+    assert len(lines) == 6
+    assert lines[5].startswith('"a {{c1::cloze}}\tnote"\t')
+    assert str(report) == '1 notes exported.'
+
+
+def test_export_tsv_with_page_decks(tmp_path):
+    roam_path = tmp_path / 'roam.json'
+    roam_path.write_text(json.dumps([
+        page(block('{cells}'), title='Biology/Cells'),
+        page(block('{other}'), title='Other'),
+    ]))
+    output_path = tmp_path / 'notes.tsv'
+    config = {**CONFIG, 'source_field': None, 'namespace_decks': True}
+
+    export_notes([str(roam_path)], str(output_path), config)
+
+    assert output_path.read_text(encoding='utf-8').splitlines()[3:] == [
+        '#deck column:2',
+        '#columns:Text\tDeck',
+        '{{c1::cells}}\tBiology::Cells',
+        '{{c1::other}}\tRoam',
+    ]
+
+
+def test_export_csv_without_source_field(tmp_path):
+    roam_path = write_roam_export(tmp_path, block('{cloze}'))
+    output_path = tmp_path / 'notes.csv'
+    config = {**CONFIG, 'source_field': None, 'deck_name': None}
+
+    export_notes([roam_path], str(output_path), config)
+
+    assert output_path.read_text(encoding='utf-8').splitlines() == [
+        '#separator:comma',
+        '#html:true',
+        '#notetype:Cloze',
+        '#columns:Text',
+        '{{c1::cloze}}',
+    ]
+
+
+def test_export_tsv_with_tags(tmp_path):
+    roam_path = write_roam_export(tmp_path, block('{cloze} #tag #other'))
+    output_path = tmp_path / 'notes.tsv'
+    config = {**CONFIG, 'source_field': None, 'import_tags': True}
+
+    export_notes([roam_path], str(output_path), config)
+
+    lines = output_path.read_text(encoding='utf-8').splitlines()
+    assert lines[4:] == [
+        '#tags column:2',
+        '#columns:Text\tTags',
+        '{{c1::cloze}} #tag #other\ttag other',
+    ]
+
+
+def test_export_skips_duplicate_notes(tmp_path):
+    roam_path = write_roam_export(
+        tmp_path, block('a {cloze}'), block('a {cloze}.'), block('{other}'))
+    output_path = tmp_path / 'notes.tsv'
+
+    report = export_notes([roam_path], str(output_path), CONFIG)
+
+    assert report.num_notes == 2
+    assert report.num_duplicate_notes == 1
+    assert str(report) == (
+        '2 notes exported, 1 duplicate notes were not exported.')
+
+
+def test_export_apkg(tmp_path):
+    roam_path = write_roam_export(
+        tmp_path, block('{c1|a} and {c2|b}'), block('<b>{c}</b>'))
+    output_path = tmp_path / 'notes.apkg'
+
+    export_notes([roam_path], str(output_path), CONFIG)
+
+    with ZipFile(output_path) as zip_file:
+        assert zip_file.read('media') == b'{}'
+        collection_path = tmp_path / 'collection.anki2'
+        collection_path.write_bytes(zip_file.read('collection.anki2'))
+
+    connection = sqlite3.connect(str(collection_path))
+    try:
+        notes = connection.execute(
+            'select id, mid, flds, sfld, csum from notes order by id').fetchall()
+        cards = connection.execute(
+            'select nid, did, ord from cards order by id').fetchall()
+        models, decks = connection.execute(
+            'select models, decks from col').fetchone()
+    finally:
+        connection.close()
+
+    assert len(notes) == 2
+    assert notes[0][2].split('\x1f')[0] == '{{c1::a}} and {{c2::b}}'
+    assert notes[1][3] == '<b>{{c1::c}}</b>'
+    assert notes[1][4] == field_checksum('<b>{{c1::c}}</b>')
+
+    deck_ids = {int(deck_id) for deck_id, deck in json.loads(decks).items()
+                if deck['name'] == 'Roam'}
+    assert [(nid, ord_) for nid, did, ord_ in cards] == [
+        (notes[0][0], 0), (notes[0][0], 1), (notes[1][0], 0)]
+    assert {did for nid, did, ord_ in cards} == deck_ids
+
+    model = json.loads(models)[str(notes[0][1])]
+    assert model['name'] == 'Cloze'
+    assert [field['name'] for field in model['flds']] == ['Text', 'Extra']
+
+
+def test_cloze_numbers():
+    assert cloze_numbers('{{c2::a}} {{c1::b}} {{c2::c}}') == [1, 2]
+    assert cloze_numbers('no clozes') == [1]
+
+
+def test_main_uses_default_config(tmp_path, capsys):
+    roam_path = write_roam_export(tmp_path, block('{cloze}'))
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'deck_name': 'Other'}))
+    output_path = tmp_path / 'notes.txt'
+
+    exit_code = main([
+        roam_path, str(output_path), '--config', str(config_path)])
+
+    assert exit_code == 0
+    assert capsys.readouterr().out == '1 notes exported.\n'
+    assert '#deck:Other' in output_path.read_text(encoding='utf-8')
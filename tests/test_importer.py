@@ -1,13 +1,24 @@
 import json
+import tracemalloc
 from dataclasses import dataclass
+from itertools import count
 from pathlib import Path
-from unittest.mock import call
+from typing import List
 
 import pytest
 
-from anki_roam_import.anki import AnkiAddonData, AnkiCollection, AnkiModelNotes
-from anki_roam_import.importer import AnkiNoteImporter
+from anki_roam_import import digests, importer
+from anki_roam_import.anki import (
+    AddedNotes, AnkiAddonData, AnkiCollection, AnkiModelNotes, BatchTiming,
+)
+from anki_roam_import.digests import BloomFilter, DigestTable, content_digest
+from anki_roam_import.importer import (
+    AnkiNoteAdder, AnkiNoteImporter, BlockNotes, ImportProgress,
+    NormalizedNotes, normalized_digest,
+)
 from anki_roam_import.model import AnkiNote, JsonData
+from anki_roam_import.run_log import RunLog, summarize_runs
+from anki_roam_import.storage import AddedNotesStore, BlockNoteIndex
 
 from tests.test_roam import block, page
 from tests.util import mock, when
@@ -64,7 +75,26 @@ def anki_collection(anki_model_notes) -> AnkiCollection:
 
 @pytest.fixture
 def anki_model_notes() -> AnkiModelNotes:
-    return mock(AnkiModelNotes)
+    model_notes = mock(AnkiModelNotes)
+    note_ids = count(100)
+
+    def add_notes(anki_notes, batch_size):
+        return AddedNotes(
+            [next(note_ids) for _ in anki_notes],
+            [BatchTiming(len(anki_notes), 0.25)],
+        )
+
+    model_notes.add_notes.side_effect = add_notes
+    model_notes.existing_note_ids.side_effect = lambda note_ids: note_ids
+    return model_notes
+
+
+def added_notes(anki_model_notes: AnkiModelNotes) -> List[AnkiNote]:
+    return [
+        anki_note
+        for add_notes_call in anki_model_notes.add_notes.call_args_list
+        for anki_note in add_notes_call[0][0]
+    ]
 
 
 @pytest.fixture
@@ -86,13 +116,13 @@ def test_import_cloze_note_with_source(
     importer = AnkiNoteImporter(addon_data, anki_collection)
     info = importer.import_from_path(str(roam_json_file.path))
 
-    anki_model_notes.add_note.assert_has_calls([
-        call(AnkiNote(
+    assert added_notes(anki_model_notes) == [
+        AnkiNote(
             content='{{c1::cloze}} text',
             source="reference<br>Note from Roam page &#x27;title&#x27;.",
-        )),
-    ])
-    assert info == '1 new notes imported.'
+        ),
+    ]
+    assert str(info) == '1 new notes imported.'
 
 
 def test_translate_latex_math(
@@ -104,13 +134,13 @@ def test_translate_latex_math(
 
     info = anki_note_importer.import_from_path(str(roam_json_file.path))
 
-    anki_model_notes.add_note.assert_has_calls([
-        call(AnkiNote(
+    assert added_notes(anki_model_notes) == [
+        AnkiNote(
             content=r'\(\textrm{outside cloze}\) and {{c1::inside \(\textrm{cloze}\)}}',
             source="Note from Roam page &#x27;title&#x27;.",
-        )),
-    ])
-    assert info == '1 new notes imported.'
+        ),
+    ]
+    assert str(info) == '1 new notes imported.'
 
 
 def test_translate_code(
@@ -120,13 +150,13 @@ def test_translate_code(
 
     info = anki_note_importer.import_from_path(str(roam_json_file.path))
 
-    anki_model_notes.add_note.assert_has_calls([
-        call(AnkiNote(
+    assert added_notes(anki_model_notes) == [
+        AnkiNote(
             content='<code>code</code> and {{c1::<code>code</code> in cloze}}',
             source="Note from Roam page &#x27;title&#x27;.",
-        )),
-    ])
-    assert info == '1 new notes imported.'
+        ),
+    ]
+    assert str(info) == '1 new notes imported.'
 
 
 def test_do_not_add_note_with_brackets_inside_code(
@@ -136,8 +166,8 @@ def test_do_not_add_note_with_brackets_inside_code(
 
     info = anki_note_importer.import_from_path(str(roam_json_file.path))
 
-    anki_model_notes.add_note.assert_not_called()
-    assert info == 'No notes found.'
+    assert added_notes(anki_model_notes) == []
+    assert str(info) == 'No notes found.'
 
 
 def test_format_as_html(
@@ -153,10 +183,468 @@ def test_format_as_html(
 
     info = anki_note_importer.import_from_path(str(roam_json_file.path))
 
-    anki_model_notes.add_note.assert_has_calls([
-        call(AnkiNote(
+    assert added_notes(anki_model_notes) == [
+        AnkiNote(
             content='{{c1::&lt;cloze&gt; }} &amp;&nbsp;&nbsp;text ',
             source="source&nbsp;&nbsp;&amp;<br>Note from Roam page &#x27; &amp;&nbsp;&nbsp;title &#x27;.",
-        )),
+        ),
+    ]
+    assert str(info) == '1 new notes imported.'
+
+
+def test_import_compact_source(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value['compact_sources'] = True
+    roam_json_file.write_blocks('{cloze}', title='title')
+
+    info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    [anki_note] = added_notes(anki_model_notes)
+    assert anki_note.content == '{{c1::cloze}}'
+    assert str(anki_note.source) == "Note from Roam page &#x27;title&#x27;."
+    assert str(info) == '1 new notes imported.'
+
+
+def test_hashed_note_index_ignores_existing_notes(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value['hashed_note_index'] = True
+    anki_model_notes.get_notes.return_value = ['{{c1::existing}}  note']
+    roam_json_file.write_blocks('{existing} note', '{new} note')
+
+    info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert added_notes(anki_model_notes) == [AnkiNote(
+        content='{{c1::new}} note',
+        source="Note from Roam page &#x27;title&#x27;.",
+    )]
+    assert str(info) == (
+        '1 new notes imported, 1 notes were imported before and were not '
+        'imported again.')
+
+
+def test_bloom_filter_ignores_existing_notes_across_imports(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value[
+        'bloom_filter_false_positive_rate'] = 0.01
+    anki_model_notes.count_notes.return_value = 1
+    anki_model_notes.get_notes.return_value = ['{{c1::existing}} note']
+    roam_json_file.write_blocks('{existing} note', '{new} note')
+
+    first_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+    second_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert added_notes(anki_model_notes) == [AnkiNote(
+        content='{{c1::new}} note',
+        source="Note from Roam page &#x27;title&#x27;.",
+    )]
+    assert str(first_info) == (
+        '1 new notes imported, 1 notes were imported before and were not '
+        'imported again.')
+    assert str(second_info) == (
+        '2 notes were imported before and were not imported again.')
+
+
+def test_do_not_import_notes_imported_before(
+    roam_json_file, anki_note_importer, anki_model_notes,
+):
+    roam_json_file.write_blocks('{cloze}')
+
+    first_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+    second_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert len(added_notes(anki_model_notes)) == 1
+    assert str(first_info) == '1 new notes imported.'
+    assert str(second_info) == (
+        '1 notes were imported before and were not imported again.')
+
+
+def test_update_notes_of_edited_blocks(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value['update_edited_notes'] = True
+    anki_model_notes.update_notes.side_effect = (
+        lambda updates: [note_id for note_id, _ in updates])
+
+    roam_json_file.write_json([page(
+        block('{first}', uid='a', edit_time=1),
+        block('{second}', uid='b', edit_time=1),
+    )])
+    first_report = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    roam_json_file.write_json([page(
+        block('{first} edited', uid='a', edit_time=2),
+        block('{second}', uid='b', edit_time=1),
+    )])
+    second_report = anki_note_importer.import_from_path(
+        str(roam_json_file.path))
+    third_report = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert [note.content for note in added_notes(anki_model_notes)] == [
+        '{{c1::first}}', '{{c1::second}}']
+    [(updates,), _] = anki_model_notes.update_notes.call_args
+    assert [(note_id, note.content) for note_id, note in updates] == [
+        (100, '{{c1::first}} edited')]
+    assert str(first_report) == '2 new notes imported.'
+    assert str(second_report) == (
+        '1 notes were updated from edited blocks, 1 blocks were not edited '
+        'since their notes were imported.')
+    assert second_report.num_skipped_blocks == 0
+    assert str(third_report) == (
+        '2 blocks were not edited since their notes were imported.')
+
+
+def test_tag_notes_of_blocks_without_clozes(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value.update(
+        update_edited_notes=True, orphaned_notes='tag')
+    anki_model_notes.update_notes.side_effect = (
+        lambda updates: [note_id for note_id, _ in updates])
+
+    roam_json_file.write_json([page(
+        block('{first}', uid='a', edit_time=1),
+        block('{second}', uid='b', edit_time=1),
+        block('{third}', uid='c', edit_time=1),
+    )])
+    anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    roam_json_file.write_json([page(
+        block('{first}', uid='a', edit_time=1),
+        block('no longer a cloze', uid='b', edit_time=2),
+    )])
+    report = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    anki_model_notes.tag_notes.assert_called_once_with([101, 102], 'roam_orphan')
+    assert report.num_orphaned_notes == 2
+    assert str(report) == (
+        '1 blocks were not edited since their notes were imported, 2 notes '
+        'were imported from blocks which were deleted or no longer contain '
+        'clozes and were tagged roam_orphan.')
+
+
+def test_orphaned_notes_of_graphs_which_were_not_read_are_left_alone(
+    tmp_path, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value.update(
+        update_edited_notes=True, orphaned_notes='suspend')
+    first_graph = JsonFile(tmp_path / 'first.json')
+    first_graph.write_json([page(
+        block('{first}', uid='a', edit_time=1),
+        block('{deleted}', uid='b', edit_time=1),
+    )])
+    second_graph = JsonFile(tmp_path / 'second.json')
+    second_graph.write_json([page(block('{second}', uid='c', edit_time=1))])
+    anki_note_importer.import_from_paths(
+        [str(first_graph.path), str(second_graph.path)])
+
+    first_graph.write_json([page(block('{first}', uid='a', edit_time=1))])
+    report = anki_note_importer.import_from_path(str(first_graph.path))
+    second_report = anki_note_importer.import_from_path(str(first_graph.path))
+
+    anki_model_notes.suspend_notes.assert_called_once_with([101])
+    assert report.num_orphaned_notes == 1
+    assert second_report.num_orphaned_notes == 0
+
+
+def test_orphaned_notes_deleted_in_anki_are_forgotten(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value['update_edited_notes'] = True
+    roam_json_file.write_json([page(block('{deleted}', uid='a', edit_time=1))])
+    anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    roam_json_file.write_json([page(block('no cloze', uid='a', edit_time=2))])
+    anki_model_notes.existing_note_ids.side_effect = lambda note_ids: []
+    report = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    anki_model_notes.existing_note_ids.side_effect = lambda note_ids: note_ids
+    second_report = anki_note_importer.import_from_path(
+        str(roam_json_file.path))
+
+    assert report.num_orphaned_notes == 0
+    assert second_report.num_orphaned_notes == 0
+
+
+def test_unknown_orphaned_notes_option(addon_data, anki_note_importer):
+    addon_data.read_config.return_value['orphaned_notes'] = 'delete'
+
+    with pytest.raises(ValueError):
+        anki_note_importer.start_import()
+
+
+def test_import_from_several_exports(
+    roam_json_file, tmp_path, anki_note_importer, anki_model_notes,
+):
+    roam_json_file.write_blocks('{shared} note', '{first} graph')
+    other_roam_json_file = JsonFile(tmp_path / 'other.json')
+    other_roam_json_file.write_blocks('{shared} note', '{second} graph')
+
+    report = anki_note_importer.import_from_paths([
+        str(roam_json_file.path), str(other_roam_json_file.path)])
+
+    assert [note.content for note in added_notes(anki_model_notes)] == [
+        '{{c1::shared}} note', '{{c1::first}} graph', '{{c1::second}} graph']
+    assert anki_model_notes.get_notes.call_count == 1
+    assert report.num_pages == 2
+    assert str(report) == (
+        '3 new notes imported, 1 notes were imported before and were not '
+        'imported again.')
+
+
+def test_migrate_added_notes_file(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    user_files_path = Path(addon_data.user_files_path())
+    added_notes_path = user_files_path / 'added_notes.json'
+    added_notes_path.write_text(json.dumps(['{{c1::old}} note']))
+    roam_json_file.write_blocks('{old} note')
+
+    info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert added_notes(anki_model_notes) == []
+    assert str(info) == '1 notes were imported before and were not imported again.'
+    assert not added_notes_path.exists()
+    assert (user_files_path / 'added_notes.json.migrated').exists()
+
+
+def test_cache_note_digests_only_reads_modified_notes(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+):
+    addon_data.read_config.return_value['cache_note_digests'] = True
+    anki_model_notes.content_key.return_value = 'model:0'
+    anki_model_notes.get_note_versions.return_value = [(1, 100), (2, 200)]
+    (when(anki_model_notes.get_notes_by_id)
+     .called_with([1, 2])
+     .then_return([(1, '{{c1::first}}'), (2, '{{c1::second}}')]))
+    roam_json_file.write_blocks('{first}', '{second}')
+
+    first_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    anki_model_notes.get_note_versions.return_value = [(1, 100), (2, 201)]
+    (when(anki_model_notes.get_notes_by_id)
+     .called_with([2])
+     .then_return([(2, '{{c1::edited}}')]))
+
+    second_info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert added_notes(anki_model_notes) == [AnkiNote(
+        content='{{c1::second}}',
+        source="Note from Roam page &#x27;title&#x27;.",
+    )]
+    anki_model_notes.get_notes_by_id.assert_called_with([2])
+    anki_model_notes.get_notes.assert_not_called()
+    assert str(first_info) == (
+        '2 notes were imported before and were not imported again.')
+    assert str(second_info) == (
+        '1 new notes imported, 1 notes were imported before and were not '
+        'imported again.')
+
+
+def test_import_reports_progress(
+    roam_json_file, anki_note_importer, anki_model_notes,
+):
+    roam_json_file.write_json([
+        page(block('{first}', block('child')), title='one'),
+        page(block('{second}'), title='two'),
+    ])
+    progress = ImportProgress()
+
+    info = anki_note_importer.import_from_path(
+        str(roam_json_file.path), progress)
+
+    assert progress.num_pages == 2
+    assert progress.num_blocks == 3
+    assert str(info) == '2 new notes imported.'
+
+
+def test_import_report_counts_and_stage_times(
+    roam_json_file, anki_note_importer, anki_model_notes,
+):
+    roam_json_file.write_json([
+        page(block('{first}', block('child')), title='one'),
+        page(block('{first}'), block('no cloze'), title='two'),
     ])
-    assert info == '1 new notes imported.'
+
+    report = anki_note_importer.import_from_path(str(roam_json_file.path))
+    report_json = report.to_json()
+
+    assert report.num_notes_added == 1
+    assert report.num_notes_ignored == 1
+    assert not report.cancelled
+    assert report.num_pages == 2
+    assert report.num_blocks == 4
+    assert report.num_skipped_blocks == 2
+    assert report.num_bytes_read == roam_json_file.path.stat().st_size
+    assert list(report_json['stages']) == [
+        'load', 'traverse', 'parse', 'format', 'normalize', 'dedupe',
+        'insert']
+    assert all(
+        stage_time['wall_seconds'] >= 0 and stage_time['cpu_seconds'] >= 0
+        for stage_time in report_json['stages'].values())
+    assert [counter['name'] for counter in report_json['pipeline']] == [
+        'load', 'parse and format', 'dedupe and insert']
+    assert report_json['insert_batches'] == {
+        'count': 1, 'max_seconds': 0.25, 'mean_seconds': 0.25}
+    assert json.loads(json.dumps(report_json)) == report_json
+
+
+def test_import_appends_to_run_log(
+    roam_json_file, addon_data, anki_note_importer,
+):
+    roam_json_file.write_blocks('{first}', 'no cloze')
+
+    anki_note_importer.import_from_path(str(roam_json_file.path))
+    anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    run_log = RunLog(str(Path(addon_data.user_files_path()) / 'run_log.jsonl'))
+    entries = list(run_log.entries())
+    assert [entry['notes_added'] for entry in entries] == [1, 0]
+    assert [entry['notes_ignored'] for entry in entries] == [0, 1]
+    assert all(entry['blocks'] == 2 for entry in entries)
+    assert summarize_runs(entries).num_runs == 2
+
+
+def test_cancel_import_between_batches(
+    roam_json_file, anki_note_importer, anki_model_notes,
+):
+    roam_json_file.write_json([
+        page(block('{first}'), title='one'),
+        page(block('{second}'), title='two'),
+    ])
+    progress = ImportProgress()
+
+    note_import = anki_note_importer.start_import()
+    try:
+        for anki_notes in note_import.note_batches(
+                [str(roam_json_file.path)], progress, batch_size=1):
+            note_import.add_notes(anki_notes)
+            progress.cancel()
+    finally:
+        report = note_import.finish()
+
+    assert [note.content for note in added_notes(anki_model_notes)] == [
+        '{{c1::first}}']
+    assert str(report) == 'Import cancelled, 1 new notes imported.'
+
+    info = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    assert str(info) == (
+        '1 new notes imported, 1 notes were imported before and were not '
+        'imported again.')
+
+
+def test_read_existing_notes_in_chunks(
+    roam_json_file, anki_note_importer, anki_model_notes,
+):
+    anki_model_notes.get_notes.return_value = [
+        f'{{{{c1::existing {index}}}}}' for index in range(2500)]
+    roam_json_file.write_blocks('{existing 2000}', '{new}')
+
+    note_import = anki_note_importer.start_import(read_existing_notes=False)
+    try:
+        anki_model_notes.get_notes.assert_not_called()
+        assert list(note_import.read_existing_notes()) == [1000, 2000, 2500]
+
+        for anki_notes in note_import.note_batches([str(roam_json_file.path)]):
+            note_import.add_notes(anki_notes)
+    finally:
+        report = note_import.finish()
+
+    assert [note.content for note in added_notes(anki_model_notes)] == [
+        '{{c1::new}}']
+    assert report.num_notes_ignored == 1
+
+
+def test_profile_import(
+    roam_json_file, addon_data, anki_note_importer, anki_model_notes,
+    monkeypatch,
+):
+    monkeypatch.delenv('ANKI_ROAM_IMPORT_PROFILE', raising=False)
+    addon_data.read_config.return_value['profile_import'] = 'cpu'
+    roam_json_file.write_blocks('{first}')
+
+    report = anki_note_importer.import_from_path(str(roam_json_file.path))
+
+    user_files_path = Path(addon_data.user_files_path())
+    assert len(list(user_files_path.glob('*.pstats'))) == 1
+    assert 'CPU profile saved to' in report.profile_summary
+    assert str(report) == '1 new notes imported.'
+
+
+def test_stop_tracing_memory_when_import_fails_to_start(
+    addon_data, anki_collection, anki_note_importer, monkeypatch,
+):
+    monkeypatch.delenv('ANKI_ROAM_IMPORT_PROFILE', raising=False)
+    addon_data.read_config.return_value.update(
+        profile_import='memory', model_name='missing model')
+    (when(anki_collection.get_model_notes)
+     .called_with('missing model', CONTENT_FIELD, SOURCE_FIELD, DECK_NAME)
+     .then_raise(KeyError('missing model')))
+
+    with pytest.raises(KeyError):
+        anki_note_importer.start_import()
+
+    assert not tracemalloc.is_tracing()
+
+
+def test_hashed_notes_with_bloom_filter_hash_each_lookup_once(monkeypatch):
+    digested = []
+
+    def counting_digest(content):
+        digested.append(content)
+        return content_digest(content)
+
+    monkeypatch.setattr(importer, 'content_digest', counting_digest)
+    monkeypatch.setattr(digests, 'content_digest', counting_digest)
+    normalized_notes = NormalizedNotes(DigestTable(), BloomFilter(100, 0.01))
+    normalized_notes.add_normalized('existing note')
+    digested.clear()
+
+    assert normalized_notes.contains_normalized('existing note')
+    assert not normalized_notes.contains_normalized('new note')
+    assert digested == ['existing note', 'new note']
+
+
+def test_note_adder_checks_ids_of_added_notes(anki_model_notes, tmp_path):
+    anki_model_notes.get_notes.return_value = []
+    anki_model_notes.add_notes.side_effect = None
+    anki_model_notes.add_notes.return_value = AddedNotes()
+    block_notes = BlockNotes(BlockNoteIndex(str(tmp_path / 'blocks.sqlite3')))
+    note_adder = AnkiNoteAdder(
+        anki_model_notes, NormalizedNotes(), block_notes=block_notes)
+
+    try:
+        note_adder.try_add(AnkiNote('{{c1::new}}', 'source', uid='a'))
+        with pytest.raises(RuntimeError):
+            note_adder.flush()
+    finally:
+        block_notes.close()
+
+
+def test_note_adder_adds_notes_in_batches(anki_model_notes, tmp_path):
+    anki_model_notes.get_notes.return_value = []
+    note_adder = AnkiNoteAdder(
+        anki_model_notes, NormalizedNotes(), batch_size=2)
+    anki_notes = [AnkiNote(f'content {index}', 'source') for index in range(3)]
+
+    for anki_note in anki_notes:
+        assert note_adder.try_add(anki_note)
+    assert not note_adder.try_add(anki_notes[0])
+
+    assert added_notes(anki_model_notes) == anki_notes[:2]
+
+    added_notes_store = AddedNotesStore(str(tmp_path / 'added.sqlite3'))
+    try:
+        note_adder.write(added_notes_store)
+        assert len(added_notes_store) == 3
+        assert all(
+            added_notes_store.contains_digest(
+                normalized_digest(anki_note.content))
+            for anki_note in anki_notes)
+    finally:
+        added_notes_store.close()
+
+    assert added_notes(anki_model_notes) == anki_notes
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from anki_roam_import import __main__ as cli
+from anki_roam_import.anki import AddedNotes, AnkiCollection, AnkiModelNotes
+
+from tests.test_roam import block, page
+from tests.util import mock
+
+
+@pytest.fixture
+def anki_model_notes(monkeypatch) -> AnkiModelNotes:
+    model_notes = mock(AnkiModelNotes)
+    model_notes.get_notes.return_value = []
+    model_notes.add_notes.return_value = AddedNotes([100])
+
+    collection = mock(AnkiCollection)
+    collection.get_model_notes.return_value = model_notes
+
+    monkeypatch.setattr(cli, 'is_anki_package_installed', lambda: True)
+    monkeypatch.setattr(cli, 'open_collection', lambda path: mock(Closeable))
+    monkeypatch.setattr(cli, 'AnkiCollection', lambda collection_: collection)
+
+    return model_notes
+
+
+class Closeable:
+    def close(self) -> None:
+        pass
+
+
+def test_import_prints_json_report(anki_model_notes, tmp_path, capsys):
+    roam_path = tmp_path / 'roam.json'
+    roam_path.write_text(json.dumps([page(block('{cloze}'))]))
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps({'deck_name': 'Roam'}))
+    report_path = tmp_path / 'report.json'
+
+    exit_code = cli.main([
+        str(tmp_path / 'collection.anki2'),
+        str(roam_path),
+        '--config', str(config_path),
+        '--report', str(report_path),
+    ])
+
+    report = json.loads(capsys.readouterr().out)
+    assert exit_code == 0
+    assert report['info'] == '1 new notes imported.'
+    assert report['notes_added'] == 1
+    assert json.loads(report_path.read_text()) == report
+    assert (tmp_path / 'anki_roam_import' / 'added_notes.sqlite3').exists()
+
+
+def test_import_needs_anki_package(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, 'is_anki_package_installed', lambda: False)
+
+    with pytest.raises(SystemExit):
+        cli.main([str(tmp_path / 'collection.anki2'), 'roam.json'])
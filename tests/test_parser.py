@@ -2,7 +2,8 @@ import pytest
 
 from anki_roam_import.parser import (
     ParseError, ParsedValue, Parser, ParserGenerator, any_character, choose,
-    exact_string, full_parser, parser_generator, zero_or_more,
+    delimited_text, exact_string, followed_by, full_parser, join_strings,
+    parser_generator, text_without, zero_or_more,
 )
 
 from tests.util import mock, when
@@ -230,3 +231,49 @@ def test_return_first_matching_choice():
 
 def error_parser(string: str, index: int) -> ParsedValue[str]:
     raise ParseError
+
+
+def test_delimited_text():
+    parser = delimited_text('$$', '$$')
+
+    assert parser('a $$b$$ $$c$$', 2) == ParsedValue('b', 5)
+    assert parser('$$$$', 0) == ParsedValue('', 4)
+
+    with pytest.raises(ParseError):
+        parser('$$$', 0)
+
+    with pytest.raises(ParseError):
+        parser('a $$b', 2)
+
+
+def test_delimited_text_fails_after_last_close_delimiter():
+    parser = delimited_text('{{', '}}')
+    string = '{{a}} {{b'
+
+    assert parser(string, 0) == ParsedValue('a', 5)
+
+    with pytest.raises(ParseError):
+        parser(string, 6)
+
+
+def test_text_without():
+    parser = text_without('{}')
+
+    assert parser('ab{c}', 0) == ParsedValue('ab', 2)
+
+    with pytest.raises(ParseError):
+        parser('ab{c}', 2)
+
+
+def test_followed_by():
+    parser = followed_by('}')
+
+    assert parser('{a}', 1) == ParsedValue(None, 0)
+
+    with pytest.raises(ParseError):
+        parser('{a} {b', 4)
+
+
+def test_join_strings():
+    assert join_strings(['a', 'b', 1, 'c', '', 2]) == ['ab', 1, 'c', 2]
+    assert join_strings([]) == []
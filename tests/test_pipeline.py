@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from anki_roam_import.pipeline import Pipeline, Stage
+
+
+def double(items):
+    for item in items:
+        yield item * 2
+
+
+def pairs(items):
+    pair = []
+    for item in items:
+        pair.append(item)
+        if len(pair) == 2:
+            yield pair
+            pair = []
+    if pair:
+        yield pair
+
+
+def test_items_pass_through_stages_in_order():
+    pipeline = Pipeline(
+        range(5), [Stage('double', double), Stage('pairs', pairs)])
+
+    with pipeline:
+        assert list(pipeline) == [[0, 2], [4, 6], [8]]
+
+    assert pipeline.done
+    assert [counter.name for counter in pipeline.counters] == [
+        'double', 'pairs']
+    assert [counter.num_items for counter in pipeline.counters] == [5, 3]
+
+
+def test_poll_returns_ready_items_without_waiting():
+    pipeline = Pipeline(range(3), [Stage('double', double)])
+    items = []
+
+    with pipeline:
+        while not pipeline.done:
+            items.extend(pipeline.poll())
+
+    assert items == [0, 2, 4]
+
+
+def test_error_in_stage_is_raised_by_reader():
+    def fail(items):
+        for item in items:
+            raise ValueError(item)
+        yield
+
+    pipeline = Pipeline(
+        range(3), [Stage('fail', fail), Stage('double', double)])
+
+    with pipeline, pytest.raises(ValueError):
+        list(pipeline)
+
+
+def test_bounded_queues_hold_back_earlier_stages():
+    items_read = []
+
+    def read(items):
+        for item in items:
+            items_read.append(item)
+            yield item
+
+    pipeline = Pipeline(range(100), [Stage('read', read)], queue_size=2)
+
+    with pipeline:
+        iterator = iter(pipeline)
+        assert next(iterator) == 0
+        time.sleep(0.5)
+        # one item has been read, two are queued and one is waiting to be put
+        assert len(items_read) <= 4
+
+    assert pipeline.stopped.is_set()
+
+
+def test_pipeline_without_threads_runs_stages_on_reading_thread():
+    thread_names = set()
+
+    def record_thread(items):
+        for item in items:
+            thread_names.add(threading.current_thread().name)
+            yield item
+
+    pipeline = Pipeline(
+        range(5),
+        [Stage('record', record_thread), Stage('pairs', pairs)],
+        threaded=False,
+    )
+    batches = []
+
+    with pipeline:
+        while not pipeline.done:
+            batches.extend(pipeline.poll())
+
+    assert batches == [[0, 1], [2, 3], [4]]
+    assert thread_names == {threading.current_thread().name}
+    assert [counter.num_items for counter in pipeline.counters] == [5, 3]
@@ -0,0 +1,53 @@
+import pstats
+
+import pytest
+
+from anki_roam_import.profiling import (
+    PROFILE_ENVIRONMENT_VARIABLE, make_import_profiler,
+)
+
+
+def work():
+    return sum(index * index for index in range(1000))
+
+
+def test_no_profiler_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv(PROFILE_ENVIRONMENT_VARIABLE, raising=False)
+
+    assert make_import_profiler({}, str(tmp_path)) is None
+
+
+def test_environment_variable_overrides_config(tmp_path, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENVIRONMENT_VARIABLE, 'memory')
+
+    profiler = make_import_profiler({'profile_import': 'cpu'}, str(tmp_path))
+
+    assert not profiler.profile_cpu
+    assert profiler.trace_memory
+
+
+def test_unknown_profile_mode(tmp_path, monkeypatch):
+    monkeypatch.delenv(PROFILE_ENVIRONMENT_VARIABLE, raising=False)
+
+    with pytest.raises(ValueError):
+        make_import_profiler({'profile_import': 'fast'}, str(tmp_path))
+
+
+def test_profile_writes_stats_and_allocations(tmp_path, monkeypatch):
+    monkeypatch.delenv(PROFILE_ENVIRONMENT_VARIABLE, raising=False)
+    profiler = make_import_profiler({'profile_import': 'all'}, str(tmp_path))
+
+    profiler.start()
+    with profiler.profiling():
+        with profiler.profiling():
+            work()
+    summary = profiler.stop()
+
+    [stats_path] = tmp_path.glob('*.pstats')
+    [allocations_path] = tmp_path.glob('*-allocations.txt')
+    assert str(stats_path) in summary
+    assert str(allocations_path) in summary
+    assert 'work (test_profiling.py' in summary
+    assert len(summary.splitlines()) <= 2 + 10 + 1
+    assert pstats.Stats(str(stats_path)).total_calls > 0
+    assert allocations_path.read_text().startswith('Traced memory:')
@@ -1,10 +1,12 @@
-from typing import Callable, List
+from typing import Callable, List, Tuple
+from zipfile import ZipFile
 
 import pytest
 
 from anki_roam_import.model import Cloze, JsonData, RoamBlock, RoamPart
 from anki_roam_import.roam import (
-    BlockExtractor, RoamBlockBuilder, SourceBuilder,
+    BlockExtractor, RoamBlockBuilder, SourceBuilder, make_block_extractor,
+    make_block_filter, make_deck_router, roam_graph_name,
 )
 from tests.util import mock, when
 
@@ -118,14 +120,199 @@ def test_return_note_when_cloze_part(
     assert roam_note == RoamBlock(note_parts, 'source')
 
 
+def resolved_parts(*roam_pages: JsonData) -> List[List[RoamPart]]:
+    extract_roam_blocks = make_block_extractor(resolve_block_references=True)
+    return [
+        roam_block.parts for roam_block in extract_roam_blocks(roam_pages)]
+
+
+def test_resolve_block_reference_in_cloze():
+    assert resolved_parts(page(
+        block('referenced text', uid='ref'),
+        block('{cloze ((ref))} and ((ref))', uid='note'),
+    )) == [[Cloze(['cloze referenced text']), ' and referenced text']]
+
+
+def test_resolve_block_reference_to_later_page():
+    assert resolved_parts(
+        page(block('{cloze} ((ref))', uid='note'), title='first'),
+        page(block('{other}', uid='other'), title='second'),
+        page(block('referenced ((nested))', uid='ref'), title='third'),
+        page(block('nested text', uid='nested'), title='fourth'),
+    ) == [
+        [Cloze(['other'])],
+        [Cloze(['cloze']), ' referenced nested text'],
+    ]
+
+
+def test_leave_cyclic_and_missing_block_references():
+    assert resolved_parts(page(
+        block('a ((b))', uid='a'),
+        block('b ((a))', uid='b'),
+        block('{cloze} ((a)) ((self)) ((missing))', uid='self'),
+    )) == [[Cloze(['cloze']), ' a b ((a)) ((self)) ((missing))']]
+
+
+def test_limit_depth_of_block_references():
+    blocks = [
+        block(f'{index} (({index + 1}))', uid=str(index))
+        for index in range(10)
+    ]
+
+    assert resolved_parts(page(*blocks, block('{cloze} ((0))'))) == [
+        [Cloze(['cloze']), ' 0 1 2 3 4 ((5))']]
+
+
+def filtered_parts(
+    roam_pages: List[JsonData], **config: List[str],
+) -> List[List[RoamPart]]:
+    extract_roam_blocks = make_block_extractor(
+        block_filter=make_block_filter(config))
+    return [
+        roam_block.parts for roam_block in extract_roam_blocks(roam_pages)]
+
+
+def test_filter_pages_by_title():
+    roam_pages = [
+        page(block('{biology}'), title='Biology/Cells'),
+        page(block('{private}'), title='Biology/Private'),
+        page(block('{history}'), title='History'),
+    ]
+
+    assert filtered_parts(
+        roam_pages, include_pages=['Biology/.*'],
+        exclude_pages=['.*Private'],
+    ) == [[Cloze(['biology'])]]
+
+
+def test_include_subtrees_by_tag():
+    roam_pages = [
+        page(
+            block('{untagged}'),
+            block('#anki', block('{tagged}', block('{nested}'))),
+            block('{tagged} with #[[anki]]'),
+            block('{longer} #anki-other'),
+        ),
+        page(block('{tag page}'), title='anki'),
+    ]
+
+    assert filtered_parts(roam_pages, include_tags=['anki']) == [
+        [Cloze(['tagged'])],
+        [Cloze(['nested'])],
+        [Cloze(['tagged']), ' with #[[anki]]'],
+        [Cloze(['tag page'])],
+    ]
+
+
+def test_exclude_subtrees_by_page_reference():
+    roam_pages = [page(
+        block('[[private]] notes', block('{private}')),
+        block('{public}'),
+    )]
+    note_extractor = make_block_extractor(
+        block_filter=make_block_filter({'exclude_tags': ['private']}))
+
+    parts = [roam_block.parts for roam_block in note_extractor(roam_pages)]
+
+    assert parts == [[Cloze(['public'])]]
+    assert note_extractor.num_blocks == 1
+
+
+def test_exclude_tags_only_at_start_of_word():
+    roam_pages = [page(
+        block('{link} to https://example.com/#private'),
+        block('{aside} (#private)'),
+    )]
+
+    assert filtered_parts(roam_pages, exclude_tags=['private']) == [
+        [Cloze(['link']), ' to https://example.com/#private'],
+    ]
+
+
+def test_no_block_filter_without_filter_options():
+    assert make_block_filter({'include_pages': [], 'exclude_tags': None}) is None
+
+
+def extracted_tags(*roam_pages: JsonData) -> List[Tuple[str, ...]]:
+    extract_roam_blocks = make_block_extractor(import_tags=True)
+    return [roam_block.tags for roam_block in extract_roam_blocks(roam_pages)]
+
+
+def test_tags_from_references_and_attributes():
+    assert extracted_tags(page(
+        block('tags:: [[page tag]], #hashtag, plain, other text'),
+        block(
+            'parent #[[parent tag]]',
+            block('{cloze} about [[topic]] #hashtag', block('Tags:: child')),
+        ),
+    )) == [
+        ('page_tag', 'hashtag', 'plain', 'other_text', 'parent_tag', 'topic',
+         'child'),
+    ]
+
+
+def test_hashes_inside_words_are_not_tags():
+    assert extracted_tags(page(
+        block('see https://x.com/#frag and {cloze} in issue#12 (#tag)'),
+    )) == [('tag',)]
+
+
+def test_blocks_share_tags_of_parents():
+    [first_tags, second_tags, other_tags] = extracted_tags(page(
+        block('#[[shared tag]]', block('{first}'), block('{second}')),
+        block('{other}'),
+    ))
+
+    assert first_tags == ('shared_tag',)
+    assert first_tags is second_tags
+    assert other_tags == ()
+
+
+def test_route_pages_to_decks():
+    extract_roam_blocks = make_block_extractor(deck_router=make_deck_router({
+        'page_decks': [['Daily/.*', 'Journal'], ['(.*) notes', r'Notes::\1']],
+        'namespace_decks': True,
+    }))
+    roam_pages = [
+        page(block('{a}'), block('{b}'), title='Biology/ Cells/Mitosis'),
+        page(block('{c}'), title='Daily/2020'),
+        page(block('{d}'), title='Reading notes'),
+        page(block('{e}'), title='Plain'),
+    ]
+
+    assert [
+        roam_block.deck_name for roam_block in extract_roam_blocks(roam_pages)
+    ] == [
+        'Biology::Cells::Mitosis', 'Biology::Cells::Mitosis', 'Journal',
+        'Notes::Reading', None,
+    ]
+
+
+def test_no_deck_router_without_deck_options():
+    assert make_deck_router({'page_decks': [], 'namespace_decks': False}) is None
+
+
+def test_graph_name_is_name_of_json_file(tmp_path):
+    zip_path = tmp_path / 'Roam-Export-1612345678.zip'
+    with ZipFile(zip_path, mode='w') as zip_file:
+        zip_file.writestr('my graph.json', '[]')
+
+    assert roam_graph_name(str(zip_path)) == 'my graph'
+    assert roam_graph_name(str(tmp_path / 'other.json')) == 'other'
+
+
 def block(
     string: str,
     *children: JsonData,
     create_time: int = None,
     edit_time: int = None,
+    uid: str = None,
 ) -> JsonData:
     block_json = {'string': string}
 
+    if uid is not None:
+        block_json['uid'] = uid
+
     if children:
         block_json['children'] = list(children)
 
@@ -0,0 +1,65 @@
+import json
+
+from anki_roam_import.run_log import RunLog, summarize_runs
+
+
+def run(
+    wall_seconds, blocks=100, load_seconds=0.0, process_peak_rss_bytes=None,
+):
+    return {
+        'wall_seconds': wall_seconds,
+        'blocks': blocks,
+        'process_peak_rss_bytes': process_peak_rss_bytes,
+        'stages': {'load': {'wall_seconds': load_seconds, 'cpu_seconds': 0.0}},
+    }
+
+
+def test_append_and_read_entries(tmp_path):
+    run_log = RunLog(str(tmp_path / 'run_log.jsonl'))
+
+    run_log.append(run(1.0))
+    run_log.append(run(2.0))
+
+    assert list(run_log.entries()) == [run(1.0), run(2.0)]
+
+
+def test_rotate_keeps_recent_backups(tmp_path):
+    path = tmp_path / 'run_log.jsonl'
+    line_size = len(json.dumps(run(1.0), sort_keys=True)) + 1
+    run_log = RunLog(str(path), max_bytes=line_size * 2, num_backups=2)
+
+    for wall_seconds in range(7):
+        run_log.append(run(float(wall_seconds)))
+
+    assert [entry['wall_seconds'] for entry in run_log.entries()] == [
+        2.0, 3.0, 4.0, 5.0, 6.0]
+    assert not (tmp_path / 'run_log.jsonl.3').exists()
+
+
+def test_skip_unreadable_lines(tmp_path):
+    path = tmp_path / 'run_log.jsonl'
+    path.write_text('{"wall_seconds": 1.0}\n{"wall_sec\n[]\n')
+
+    assert list(RunLog(str(path)).entries()) == [{'wall_seconds': 1.0}]
+
+
+def test_summarize_runs():
+    summary = summarize_runs([
+        run(1.0, load_seconds=0.5, process_peak_rss_bytes=100),
+        run(2.0, load_seconds=1.0),
+        run(4.0, blocks=200, load_seconds=3.0, process_peak_rss_bytes=300),
+    ])
+
+    assert summary.num_runs == 3
+    assert summary.median_seconds == 2.0
+    assert summary.latest_seconds == 4.0
+    assert summary.latest_slowdown == 2.0
+    assert summary.median_blocks_per_second == 50.0
+    assert summary.latest_blocks_per_second == 50.0
+    assert summary.median_stage_seconds == {'load': 1.0}
+    assert summary.latest_stage_seconds == {'load': 3.0}
+    assert summary.max_process_peak_rss_bytes == 300
+
+
+def test_summarize_no_runs():
+    assert summarize_runs([]) is None
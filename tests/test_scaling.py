@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.scaling import MAX_EXPONENT, SCALING_CASES, measure_exponent
+
+# smaller sizes than the benchmark keep the test quick, at the cost of
+# noisier timings, so a stage only fails if none of its measurements pass
+TEST_SCALE = 0.25
+NUM_ATTEMPTS = 3
+
+
+@pytest.mark.parametrize(
+    'case', SCALING_CASES, ids=[case.name for case in SCALING_CASES])
+def test_stage_scales_linearly(case):
+    exponent = measure_exponent(case, scale=TEST_SCALE)
+    for _ in range(NUM_ATTEMPTS - 1):
+        if exponent <= MAX_EXPONENT:
+            break
+        exponent = min(exponent, measure_exponent(case, scale=TEST_SCALE))
+
+    assert exponent <= MAX_EXPONENT
@@ -2,6 +2,7 @@ import datetime as dt
 
 import pytest
 
+from anki_roam_import.model import SharedSource
 from anki_roam_import.roam import (
     SourceBuilder, SourceExtractor, SourceFinder,
     SourceFormatter, TimeFormatter,
@@ -107,6 +108,21 @@ def test_find_source_prefers_nearer_parent_with_source(source_finder):
     assert source == 'grandparent with source'
 
 
+def test_find_source_in_parents_of_consecutive_blocks(source_finder):
+    first = block('first')
+    second = block('second')
+    parent_with_source = block('parent with source', first)
+    parent = block('parent', second)
+    grandparent = block('grandparent', parent_with_source, parent)
+
+    assert source_finder(first, [grandparent, parent_with_source]) == (
+        'parent with source')
+    assert source_finder(second, [grandparent, parent]) is None
+    assert source_finder(parent, [grandparent]) is None
+    assert source_finder(first, [grandparent, parent_with_source]) == (
+        'parent with source')
+
+
 @pytest.fixture
 def source_extractor() -> SourceExtractor:
     return SourceExtractor()
@@ -168,6 +184,66 @@ def test_format_source(source_formatter, mock_time_formatter):
     assert formatted_source == "[source]\nNote from Roam page 'title', created at [create time], edited at [edit time]."
 
 
+def test_format_compact_source(mock_time_formatter):
+    source_formatter = SourceFormatter(mock_time_formatter, compact=True)
+    page_json = page(title='title')
+    (when(mock_time_formatter)
+     .called_with(1337)
+     .then_return('[create time]'))
+
+    first_source = source_formatter(
+        block('first', create_time=1337), '[source]', page_json)
+    second_source = source_formatter(block('second'), '[source]', page_json)
+
+    assert first_source == SharedSource(
+        "[source]\nNote from Roam page 'title'", ', created at [create time].')
+    assert second_source == SharedSource(
+        "[source]\nNote from Roam page 'title'", '.')
+    assert first_source.shared is second_source.shared
+
+
 def test_time_formatter():
     time_formatter = TimeFormatter(dt.timezone.utc)
     assert time_formatter(1543212345678) == '2018-11-26T06:05:45.678+00:00'
+
+
+def test_time_formatter_with_offset_time_zone():
+    time_zone = dt.timezone(dt.timedelta(hours=-3, minutes=-30))
+    time_formatter = TimeFormatter(time_zone)
+    assert time_formatter(1543212345678) == '2018-11-26T02:35:45.678-03:30'
+
+
+def test_time_formatter_before_epoch():
+    time_formatter = TimeFormatter(dt.timezone.utc)
+    assert time_formatter(-1) == '1969-12-31T23:59:59.999+00:00'
+
+
+def test_time_formatter_formats_timestamps():
+    time_formatter = TimeFormatter(dt.timezone.utc)
+    timestamps = [1543212345678, 0, 1543212345678]
+
+    assert time_formatter.format_timestamps(timestamps) == [
+        '2018-11-26T06:05:45.678+00:00',
+        '1970-01-01T00:00:00.000+00:00',
+        '2018-11-26T06:05:45.678+00:00',
+    ]
+
+
+@pytest.mark.parametrize('time_zone_name', [
+    'America/New_York', 'Australia/Lord_Howe', 'Asia/Kathmandu',
+])
+def test_time_formatter_matches_datetime_across_transitions(time_zone_name):
+    zoneinfo = pytest.importorskip('zoneinfo')
+    try:
+        time_zone = zoneinfo.ZoneInfo(time_zone_name)
+    except zoneinfo.ZoneInfoNotFoundError:
+        pytest.skip(f'time zone {time_zone_name} not available')
+
+    time_formatter = TimeFormatter(time_zone, cache_size=16)
+    start_millis = 1585400000000
+    step_millis = 1234567
+
+    for index in range(20000):
+        timestamp_millis = start_millis + index * step_millis
+        expected = time_formatter.format_with_datetime(timestamp_millis)
+        assert time_formatter(timestamp_millis) == expected
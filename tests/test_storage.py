@@ -0,0 +1,114 @@
+import pytest
+
+from anki_roam_import.storage import (
+    AddedNotesStore, BlockNoteIndex, NoteDigestCache,
+)
+
+
+@pytest.fixture
+def added_notes_store(tmp_path) -> AddedNotesStore:
+    store = AddedNotesStore(str(tmp_path / 'added_notes.sqlite3'))
+    yield store
+    store.close()
+
+
+def test_empty_store(added_notes_store):
+    assert len(added_notes_store) == 0
+    assert added_notes_store.position() == 0
+    assert not added_notes_store.contains_digest(b'digest')
+
+
+def test_store_contains_added_digests(added_notes_store):
+    added_notes_store.add([('content', b'digest')])
+
+    assert added_notes_store.contains_digest(b'digest')
+    assert not added_notes_store.contains_digest(b'other digest')
+    assert len(added_notes_store) == 1
+
+
+def test_store_ignores_duplicate_digests(added_notes_store):
+    added_notes_store.add([('content', b'digest')])
+    added_notes_store.add([('same content', b'digest')])
+
+    assert len(added_notes_store) == 1
+
+
+def test_store_lists_digests_added_after_position(added_notes_store):
+    added_notes_store.add([('first', b'first digest')])
+    position = added_notes_store.position()
+    added_notes_store.add([('second', b'second digest')])
+
+    assert list(added_notes_store.digests_after(position)) == [
+        b'second digest']
+    assert list(added_notes_store.digests_after(0)) == [
+        b'first digest', b'second digest']
+
+
+def test_store_persists_added_notes(tmp_path):
+    path = str(tmp_path / 'added_notes.sqlite3')
+    store = AddedNotesStore(path)
+    store.add([('content', b'digest')])
+    store.close()
+
+    reopened_store = AddedNotesStore(path)
+    try:
+        assert reopened_store.contains_digest(b'digest')
+    finally:
+        reopened_store.close()
+
+
+@pytest.fixture
+def note_digest_cache_path(tmp_path) -> str:
+    return str(tmp_path / 'note_digests.sqlite3')
+
+
+def test_note_digest_cache_updates_and_deletes_entries(note_digest_cache_path):
+    cache = NoteDigestCache(note_digest_cache_path, 'key')
+    try:
+        cache.update([(2, 20, b'two'), (1, 10, b'one')], [])
+        cache.update([(1, 11, b'new one')], [2])
+
+        assert list(cache.entries()) == [(1, 11, b'new one')]
+    finally:
+        cache.close()
+
+
+def test_note_digest_cache_persists_entries(note_digest_cache_path):
+    cache = NoteDigestCache(note_digest_cache_path, 'key')
+    cache.update([(1, 10, b'one')], [])
+    cache.close()
+
+    reopened_cache = NoteDigestCache(note_digest_cache_path, 'key')
+    try:
+        assert list(reopened_cache.entries()) == [(1, 10, b'one')]
+    finally:
+        reopened_cache.close()
+
+
+def test_note_digest_cache_clears_entries_when_key_changes(
+    note_digest_cache_path,
+):
+    cache = NoteDigestCache(note_digest_cache_path, 'key')
+    cache.update([(1, 10, b'one')], [])
+    cache.close()
+
+    reopened_cache = NoteDigestCache(note_digest_cache_path, 'other key')
+    try:
+        assert list(reopened_cache.entries()) == []
+    finally:
+        reopened_cache.close()
+
+
+def test_block_note_index_persists_updates_and_deletes(tmp_path):
+    path = str(tmp_path / 'block_notes.sqlite3')
+    index = BlockNoteIndex(path)
+    index.update([('a', 1, 10, 'graph'), ('b', 2, None, 'graph')], [])
+    index.update([('a', 1, 11, 'graph')], ['b'])
+    index.close()
+
+    reopened_index = BlockNoteIndex(path)
+    try:
+        assert list(reopened_index.entries()) == [('a', 1, 11, 'graph')]
+    finally:
+        reopened_index.close()
+